@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+
+# Time each phase of the transpiler on synthetic programs (see `generate.py`), and save the result as JSON
+# so regressions can be tracked:
+#     python benchmarks/bench.py --providers 100 1000 10000 -o bench.json
+
+import os
+import sys
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from irpc.ASTprocessing import CommWorld
+from pycparser import c_parser, c_generator
+from pycparser.c_ast import FuncDef
+from time import perf_counter
+from generate import generate
+import datetime
+import platform
+import pycparser
+import json
+
+PHASES = ['parse', 'd_index', 'insert_provider_calls', 'hoist_declarations', 'insert_touches_stuff', 'codegen']
+
+def run(text, parser):
+    timings = {}
+
+    start = perf_counter()
+    ast = parser.parse(text)
+    timings['parse'] = perf_counter() - start
+
+    world = CommWorld({f for f in ast.ext if isinstance(f, FuncDef)})
+    world.insert_provider_calls()
+    world.hoist_declarations(ast.ext)
+    world.insert_touches_stuff(ast.ext)
+    timings.update(world.timings)
+
+    start = perf_counter()
+    output = c_generator.CGenerator().visit(ast)
+    timings['codegen'] = perf_counter() - start
+
+    return timings, len(output)
+
+def bench(l_provider, repeat=3, **workload):
+    parser = c_parser.CParser()
+    l_result = []
+    for n_provider in l_provider:
+        # Like `remove_headers`, pycparser doesn't handle the directives
+        text = ''.join(line for line in generate(n_provider, **workload).splitlines(True)
+                       if not line.startswith('#include'))
+        # The best of `repeat` runs, phase by phase
+        best = {}
+        for _ in range(repeat):
+            timings, output_size = run(text, parser)
+            for phase, t in timings.items():
+                best[phase] = min(t, best.get(phase, t))
+        best['total'] = sum(best[phase] for phase in PHASES if phase in best)
+        l_result.append({'providers': n_provider,
+                         'input_bytes': len(text),
+                         'output_bytes': output_size,
+                         'seconds': best})
+        print(f'{n_provider:>8} providers: ' + ' '.join(f'{p} {best.get(p, 0.):.3f}' for p in PHASES + ['total']),
+              file=sys.stderr)
+    return l_result
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Benchmark the phases of irpc on synthetic programs')
+    parser.add_argument('--providers', type=int, nargs='+', default=[10, 100, 1000])
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--fan-in', type=int, default=2)
+    parser.add_argument('--fan-out', type=int, default=8)
+    parser.add_argument('--depth', type=int, default=8)
+    parser.add_argument('--loops', type=float, default=0.2)
+    parser.add_argument('--branches', type=float, default=0.2)
+    parser.add_argument('--touches', type=int, default=1)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('-o', '--output', help='JSON file (default: stdout)')
+    args = parser.parse_args()
+
+    workload = dict(fan_in=args.fan_in, fan_out=args.fan_out, depth=args.depth, loops=args.loops,
+                    branches=args.branches, n_touch=args.touches, seed=args.seed)
+    # Deep ASTs recurse a lot in pycparser and in the analysis
+    sys.setrecursionlimit(100000)
+    report = {'date': datetime.datetime.now().isoformat(timespec='seconds'),
+              'python': platform.python_version(),
+              'pycparser': pycparser.__version__,
+              'workload': workload,
+              'results': bench(args.providers, args.repeat, **workload)}
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
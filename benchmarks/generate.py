@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+
+# Synthetic .irp.c programs, to size the transpiler.
+#
+# The entities are organized in `depth` layers. Each provider uses `fan_in` entities of the previous layers
+# (an entity is used by at most `fan_out` providers, when possible).
+# Some providers have a loop or nested if/else, and main loops over touches of the first layer
+# while reading the last one.
+
+import random
+
+def generate(n_provider, fan_in=2, fan_out=8, depth=8, loops=0.2, branches=0.2, nesting=2,
+             n_touch=1, iterations=3, seed=0):
+    rng = random.Random(seed)
+
+    depth = max(1, min(depth, n_provider))
+    l_layer = [[] for _ in range(depth)]
+    for i in range(n_provider):
+        l_layer[i * depth // n_provider].append(f'e{i}')
+
+    d_children = {}
+    l_line = ['#include <stdio.h>', '']
+
+    def body_expr(l_parent, i):
+        return ' + '.join(l_parent + [f'{i}.0']) if l_parent else f'{i}.0'
+
+    def branch(l_parent, entity, i, level, indent):
+        if level == 0 or not l_parent:
+            return [f'{indent}{entity} = {body_expr(l_parent, i)};']
+        head, tail = l_parent[:1], l_parent[1:]
+        return ([f'{indent}if ({head[0]} > {level}.0) {{']
+                + branch(tail, entity, i, level - 1, indent + '    ')
+                + [f'{indent}}} else {{']
+                + [f'{indent}    {entity} = {body_expr(head, -i)};']
+                + [f'{indent}}}'])
+
+    i_entity = 0
+    for layer, l_entity in enumerate(l_layer):
+        l_candidate = [e for l in l_layer[:layer] for e in l]
+        for entity in l_entity:
+            l_free = [e for e in l_candidate if d_children.get(e, 0) < fan_out] or l_candidate
+            l_parent = sorted(rng.sample(l_free, min(fan_in, len(l_free))), key=lambda e: int(e[1:]))
+            for e in l_parent:
+                d_children[e] = d_children.get(e, 0) + 1
+
+            l_line += [f'void provide_{entity}(){{', f'    double {entity};']
+            r = rng.random()
+            if l_parent and r < loops:
+                l_line += [f'    {entity} = 0.0;',
+                           f'    for (int i = 0; i < 4; i++) {{',
+                           f'        {entity} = {entity} + {body_expr(l_parent, i_entity)};',
+                           f'    }}']
+            elif l_parent and r < loops + branches:
+                l_line += branch(l_parent, entity, i_entity, nesting, '    ')
+            else:
+                l_line.append(f'    {entity} = {body_expr(l_parent, i_entity)};')
+            l_line += ['}', '']
+            i_entity += 1
+
+    l_touched = l_layer[0][:n_touch]
+    l_read = l_layer[-1]
+    l_line += ['int main(){',
+               '    double s = 0.0;',
+               f'    for (int it = 0; it < {iterations}; it++) {{']
+    for entity in l_read:
+        l_line.append(f'        s = s + {entity};')
+    for entity in l_touched:
+        l_line += [f'        {entity} = {entity} + 1.0;',
+                   f'        touch_{entity}();']
+    l_line += ['    }',
+               '    printf("%f\\n", s);',
+               '    return 0;',
+               '}']
+    return '\n'.join(l_line) + '\n'
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Generate a synthetic .irp.c program')
+    parser.add_argument('providers', type=int)
+    parser.add_argument('--fan-in', type=int, default=2, help='entities used by each provider (default: 2)')
+    parser.add_argument('--fan-out', type=int, default=8, help='providers using a same entity, when possible (default: 8)')
+    parser.add_argument('--depth', type=int, default=8, help='number of layers of entities (default: 8)')
+    parser.add_argument('--loops', type=float, default=0.2, help='fraction of providers with a loop (default: 0.2)')
+    parser.add_argument('--branches', type=float, default=0.2, help='fraction of providers with if/else (default: 0.2)')
+    parser.add_argument('--nesting', type=int, default=2, help='depth of the nested if/else (default: 2)')
+    parser.add_argument('--touches', type=int, default=1, help='entities touched in the main loop (default: 1)')
+    parser.add_argument('--iterations', type=int, default=3, help='iterations of the main loop (default: 3)')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    print(generate(args.providers, args.fan_in, args.fan_out, args.depth, args.loops, args.branches,
+                   args.nesting, args.touches, args.iterations, args.seed), end='')
@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+
+# Stress what `irpc.py` runs on one main, deep or wide, using entities provided by small providers:
+#     - nesting: `while` loops and `if` nested `depth` times, a touch in the innermost one
+#     - expression: one assignment of a sum of `depth` entities (a left-deep chain of BinaryOp)
+#     - width: `depth` statements in the same compound
+# Timed: `entity_index` of main (the walk of `CommWorld.d_index`), and the whole generation of the file
+# (`irpc.pipeline.generate_file`, the transformations and the output), the parsing excluded.
+# They are run with the default recursion limit; the ones still recursive report `RecursionError`
+# (for the generation, the output: `CGenerator` of pycparser is recursive).
+#     python benchmarks/stress.py --depth 100 1000 10000 -o stress.json
+
+import os
+import sys
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from irpc.bindingEntity import entity_index
+from irpc.pipeline import generate_file
+from pycparser import c_parser
+from pycparser.c_ast import FuncDef
+from time import perf_counter
+import datetime
+import platform
+import pycparser
+import json
+
+N_ENTITY = 8
+
+def providers():
+    return '\n'.join(f'void provide_e{i}() {{ int e{i}; e{i} = {i}; }}' for i in range(N_ENTITY)) + '\n'
+
+def nesting(depth):
+    l_line = ['int main() {', 'int x;']
+    l_line += [f'{"while" if i % 2 else "if"} (e{i % N_ENTITY} < {i}) {{' for i in range(depth)]
+    l_line += ['touch_e0();', 'x = e1;']
+    l_line += ['}'] * depth
+    return providers() + '\n'.join(l_line + ['}'])
+
+def expression(depth):
+    return providers() + 'int main() {\n int x = ' + ' + '.join(f'e{i % N_ENTITY}' for i in range(depth)) + ';\n}'
+
+def width(depth):
+    return providers() + 'int main() {\n int x;\n' + '\n'.join(f'x = e{i % N_ENTITY};' for i in range(depth)) + '\n}'
+
+def main_index(ast, s_entity):
+    return entity_index(next(f for f in ast.ext if isinstance(f, FuncDef) and f.decl.name == 'main'), s_entity)
+
+def generate(ast, s_entity):
+    return generate_file('', ast)
+
+WALKS = {'entity_index': main_index,
+         'irpc.py': generate}
+
+def stress(l_depth, repeat=3):
+    parser = c_parser.CParser()
+    s_entity = {f'e{i}' for i in range(N_ENTITY)}
+    limit = sys.getrecursionlimit()
+
+    l_result = []
+    for shape in (nesting, expression, width):
+        for depth in l_depth:
+            text = shape(depth)
+
+            d_time = {}
+            for name, walk in WALKS.items():
+                try:
+                    best = None
+                    for _ in range(repeat):
+                        # The parser is not what is measured. A new AST each time, the generation modifies it
+                        sys.setrecursionlimit(max(limit, 10 * depth))
+                        ast = parser.parse(text)
+                        sys.setrecursionlimit(limit)
+                        start = perf_counter()
+                        walk(ast, s_entity)
+                        t = perf_counter() - start
+                        best = t if best is None else min(best, t)
+                    d_time[name] = best
+                except RecursionError:
+                    d_time[name] = 'RecursionError'
+            l_result.append({'shape': shape.__name__, 'depth': depth, 'seconds': d_time})
+            print(f'{shape.__name__:>10} {depth:>8}: '
+                  + ' '.join(f'{n} {t:.4f}' if isinstance(t, float) else f'{n} {t}' for n, t in d_time.items()),
+                  file=sys.stderr)
+    return l_result
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Stress the indexing and the generation of irpc on deep and wide functions')
+    parser.add_argument('--depth', type=int, nargs='+', default=[100, 1000, 10000])
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('-o', '--output', help='JSON file (default: stdout)')
+    args = parser.parse_args()
+
+    report = {'date': datetime.datetime.now().isoformat(timespec='seconds'),
+              'python': platform.python_version(),
+              'pycparser': pycparser.__version__,
+              'recursion_limit': sys.getrecursionlimit(),
+              'results': stress(args.depth, args.repeat)}
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
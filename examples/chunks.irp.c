@@ -0,0 +1,30 @@
+#include <stdio.h>
+
+void provide_scale(){
+    double scale;
+    scale = 2.;
+}
+
+void provide_grid(){
+    #pragma irp storage(mmap) chunk(64)
+    double grid[1000];
+    for (unsigned long i = irp_begin; i < irp_end; i++)
+        grid[i] = scale * i;
+}
+
+void provide_squares(){
+    #pragma irp storage(heap)
+    double squares[100];
+    for (int i = 0; i < 100; i++)
+        squares[i] = i * i;
+}
+
+int main(){
+    printf("grid[5] = %g\n", grid[5]);
+    printf("grid[900] = %g\n", grid[900]);
+    printf("squares[9] = %g\n", squares[9]);
+    scale = 3.;
+    touch_scale();
+    printf("grid[900] = %g\n", grid[900]);
+    return 0;
+}
@@ -0,0 +1,68 @@
+#include <stdio.h>
+
+struct point { int x; int y; };
+
+void provide_n(){
+    int n;
+    n = 3;
+}
+
+void provide_step(){
+    int step;
+    step = 2;
+}
+
+void provide_scale(){
+    double scale;
+    scale = 0.5;
+}
+
+void provide_offset(){
+    int offset;
+    offset = 10;
+}
+
+void provide_origin(){
+    int origin;
+    origin = -1;
+}
+
+void provide_limit(){
+    int limit;
+    limit = 4;
+}
+
+int main(){
+    int i = 0;
+    do {
+        i += step;
+    } while (i < n);
+    printf("i = %d\n", i);
+
+    switch (n) {
+    case 3:
+        printf("three, step = %d\n", step);
+        break;
+    default:
+        printf("n = %d\n", n);
+    }
+
+    int half = (int) (scale * 10);
+    printf("half = %d\n", half);
+
+    int sign = origin < 0 ? -1 : 1;
+    printf("sign = %d\n", sign);
+
+    struct point p = { offset, origin };
+    int a[2] = { 0, 0 };
+    a[n - 2] = p.x + p.y;
+    printf("a = %d %d\n", a[0], a[1]);
+
+    int k = 0;
+again:
+    k++;
+    if (k < limit)
+        goto again;
+    printf("k = %d\n", k);
+    return 0;
+}
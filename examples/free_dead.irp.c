@@ -0,0 +1,37 @@
+#include <stdio.h>
+
+void provide_table(){
+    #pragma irp storage(heap)
+    double table[1000];
+    for (int i = 0; i < 1000; i++)
+        table[i] = 0.5 * i;
+}
+
+void provide_grid(){
+    #pragma irp storage(mmap)
+    double grid[1000];
+    for (int i = 0; i < 1000; i++)
+        grid[i] = table[i] + 1.;
+}
+
+void provide_total(){
+    double total;
+    total = 0.;
+    for (int i = 0; i < 1000; i++)
+        total += grid[i];
+}
+
+void provide_last(){
+    #pragma irp storage(heap)
+    double last[10];
+    for (int i = 0; i < 10; i++)
+        last[i] = i;
+}
+
+int main(){
+    printf("total = %g\n", total);
+    printf("grid[10] = %g\n", grid[10]);
+    printf("done\n");
+    printf("last[9] = %g\n", last[9]);
+    return 0;
+}
@@ -0,0 +1,36 @@
+#include <stdio.h>
+
+void provide_a(){
+    int a;
+    printf("provide a\n");
+    a = 2;
+}
+
+void provide_b(){
+    int b;
+    printf("provide b\n");
+    b = 3;
+}
+
+void provide_c(){
+    int c;
+    printf("provide c\n");
+    c = 5;
+}
+
+int main(){
+    int n = 0;
+    int s = 0;
+    for (int i = 0; i < 4; i++)
+        s += a;
+    for (int i = 0; i < n; i++)
+        s += b;
+    while (n < 3) {
+        n++;
+        if (n == 2)
+            break;
+        s += c;
+    }
+    printf("s = %d\n", s);
+    return 0;
+}
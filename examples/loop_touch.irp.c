@@ -0,0 +1,22 @@
+#include <stdio.h>
+
+void provide_x(){
+    int x;
+    x = 3;
+}
+
+void provide_y(){
+    int y;
+    y = x;
+}
+
+int main(){
+    int n = 0;
+    while (y) {
+        n++;
+        x = x - 1;
+        touch_x();
+    }
+    printf("n = %d\n", n);
+    return 0;
+}
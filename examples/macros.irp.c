@@ -0,0 +1,22 @@
+#include <stdio.h>
+#include <stdlib.h>
+
+#define N 5
+#define SQUARE(x) ((x) * (x))
+
+void provide_n(){
+    int n;
+    n = N;
+}
+
+void provide_squares(){
+    unsigned long squares;
+    squares = 0;
+    for (int i = 0; i < n; i++)
+        squares += SQUARE(i);
+}
+
+int main(){
+    printf("squares = %lu\n", squares);
+    return EXIT_SUCCESS;
+}
@@ -0,0 +1,30 @@
+#include <stdio.h>
+
+int calls = 0;
+
+void provide_n(){
+    int n;
+    n = 4;
+}
+
+void provide_sprovide_q(){
+    int s;
+    int q;
+    calls++;
+    s = 0;
+    q = 0;
+    for (int i = 0; i < n; i++) {
+        s += i;
+        q += i * i;
+    }
+}
+
+int main(){
+    printf("s = %d, q = %d\n", s, q);
+    printf("q = %d\n", q);
+    n = 6;
+    touch_n();
+    printf("s = %d, q = %d\n", s, q);
+    printf("calls = %d\n", calls);
+    return 0;
+}
@@ -0,0 +1,38 @@
+#include <stdio.h>
+#include <sys/stat.h>
+#include <unistd.h>
+
+void provide_a(){
+    int a;
+    printf("provide a\n");
+    a = 42;
+}
+
+void provide_values(){
+    #pragma irp storage(heap)
+    double values[1000];
+    printf("provide values\n");
+    for (int i = 0; i < 1000; i++)
+        values[i] = a * i;
+}
+
+int main(){
+    const char *path = "irp_snapshot_test.snap";
+    struct stat st;
+    printf("values[999] = %g\n", values[999]);
+    irp_checkpoint(path);
+
+    a = 7;
+    stat(path, &st);
+    truncate(path, st.st_size - 100);
+    printf("restore = %d\n", irp_restore(path));
+    printf("a = %d\n", a);
+
+    irp_checkpoint(path);
+    a = 1;
+    printf("restore = %d\n", irp_restore(path));
+    printf("a = %d\n", a);
+    printf("values[999] = %g\n", values[999]);
+    unlink(path);
+    return 0;
+}
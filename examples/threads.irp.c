@@ -0,0 +1,36 @@
+#include <pthread.h>
+#include <stdio.h>
+
+int calls = 0;
+
+void provide_n(){
+    int n;
+    n = 1000;
+}
+
+void provide_total(){
+    long total;
+    calls++;
+    total = 0;
+    for (int i = 0; i < n; i++)
+        total += i;
+}
+
+void *worker(void *arg){
+    long *result = arg;
+    *result = total;
+    return NULL;
+}
+
+int main(){
+    pthread_t l_thread[8];
+    long l_result[8];
+    for (int i = 0; i < 8; i++)
+        pthread_create(&l_thread[i], NULL, worker, &l_result[i]);
+    for (int i = 0; i < 8; i++)
+        pthread_join(l_thread[i], NULL);
+    for (int i = 0; i < 8; i++)
+        printf("%ld\n", l_result[i]);
+    printf("calls = %d\n", calls);
+    return 0;
+}
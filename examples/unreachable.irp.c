@@ -0,0 +1,41 @@
+#include <stdio.h>
+
+void provide_n(){
+    int n;
+    n = 4;
+}
+
+void provide_total(){
+    int total;
+    total = 0;
+    for (int i = 0; i < n; i++)
+        total += i;
+}
+
+void provide_unused(){
+    int unused;
+    unused = 100 * total;
+}
+
+void provide_values(){
+    #pragma irp storage(heap)
+    double values[8];
+    for (int i = 0; i < n; i++)
+        values[i] = 0.5 * i;
+}
+
+void provide_sum(){
+    double sum;
+    sum = 0.;
+    for (int i = 0; i < n; i++)
+        sum += values[i];
+}
+
+int main(){
+    printf("sum = %g\n", sum);
+    printf("total = %d\n", total);
+    n = 6;
+    touch_n();
+    printf("total = %d\n", total);
+    return 0;
+}
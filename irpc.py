@@ -1,37 +1,236 @@
 #!/usr/bin/env python3
 
+from pycparser import c_parser
 from pycparser.c_ast import FuncDef
 from irpc.ASTprocessing import CommWorld
+from irpc.cache import IndexCache
+from irpc.frontend import remove_headers, Preprocessor
+from irpc.pipeline import write_file
+from irpc.project import generate_project, project_table, header_world
+from irpc.watch import Watcher
+from irpc.instrument import read_profile
+from irpc import graph
+import gc
+import os
 
-def remove_headers(filename):
-    l_header = ['#include <stdbool.h>\n']
-    trim_file = []
-    with open(filename, 'r') as f:
-        for line in f:
-            if 'stdbool' in line:
-                continue
-            a = l_header if line.startswith("#include") else trim_file
-            a.append(line)
-    return map("".join, (l_header, trim_file))
+def report_timings(timings, file):
+    # The index is built once, the transformations only read it
+    index = timings.get('d_index', 0.)
+    transformations = sum(t for name, t in timings.items() if name != 'd_index')
+    for name, t in timings.items():
+        print(f'{name:<24} {t:.6f} s', file=file)
+    ratio = index / transformations if transformations else float('inf')
+    print(f'{"index / transformations":<24} {ratio:.2f}', file=file)
+
+def add_preprocessor_arguments(parser):
+    group = parser.add_argument_group('preprocessor')
+    group.add_argument('--cpp', action='store_true',
+                       help='run the C preprocessor (macros, typedefs of the system headers) instead of dropping the #include')
+    group.add_argument('--fake-libc', metavar='DIR',
+                       help='pycparser fake libc headers to use instead of the system ones (implies --cpp)')
+    group.add_argument('-I', dest='cpp_args', action='append', default=[], type=lambda d: f'-I{d}',
+                       metavar='DIR', help='add DIR to the include path of the preprocessor (implies --cpp)')
+    group.add_argument('-D', dest='cpp_args', action='append', type=lambda d: f'-D{d}',
+                       metavar='NAME[=VALUE]', help='define a macro for the preprocessor (implies --cpp)')
+
+def add_transformation_arguments(parser):
+    parser.add_argument('--prune', action='store_true',
+                        help='drop the providers (and their flag and touch) never needed by main')
+    parser.add_argument('--eliminate-guards', action='store_true',
+                        help='remove the guards dominated by the same guard and hoist the loop invariant ones '
+                             '(out of the loops certainly run once)')
+    parser.add_argument('--free-dead', action='store_true',
+                        help='free the arrays with heap or mmap storage after their last use in main '
+                             '(a later use provides them again)')
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument('--openmp', action='store_true',
+                      help='compute the independent providers in OpenMP tasks (thread safe flags, compile with -fopenmp)')
+    mode.add_argument('--eager', action='store_true',
+                      help='no guards: provide everything once at the start of main, touches re-provide the dependents')
+    mode.add_argument('--threads', action='store_true',
+                      help='for a multithreaded program: atomic flags, each provider called with the mutex of its entity '
+                           'held (compile with -pthread)')
+    mode.add_argument('--thread-local', action='store_true',
+                      help='each thread has its own entities and flags, and computes its own instance of them')
+    parser.add_argument('--generations', action='store_true',
+                        help='a touch bumps a generation counter instead of resetting the flags of all the dependents')
+    parser.add_argument('--instrument', action='store_true',
+                        help='count and time the providers at runtime, the report is written at exit in $IRP_PROFILE '
+                             '(default: irp_profile.json), and as folded stacks in $IRP_FOLDED if set')
+    parser.add_argument('--profile', metavar='JSON',
+                        help='the irp_profile.json of an --instrument run: the guards of the hot providers are hoisted, '
+                             'the small hot ones called by one guard are inlined (one file only)')
+    parser.add_argument('--checkpoint', action='store_true',
+                        help='generate irp_checkpoint(path) / irp_restore(path), saving the entities provided and their flags '
+                             'in one snapshot file')
+
+def transformation_options(parser, args):
+    # The keyword arguments of `generate_file` / `generate_project`
+    if args.generations and args.eager:
+        parser.error('--generations needs the guards, it cannot be used with --eager')
+    if args.checkpoint and args.eager:
+        parser.error('--checkpoint saves the memo flags, it cannot be used with --eager')
+    if args.free_dead and (args.eager or args.openmp or args.threads):
+        parser.error('--free-dead resets the flags from main alone, it cannot be used with --eager, --openmp or --threads')
+    if args.instrument and (args.openmp or args.threads):
+        parser.error('the --instrument counters are not thread safe, they cannot be used with --openmp or --threads')
+    try:
+        profile = read_profile(args.profile) if args.profile else None
+    except (OSError, ValueError) as e:
+        parser.error(f'--profile: {e}')
+    return dict(prune=args.prune, eliminate_guards=args.eliminate_guards, free_dead=args.free_dead, profile=profile,
+                openmp=args.openmp, eager=args.eager, generations=args.generations,
+                threads=args.threads, thread_local=args.thread_local,
+                instrument=args.instrument, checkpoint=args.checkpoint)
+
+def preprocessor_option(args):
+    if args.cpp or args.fake_libc or args.cpp_args:
+        return Preprocessor(cpp_args=args.cpp_args, fake_libc=args.fake_libc)
+    return None
+
+def graph_command(args, preprocessor, file):
+    # `irpc.py graph`: export the provider graph, report its shape and, with a profile, its critical path
+    if len(args.filenames) > 1 or os.path.isdir(args.filenames[0]):
+        world = header_world(project_table(args.filenames, args.jobs, preprocessor), {})
+    else:
+        if preprocessor:
+            _, ast = preprocessor.parse(args.filenames[0])
+        else:
+            _, text = remove_headers(args.filenames[0])
+            ast = c_parser.CParser().parse(text)
+        world = CommWorld({f for f in ast.ext if isinstance(f, FuncDef)})
+
+    d_parent = world.d_provider_parents
+    d_entity = {}
+    for entity, uiid in world.d_entity2provider.items():
+        d_entity.setdefault(uiid, set()).add(entity)
+    s_reachable = {world.entity2provider(entity) for entity in world.s_entity_reachable}
+    d_weight = graph.profile_weights(args.profile) if args.profile else None
+
+    d_stat = graph.statistics(d_parent, d_weight)
+    graph.report(d_stat, file)
+    if args.dot:
+        with open(args.dot, 'w') as f:
+            f.write(graph.to_dot(d_parent, d_entity, s_reachable, d_weight, d_stat.get('critical_path', ())))
+    if args.json:
+        with open(args.json, 'w') as f:
+            f.write(graph.to_json(d_parent, d_entity, s_reachable, d_stat, d_weight))
+    return not d_stat['cycles']
 
 
 if __name__ == "__main__":
 
-    from pycparser import parse_file, c_parser, c_generator
+    import argparse
+    import signal
     import sys
 
-    filename = sys.argv[1]
-    headers, text = remove_headers(filename)
+    if sys.argv[1:2] == ['graph']:
+        parser = argparse.ArgumentParser(prog=f'{sys.argv[0]} graph',
+                                         description='Dependency graph of the providers: shape, cycles, critical path')
+        parser.add_argument('filenames', nargs='+', metavar='filename',
+                            help='a .irp.c file, or many files / directories of a project')
+        parser.add_argument('--dot', metavar='PATH', help='write the graph in the DOT format of graphviz')
+        parser.add_argument('--json', metavar='PATH', help='write the graph and its statistics as JSON')
+        parser.add_argument('--profile', metavar='JSON',
+                            help='the irp_profile.json of an --instrument run, to compute the critical path '
+                                 'and the available parallelism')
+        parser.add_argument('-j', '--jobs', type=int,
+                            help='number of files parsed in parallel (default: number of CPUs)')
+        add_preprocessor_arguments(parser)
+        args = parser.parse_args(sys.argv[2:])
+        # Exit status 1 if the graph has cycles
+        sys.exit(0 if graph_command(args, preprocessor_option(args), sys.stdout) else 1)
+
+    if sys.argv[1:2] == ['watch']:
+        parser = argparse.ArgumentParser(prog=f'{sys.argv[0]} watch',
+                                         description='Generate the files again each time they are saved, '
+                                                     'keeping the parser and the analysis in memory')
+        parser.add_argument('filenames', nargs='+', metavar='filename', help='the .irp.c files (each one alone, not a project)')
+        parser.add_argument('-d', '--output-dir',
+                            help='where to write the generated files (default: ., or nowhere with --socket)')
+        parser.add_argument('--socket', metavar='PATH',
+                            help='serve the generated code on this Unix socket: send the path of one of the files '
+                                 'on one line, read its generated code')
+        parser.add_argument('--interval', type=float, default=0.2,
+                            help='seconds between two checks of the files (default: 0.2)')
+        add_transformation_arguments(parser)
+        add_preprocessor_arguments(parser)
+        args = parser.parse_args(sys.argv[2:])
+        options = transformation_options(parser, args)
+        if any(os.path.isdir(filename) for filename in args.filenames):
+            parser.error('the files are generated alone, a project (directory) cannot be watched')
+        output_dir = args.output_dir or (None if args.socket else '.')
+        watcher = Watcher(args.filenames, output_dir, preprocessor_option(args), log=sys.stderr, **options)
+        # The socket is removed on exit
+        signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit())
+        try:
+            watcher.serve(args.socket, args.interval)
+        except KeyboardInterrupt:
+            pass
+        sys.exit()
+
+    parser = argparse.ArgumentParser(description='Implicit Reference to Parameters in C')
+    parser.add_argument('filenames', nargs='+', metavar='filename',
+                        help='a .irp.c file, or many files / directories to generate a whole project')
+    parser.add_argument('--timings', action='store_true',
+                        help='report on stderr the time spent indexing and in each transformation')
+    parser.add_argument('--cache', metavar='DIR',
+                        help='reuse the parsing and the analysis of the unchanged functions from a previous run')
+    parser.add_argument('-o', '--output', metavar='PATH',
+                        help='write the generated code in PATH instead of the standard output')
+    add_transformation_arguments(parser)
+    add_preprocessor_arguments(parser)
+    group = parser.add_argument_group('project mode')
+    group.add_argument('-d', '--output-dir', default='.',
+                        help='where to write the generated files and the shared header (default: .)')
+    group.add_argument('-j', '--jobs', type=int,
+                        help='number of translation units processed in parallel (default: number of CPUs)')
+    args = parser.parse_args()
+    options = transformation_options(parser, args)
+    preprocessor = preprocessor_option(args)
+    if len(args.filenames) > 1 or os.path.isdir(args.filenames[0]):
+        l_path, n_pruned = generate_project(args.filenames, args.output_dir, args.jobs,
+                                            preprocessor=preprocessor, **options)
+        for path in l_path:
+            print(path)
+        if args.prune:
+            print(f'pruned {n_pruned} providers', file=sys.stderr)
+        sys.exit()
 
-    parser = c_parser.CParser()
-    ast = parser.parse(text)
+    cache = IndexCache(args.cache) if args.cache else None
+    # The nodes of the AST live until the end: no collection while they are created,
+    # and the collections after do not scan them again
+    gc.disable()
+    if cache:
+        # Only the declarations which changed are parsed
+        headers, text = preprocessor.preprocess(args.filenames[0]) if preprocessor else remove_headers(args.filenames[0])
+        ast = cache.parse(c_parser.CParser(), text, args.filenames[0])
+    elif preprocessor:
+        headers, ast = preprocessor.parse(args.filenames[0])
+    else:
+        headers, text = remove_headers(args.filenames[0])
+        parser = c_parser.CParser()
+        ast = parser.parse(text)
+    gc.freeze()
+    gc.enable()
 
-    l_func = { f for f in ast.ext if isinstance(f, FuncDef) }
-    world = CommWorld(l_func)
-    world.insert_provider_calls()
-    world.hoist_declarations(ast.ext)
-    world.insert_touches_stuff(ast.ext)
+    if args.output:
+        # Written a function at a time, the file is replaced once complete
+        tmp = f'{args.output}.{os.getpid()}.tmp'
+        try:
+            with open(tmp, 'w', buffering=1 << 20) as f:
+                world = write_file(f, headers, ast, cache, log=sys.stderr, **options)
+            os.replace(tmp, args.output)
+        finally:
+            if os.path.exists(tmp):
+                os.unlink(tmp)
+    else:
+        world = write_file(sys.stdout, headers, ast, cache, log=sys.stderr, **options)
+    if cache:
+        cache.save()
 
-    generator = c_generator.CGenerator()
-    print(headers)
-    print(generator.visit(ast))
+    if args.timings:
+        report_timings(world.timings, sys.stderr)
+        if cache:
+            print(f'cache: {cache.hits} hits, {cache.misses} misses, '
+                  f'{cache.n_reused} declarations reused, {cache.n_parsed} parsed', file=sys.stderr)
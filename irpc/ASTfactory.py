@@ -1,9 +1,17 @@
-from pycparser.c_ast import FuncCall, For, While, FuncDef, Return, FuncDecl, ExprList, ID, Decl, TypeDecl, IdentifierType, If, BinaryOp, UnaryOp, Compound, Assignment, Constant, Switch, Case
+from pycparser.c_ast import FuncCall, For, While, FuncDef, Return, FuncDecl, ExprList, ID, Decl, TypeDecl, IdentifierType, If, BinaryOp, UnaryOp, Compound, Assignment, Constant, Switch, Case, Pragma, ArrayRef, StructRef
 
 class ASTfactory:
 
-    def __init__(self, entity):
+    def __init__(self, entity, stamp=(), persistent=False, provider=None):
+        # The entity, or the uiid of a provider of many entities (`a__b`): they share one flag and one guard
         self.entity = entity
+        # Touched entities whose generation counters validate the memo of this entity.
+        # Empty: the memo is a plain bool, reset by the touches.
+        self.stamp = sorted(stamp)
+        # The provider is first looked up in the on-disk cache (see `irpc.persistent`)
+        self.persistent = persistent
+        # Name of the provider function, if not `provide_<entity>` (`provide_aprovide_b` for `a__b`)
+        self.provider_name = provider
 
     @property
     def memo_flag_name(self):
@@ -15,15 +23,34 @@ class ASTfactory:
 
     @property
     def provider(self):
-        return f'provide_{self.entity}'
+        return self.provider_name or f'provide_{self.entity}'
+
+    @property
+    def generation_name(self):
+        return f'{self.entity}_generation'
+
+    @property
+    def stat_name(self):
+        return f'irp_stat_{self.entity}'
+
+    memo_flag_quals = []
+    # Many threads may provide the entities at the same time
+    thread_safe = False
 
     def gen_memo_flag_node(self,self_touch):
-        val = 'true' if self_touch else 'false'
-        type_ = TypeDecl(declname = self.memo_flag_name,
-                         quals=[], type=IdentifierType(names=['bool']))
+        if self.stamp:
+            # The stamp the entity was provided with, -1 for never
+            type_ = TypeDecl(declname = self.memo_flag_name,
+                             quals=list(self.memo_flag_quals), type=IdentifierType(names=['unsigned', 'long']))
+            init = UnaryOp(op='-', expr=Constant(type='int', value='1'))
+        else:
+            val = 'true' if self_touch else 'false'
+            type_ = TypeDecl(declname = self.memo_flag_name,
+                             quals=list(self.memo_flag_quals), type=IdentifierType(names=['bool']))
+            init = ID(name=val)
         return Decl(name=self.entity, quals=[],
                     storage=[], funcspec=[],
-                    type= type_, init=ID(name=val),
+                    type= type_, init=init,
                     bitsize=None)
 
     @property
@@ -34,6 +61,37 @@ class ASTfactory:
     def memo_flag_node(self):
         return self.gen_memo_flag_node(False)
 
+    @property
+    def memo_flag_reset(self):
+        if self.stamp:
+            # Never provided
+            return Assignment(op='=', lvalue=ID(name=self.memo_flag_name),
+                              rvalue=UnaryOp(op='-', expr=Constant(type='int', value='1')))
+        return Assignment(op='=', lvalue=ID(name=self.memo_flag_name),
+                          rvalue=Constant(type='bool', value='false'))
+
+    @property
+    def generation_node(self):
+        type_ = TypeDecl(declname=self.generation_name,
+                         quals=list(self.memo_flag_quals), type=IdentifierType(names=['unsigned', 'long']))
+        return Decl(name=self.generation_name, quals=[],
+                    storage=[], funcspec=[],
+                    type=type_, init=Constant(type='int', value='0'),
+                    bitsize=None)
+
+    @property
+    def generation_bump(self):
+        return UnaryOp(op='p++', expr=ID(name=self.generation_name))
+
+    @property
+    def stamp_node(self):
+        # Sum of the generations of the touched parents, it increases at each of their touches
+        l_id = [ID(name=ASTfactory(e).generation_name) for e in self.stamp]
+        node = l_id[0]
+        for id_ in l_id[1:]:
+            node = BinaryOp(op='+', left=node, right=id_)
+        return node
+
     @property
     def touch_definition_node(self):
         type_ = FuncDecl(args=None,
@@ -51,14 +109,139 @@ class ASTfactory:
                         type=TypeDecl(declname=self.c_touch_name,
                                       quals=[], type=IdentifierType(names=['void'])))
     @property
+    def lock_nodes(self):
+        # File scope declarations needed by the guards, besides the flag
+        return []
+
+    @property
+    def load_name(self):
+        return f'irp_load_{self.entity}'
+
+    @property
+    def store_name(self):
+        return f'irp_store_{self.entity}'
+
+    @property
+    def free_name(self):
+        return f'irp_free_{self.entity}'
+
+    @property
+    def provider_call(self):
+        call = FuncCall(name=ID(name=self.provider), args=None)
+        if not self.persistent:
+            return call
+        # if (!irp_load_x()) { provide_x(); irp_store_x(); }
+        return If(cond=UnaryOp(op='!', expr=FuncCall(name=ID(name=self.load_name), args=None)),
+                  iftrue=Compound(block_items=[call, FuncCall(name=ID(name=self.store_name), args=None)]),
+                  iffalse=None)
+
+    @property
     def cached_provider_call(self):
-        provider = self.provider
         entity_flag = self.memo_flag_name
+        if self.stamp:
+            return If(cond=BinaryOp(op='!=', left=ID(name=entity_flag), right=self.stamp_node),
+                      iftrue=Compound(block_items=[ self.provider_call,
+                                                    Assignment(op='=',
+                                                               lvalue=ID(name=entity_flag),
+                                                               rvalue=self.stamp_node)]),
+                      iffalse=None)
         return If(cond=UnaryOp(op='!', expr=ID(name=entity_flag)),
-                  iftrue=Compound(block_items=[ FuncCall(name=ID(name=provider), args=None),
+                  iftrue=Compound(block_items=[ self.provider_call,
                                                 Assignment(op='=',
                                                            lvalue=ID(name=entity_flag),
                                                            rvalue=Constant(type='bool', value='true'))]),
                   iffalse=None)
 
+class OpenMPASTfactory(ASTfactory):
+    # Many threads may need the same entity at the same time:
+    # the flags are atomics, and the provider is called in a critical section (double-checked locking)
+
+    memo_flag_quals = ['_Atomic']
+    thread_safe = True
+
+    @property
+    def critical_name(self):
+        return f'irp_{self.entity}'
+
+    @property
+    def cached_provider_call(self):
+        guard = super().cached_provider_call
+        return If(cond=guard.cond,
+                  iftrue=Compound(block_items=[Pragma(f'omp critical({self.critical_name})'),
+                                               Compound(block_items=[guard])]),
+                  iffalse=None)
+
+class PthreadASTfactory(ASTfactory):
+    # For a multithreaded host program: the flags are atomics, and the provider is called
+    # with the mutex of the entity held (double-checked locking).
+    # A provider only takes the mutexes of its parents: they are always taken in the same order, no deadlock.
+
+    memo_flag_quals = ['_Atomic']
+    thread_safe = True
+
+    @property
+    def mutex_name(self):
+        return f'irp_mutex_{self.entity}'
+
+    @property
+    def lock_nodes(self):
+        # pthread_mutex_t irp_mutex_x = PTHREAD_MUTEX_INITIALIZER;
+        type_ = TypeDecl(declname=self.mutex_name, quals=[], type=IdentifierType(names=['pthread_mutex_t']))
+        return [Decl(name=self.mutex_name, quals=[],
+                     storage=[], funcspec=[],
+                     type=type_, init=ID(name='PTHREAD_MUTEX_INITIALIZER'),
+                     bitsize=None)]
+
+    def mutex_call(self, function):
+        return FuncCall(name=ID(name=function),
+                        args=ExprList(exprs=[UnaryOp(op='&', expr=ID(name=self.mutex_name))]))
+
+    @property
+    def cached_provider_call(self):
+        guard = super().cached_provider_call
+        return If(cond=guard.cond,
+                  iftrue=Compound(block_items=[self.mutex_call('pthread_mutex_lock'),
+                                               guard,
+                                               self.mutex_call('pthread_mutex_unlock')]),
+                  iffalse=None)
+
+class InstrumentedASTfactory(ASTfactory):
+    # The guards count the misses, and the hits in their else branch (see `irpc.instrument`)
+
+    def stat_increment(self, counter):
+        stat = ArrayRef(name=ID(name='irp_stats'), subscript=ID(name=self.stat_name))
+        return UnaryOp(op='p++', expr=StructRef(name=stat, type='.', field=ID(name=counter)))
+
+    @property
+    def cached_provider_call(self):
+        guard = super().cached_provider_call
+        guard.iftrue.block_items.insert(0, self.stat_increment('misses'))
+        guard.iffalse = Compound(block_items=[self.stat_increment('hits')])
+        return guard
+
+
+def function_definition_node(name, l_node):
+    # `void name() { l_node }`
+    type_ = FuncDecl(args=None,
+                     type=TypeDecl(declname=name,
+                                   quals=[], type=IdentifierType(names=['void'])))
+    return FuncDef(decl=Decl(name=name,
+                             quals=[], storage=[],
+                             funcspec=[], type=type_,
+                             init=None, bitsize=None),
+                   param_decls=None, body=Compound(block_items=l_node))
 
+def guard_flag(node):
+    # Name of the memo flag checked by `node` if it is a guard made by `cached_provider_call`, else None
+    # An else branch only counts the hits (`InstrumentedASTfactory`)
+    if not isinstance(node, If):
+        return None
+    if isinstance(node.cond, UnaryOp) and node.cond.op == '!':
+        flag = node.cond.expr
+    elif isinstance(node.cond, BinaryOp) and node.cond.op == '!=':
+        flag = node.cond.left
+    else:
+        return None
+    if isinstance(flag, ID) and flag.name.endswith('_provided'):
+        return flag.name
+    return None
@@ -1,12 +1,28 @@
-from irpc.utils import cached_property
-from irpc.bindingEntity import entity2Compound, entity2CompoundSimple, touch2entity
+from irpc.utils import cached_property, timed, insert_batch
+from irpc.bindingEntity import entity_index
 from pycparser.c_ast import *
 from collections import defaultdict
-from irpc.ASTfactory import ASTfactory
+from irpc.ASTfactory import ASTfactory, function_definition_node, guard_flag
+from irpc.dominance import GuardEliminator, walk
+from irpc.openmp import insert_tasks, parallel_main
+from irpc.instrument import instrument_provider, instrument_touch
+from irpc import arrays, checkpoint, persistent, inline
+from pycparser import c_generator
 import operator
+import heapq
 from itertools import chain
 
 
+def reachable(s_root, graph):
+    s = set(s_root)
+    l_todo = list(s)
+    while l_todo:
+        for child in graph.get(l_todo.pop(), ()):
+            if child not in s:
+                s.add(child)
+                l_todo.append(child)
+    return s
+
 class Function():
    def __init__(self, funcdef):
         self.ast = funcdef
@@ -27,8 +43,25 @@ class Provider(Function):
 
 class CommWorld():
 
-    def __init__(self, l_func):
+    def __init__(self, l_func, cache=None, project=None, factory=ASTfactory, generations=False, guard_functions=False,
+                 profile=None):
         self.l_func = l_func
+        # The class generating the flags, the guards and the touches (see `irpc.ASTfactory`)
+        self.factory = factory
+        # Memo validated by generation counters of the touched entities, instead of bool reset by the touches
+        self.generations = generations
+        # The uses are guarded in every function, not only in main and the providers (the entry points of the threads)
+        self.guard_functions = guard_functions
+        # Optional `irpc.cache.IndexCache`, used to skip the indexing of the unchanged functions
+        self.cache = cache
+        # Optional `irpc.project.ProjectTable`, the entities and the graph of all the translation units
+        self.project = project
+        # Optional runtime profile of an `--instrument` run, uiid -> counters (see `irpc.inline`)
+        self.profile = profile
+        # Set by `prune_unreachable_providers`: the entities not reachable are not provided anymore
+        self.pruned = False
+        # Wall time of each phase, see `irpc.utils.timed`
+        self.timings = {}
 
     @cached_property
     def s_provider(self):
@@ -43,18 +76,32 @@ class CommWorld():
 
     @cached_property
     def main(self):
-        return next(Function(f) for f in self.l_func if f.decl.name == 'main')
+        # In a project, only one translation unit has a main
+        return next((Function(f) for f in self.l_func if f.decl.name == 'main'), None)
+
+    @cached_property
+    def s_entry(self):
+        # The functions using the entities without providing them: main, and the others with `guard_functions`
+        s = {self.main} if self.main else set()
+        if self.guard_functions:
+            s_name = {f.ast.decl.name for f in self.s_provider} | {'main'}
+            s |= {Function(f) for f in self.l_func if f.decl.name not in s_name}
+        return s
 
     @cached_property
     def s_provider_and_main(self):
-        return self.s_provider | {self.main}
+        return self.s_provider | self.s_entry
 
     @cached_property
     def s_entity(self):
+        if self.project:
+            return self.project.s_entity
         return set(chain.from_iterable(p.s_entity for p in self.s_provider))
 
     @cached_property
     def d_entity2provider(self):
+        if self.project:
+            return self.project.d_entity2provider
         d = {}
         for p in self.s_provider:
             for entity in p.s_entity:
@@ -64,68 +111,625 @@ class CommWorld():
     def entity2provider(self, entity):
         return self.d_entity2provider[entity]
 
+    def l_uiid(self, l_entity, reverse=False):
+        # The providers of the entities, sorted: one guard for all the entities of a provider
+        return sorted({self.entity2provider(entity) for entity in l_entity}, reverse=reverse)
+
+    @cached_property
+    def d_provider_name(self):
+        # uiid -> name of the provider function
+        if self.project:
+            return self.project.d_provider_name
+        return {p.uiid: p.ast.decl.name for p in self.s_provider}
+
+    @cached_property
+    def d_array(self):
+        # entity -> `irpc.arrays.ArrayEntity`, read from the declarations before they are hoisted
+        if self.project:
+            return self.project.d_array
+        d = {}
+        for p in self.s_provider:
+            d.update(arrays.array_entities(p.ast, p.s_entity))
+        return d
+
+    @cached_property
+    def s_chunked(self):
+        return {entity for entity, array in self.d_array.items() if array.chunk}
+
+    @cached_property
+    def d_persistent(self):
+        # uiid -> (input files, hash of the code) of the providers of this unit annotated persistent,
+        # read before the transformations
+        d = {}
+        for p in self.s_provider:
+            l_input = persistent.inputs(p.ast)
+            if l_input is not None:
+                d[p.uiid] = (l_input, persistent.source_hash(p.ast))
+        return d
+
+    @cached_property
+    def s_persistent(self):
+        if self.project:
+            return self.project.s_persistent
+        return set(self.d_persistent)
+
+    @cached_property
+    def l_array(self):
+        # The array entities provided in this translation unit
+        return [self.d_array[e] for p in self.l_provider for e in sorted(p.s_entity) if e in self.d_array]
+
+    @cached_property
+    @timed
+    def d_index(self):
+        # One walk per function, shared by all the transformations.
+        # Need to be computed before any of them modify the AST.
+        index = self.cache.entity_index if self.cache else entity_index
+        return {f: index(f.ast, self.s_entity, self.s_chunked) for f in self.s_provider_and_main}
+
     @cached_property
     def child_adjacency_graph(self):
+        if self.project:
+            return self.project.child_adjacency_graph
         d = defaultdict(set)
         for p in self.s_provider:
             entity_provided = p.s_entity
-            for parent_entity, _ in entity2Compound(p.ast.body, self.s_entity - entity_provided).items():
+            for parent_entity in self.d_index[p].hoisting.keys() - entity_provided:
                 d[parent_entity] |= entity_provided
         return d
 
+    @cached_property
+    def parent_adjacency_graph(self):
+        # entity -> entities used by its provider (where a guard is inserted, or where the hoisting found one)
+        if self.project:
+            return self.project.parent_adjacency_graph
+        d = defaultdict(set)
+        for p in self.s_provider:
+            index = self.d_index[p]
+            for entity in p.s_entity:
+                d[entity] |= (index.uses.keys() | index.hoisting.keys()) - p.s_entity
+        return d
+
+    @cached_property
+    def s_entity_reachable(self):
+        # Entities transitively needed by main (and the other entry points), and by the functions it may call.
+        # Without main, we cannot know, so everything is reachable.
+        if self.project:
+            return self.project.s_entity_reachable
+        if not self.main:
+            return self.s_entity
+        s_root = set().union(*(self.d_index[f].uses.keys() | self.d_index[f].chunks.keys() for f in self.s_entry))
+        s_root |= self.s_entity_function_use
+        return reachable(s_root, self.parent_adjacency_graph)
+
+    @cached_property
+    def d_descendants(self):
+        # entity -> every entity which depends on it, directly or not
+        d = defaultdict(set)
+        for entity, s_parent in self.parent_adjacency_graph.items():
+            for parent_entity in s_parent:
+                d[parent_entity].add(entity)
+        for parent_entity, s_child in self.child_adjacency_graph.items():
+            d[parent_entity] |= s_child
+        if self.pruned:
+            # In a project the graph still has the entities pruned, a touch must not reset their flag
+            s_live = self.s_entity_reachable
+            d = {entity: s_child & s_live for entity, s_child in d.items() if entity in s_live}
+        return {entity: reachable(s_child, d) for entity, s_child in d.items()}
+
+    @cached_property
+    def d_provider_parents(self):
+        # uiid -> uiid of the providers it uses
+        d_parent = {uiid: set() for uiid in self.d_entity2provider.values()}
+        for entity, s_parent in self.parent_adjacency_graph.items():
+            uiid = self.entity2provider(entity)
+            d_parent[uiid] |= {self.entity2provider(e) for e in s_parent} - {uiid}
+        return d_parent
+
+    @cached_property
+    def l_provider_topological(self):
+        # uiid of the providers, each one after the providers it uses
+        d_parent = self.d_provider_parents
+
+        d_child = defaultdict(set)
+        for uiid, s_parent in d_parent.items():
+            for parent_uiid in s_parent:
+                d_child[parent_uiid].add(uiid)
+        d_degree = {uiid: len(d_parent[uiid]) for uiid in set(self.d_entity2provider.values())}
+
+        # Kahn algorithm, the heap makes the order deterministic
+        l_ready = [uiid for uiid, degree in d_degree.items() if not degree]
+        heapq.heapify(l_ready)
+        l = []
+        while l_ready:
+            uiid = heapq.heappop(l_ready)
+            l.append(uiid)
+            for child in d_child[uiid]:
+                d_degree[child] -= 1
+                if not d_degree[child]:
+                    heapq.heappush(l_ready, child)
+
+        if len(l) != len(d_degree):
+            l_cycle = sorted(uiid for uiid, degree in d_degree.items() if degree)
+            raise ValueError(f'Cycle in the provider graph between: {", ".join(l_cycle)}')
+        return l
+
+    @cached_property
+    def s_entity_touched(self):
+        if self.project:
+            return self.project.s_entity_touched
+        return {entity_touched for f in self.s_provider_and_main for entity_touched, _ in self.d_index[f].touches}
+
+    @cached_property
+    def d_generation_stamp(self):
+        # uiid -> touched entities it depends on
+        d = defaultdict(set)
+        for entity_touched in self.s_entity_touched:
+            for entity in self.d_descendants.get(entity_touched, set()):
+                d[self.entity2provider(entity)].add(entity_touched)
+        return d
+
+    @cached_property
+    def l_stat(self):
+        # The slots of the runtime profile: the providers, and the touched entities without one
+        return sorted(set(self.d_entity2provider.values()) | (self.s_entity_touched - self.s_entity))
+
+    def stat(self, entity):
+        return self.entity2provider(entity) if entity in self.s_entity else entity
+
+    def astfactory(self, uiid):
+        persistent = uiid in self.s_persistent
+        provider = self.d_provider_name.get(uiid)
+        if self.generations:
+            return self.factory(uiid, self.d_generation_stamp.get(uiid, ()), persistent=persistent, provider=provider)
+        return self.factory(uiid, persistent=persistent, provider=provider)
+
+    @timed
+    def prune_unreachable_providers(self, context):
+        # Remove the providers never needed by main (so their declaration, flag and touch will not be generated)
+        self.pruned = True
+        s_pruned = {p for p in self.s_provider if not p.s_entity & self.s_entity_reachable}
+        if s_pruned:
+            s_ast = {p.ast for p in s_pruned}
+            context[:] = [node for node in context if node not in s_ast]
+            self.l_func = {f for f in self.l_func if f not in s_ast}
+            # Everything derived from the providers is computed again without them (the entities, the graphs, the
+            # descendants...). Only the functions left, the reachable entities and the index of the functions left are kept
+            s_keep = {'s_provider', 'main', 's_entry', 's_entity_reachable'}
+            d_index = self.__dict__.get('d_index')
+            for name, attr in vars(CommWorld).items():
+                if isinstance(attr, cached_property) and name not in s_keep:
+                    self.__dict__.pop(name, None)
+            self.s_provider = self.s_provider - s_pruned
+            if d_index is not None:
+                self.d_index = {f: index for f, index in d_index.items() if f in self.s_provider_and_main}
+        return s_pruned
+
+    @cached_property
+    def s_uiid_hot(self):
+        # The providers whose guards are evaluated often, according to the profile
+        return inline.hot_guards(self.profile) if self.profile else set()
+
+    def guarded_uses(self, f):
+        # entity -> {(compound, index)}, the statements of `f` to guard: each use, or for the hot providers
+        # the first statement using the entity in each compound where `entity2Compound` hoists it.
+        # Not in a function with touches or jumps, nor if a provider touches: the guard may not be valid anymore at the use
+        index = self.d_index[f]
+        if not self.s_uiid_hot or index.touches or any(self.d_index[p].touches for p in self.s_provider) \
+                or any(isinstance(node, (Goto, Label)) for node in walk(f.ast)):
+            return index.uses
+        d = dict(index.uses)
+        for entity in index.uses:
+            l_compound = index.hoisting.get(entity)
+            if self.entity2provider(entity) not in self.s_uiid_hot or entity in self.s_chunked or not l_compound:
+                continue
+            s_use = set()
+            for compound in l_compound:
+                l_node = compound.block_items or []
+                i = next((i for i, node in enumerate(l_node)
+                          if any(isinstance(n, ID) and n.name == entity for n in walk(node))), None)
+                if i is None:
+                    break
+                s_use.add((compound, i))
+            else:
+                d[entity] = s_use
+        return d
+
+    def provider_insertions(self, f):
+        # [(compound, index, uiid)]: before the statement `index` of the compound, one guard per provider, in reverse order
+        d = defaultdict(lambda: defaultdict(set))
+        for entity, instances in self.guarded_uses(f).items():
+            if entity in f.s_entity:
+                continue
+            for compound, index in instances:
+                d[compound][index].add(entity)
+        return [(compound, index, self.l_uiid(l_entity, reverse=True))
+                for compound, d_idx_entity in d.items() for index, l_entity in d_idx_entity.items()]
+
+    @timed
     def insert_provider_calls(self):
+        # The code of the persistent providers is hashed without the guards
+        self.d_persistent
         for f in self.s_provider_and_main:
-            l_ent_adjusted = self.s_entity - f.s_entity
-            instance_dict = entity2CompoundSimple(f.ast, l_ent_adjusted, ID)
-
-            d = defaultdict(lambda: defaultdict(set))
-            for entity, instances in instance_dict.items():
-                for compound, index in instances:
-                    d[compound][index].add(entity)
+            # Without profile the insertions only depend on the index and the providers of the entities used
+            if self.cache and not self.s_uiid_hot:
+                d_provider = {entity: self.entity2provider(entity) for entity in self.d_index[f].uses}
+                l_insertion = self.cache.insertions(f.ast, d_provider)
+                if l_insertion is None:
+                    l_insertion = self.provider_insertions(f)
+                    self.cache.store_insertions(f.ast, d_provider, l_insertion)
+            else:
+                l_insertion = self.provider_insertions(f)
 
-            for compound in d:
-                d_idx_entity = d[compound]
-                for index in sorted(d_idx_entity, reverse=True):
-                    for entity in sorted(d_idx_entity[index]):
-                        provider_call = ASTfactory(self.entity2provider(entity)).cached_provider_call
-                        compound.block_items.insert(index, provider_call)
+            # One rebuild of each compound
+            d = defaultdict(dict)
+            for compound, index, l_uiid in l_insertion:
+                d[compound][compound.block_items[index]] = [self.astfactory(uiid).cached_provider_call for uiid in l_uiid]
+            for compound, d_before in d.items():
+                insert_batch(compound.block_items, d_before)
 
+    @timed
     def hoist_declarations(self,
-                          context):
-    
+                          context, memo_flags=True):
+        # The annotations are read before the declarations move, and the functions indexed
+        d_array = self.d_array
+        self.d_persistent
+        self.d_index
+        # The top of the file: the declarations of each provider, the ones of the last provider first
+        l_group = []
+        d_before = defaultdict(list)
         for p in self.l_provider:
-            l_node = p.ast .body.block_items
-            # Move the declaration of the entity and the top of the file
-            # All add the declaration of the flag variable for the memoization
-            for i, node in enumerate(l_node):
-                if isinstance(node,Decl) and node.type.declname in p.s_entity:
-                    node = l_node.pop(i)  
-                    # Entity Declaration
-                    context.insert(0, node)
-                    # is_provided Boolean
-                    for entname in p.s_entity:
-                        context.insert(1, ASTfactory(entname).memo_flag_node)
-                    break
+            # Move the declarations of the entities at the top of the file,
+            # and add the declaration of the flag variable for the memoization, one for all the entities of the provider
+            l_decl = []
+            l_node = []
+            for node in p.ast.body.block_items or []:
+                if isinstance(node, Decl) and node.name in p.s_entity:
+                    array = d_array.get(node.name)
+                    if array and array.storage != 'static':
+                        # Allocated where it was declared: the size may use the entities guarded before
+                        l_node.append(FuncCall(name=ID(name=array.alloc_name), args=None))
+                        d_before[p.ast].append(arrays.alloc_definition(array))
+                    l_decl.append(arrays.storage_decl(node, array.storage) if array else node)
+                elif not arrays.is_annotation(node):
+                    l_node.append(node)
+            if p.ast.body.block_items:
+                p.ast.body.block_items = l_node
+            if l_decl:
+                if memo_flags:
+                    l_decl += self.astfactory(p.uiid).lock_nodes
+                    l_decl.append(self.astfactory(p.uiid).memo_flag_node)
+                l_group.append(l_decl)
+        insert_batch(context, d_before, l_front=[node for l_decl in reversed(l_group) for node in l_decl])
+
+    @timed
+    def insert_chunk_providers(self, context):
+        # After the guards and the touches. The body of a chunked provider becomes `irp_fill_x`,
+        # called by `irp_ensure_x` for one chunk and by the provider for all of them (see `irpc.arrays`)
+        if self.s_chunked and self.factory.thread_safe:
+            raise ValueError(f'The chunks are not thread safe, cannot provide {", ".join(sorted(self.s_chunked))} '
+                             'by chunks with threads')
+
+        for f in self.s_provider_and_main:
+            for entity, l_ref in self.d_index[f].chunks.items():
+                # A provider reads the rows of its own chunk as they are
+                if entity in f.s_entity:
+                    continue
+                for ref in l_ref:
+                    arrays.ensure_ref(self.d_array[entity], ref)
 
+        generator = c_generator.CGenerator()
+        l_group = []
+        d_before = defaultdict(list)
+        for p in self.l_provider:
+            for entity in sorted(p.s_entity & self.s_chunked):
+                array = self.d_array[entity]
+                astfact = self.astfactory(p.uiid)
+                stamp = generator.visit(astfact.stamp_node) if astfact.stamp else None
+                fill, ensure, provider = arrays.chunk_definitions(array, p.ast.decl.name, p.ast.body, stamp)
+                p.ast.body = provider.body
+                d_before[p.ast] += [fill, ensure]
+                l_group.append(arrays.declarations(array, stamp))
+        insert_batch(context, d_before, l_front=[node for l_decl in reversed(l_group) for node in l_decl])
+
+    @cached_property
+    def s_state_name(self):
+        # The file scope variables of the memo state: entities, flags, generation counters and bitmaps of the chunks
+        s_name = set(self.s_entity)
+        s_name |= {self.factory(uiid).memo_flag_name for uiid in self.d_entity2provider.values()}
+        s_name |= {self.factory(entity).generation_name for entity in self.s_entity_touched}
+        s_name |= {name for array in self.d_array.values() if array.chunk
+                   for name in (array.chunks_name, array.stamp_name)}
+        return s_name
+
+    @timed
+    def insert_checkpoint(self, context, l_decl=None):
+        # `irp_checkpoint(path)` / `irp_restore(path)` of the memo state (see `irpc.checkpoint`).
+        # The layout is the one of the declarations hoisted in `context`,
+        # or of `l_decl` in a project (the declarations of the shared header)
+        l_snapshot = checkpoint.snapshot_decls(context if l_decl is None else l_decl, self.s_state_name)
+        idx = context.index(self.main.ast) if self.main else len(context)
+        context[idx:idx] = checkpoint.checkpoint_definitions(l_snapshot, self.d_array)
+        context[0:0] = checkpoint.declarations()
+        return l_snapshot
+
+    @timed
+    def insert_persistent(self, context, memo_flags=True):
+        # After the declarations are hoisted: `irp_load_x` / `irp_store_x` of the persistent providers
+        # (see `irpc.persistent`). The parents are provided before computing the key
+        # (without the flags, they are already: the eager schedule provides them first).
+        l_group = []
+        d_after = {}
+        for p in self.l_provider:
+            if p.uiid not in self.d_persistent:
+                continue
+            l_input, key = self.d_persistent[p.uiid]
+            s_parent = set().union(*(self.parent_adjacency_graph.get(e, set()) for e in p.s_entity)) - p.s_entity
+            l_decl = checkpoint.snapshot_decls(context, p.s_entity)
+            key_def, load_def, store_def = persistent.definitions(p.uiid, l_decl, l_input, s_parent, key, self.d_array)
+            if memo_flags:
+                load_def.body.block_items[0:0] = [self.astfactory(uiid).cached_provider_call
+                                                  for uiid in self.l_uiid(s_parent)]
+            d_after[p.ast] = [key_def, load_def, store_def]
+            l_group.append(persistent.declarations(p.uiid))
+        insert_batch(context, d_after=d_after, l_front=[node for l_decl in reversed(l_group) for node in l_decl])
+
+    @timed
+    def insert_thread_local(self, context):
+        # After the declarations are hoisted: each thread has its own instance of the memo state,
+        # and computes its own entities
+        for node in context:
+            if isinstance(node, Decl) and not isinstance(node.type, FuncDecl) \
+                    and checkpoint.decl_name(node) in self.s_state_name and '_Thread_local' not in node.storage:
+                node.storage = node.storage + ['_Thread_local']
+
+    @timed
     def insert_touches_stuff(self,context):
+        l_touch = self.insert_touch_provider_calls()
+        self.insert_touch_definitions(context, l_touch)
 
+    def insert_touch_provider_calls(self):
         # When touching inside a while / for statement should ensure that the entity in statement are reprovided
         l_touch = set()
         for p in self.s_provider_and_main:
-            for (entity_touched, compound), l_e in touch2entity(p.ast,self.s_entity).items():
-                for e in sorted(l_e):
-                    provider_call = ASTfactory(e).cached_provider_call
-                    compound.block_items.insert(len(compound.block_items), provider_call)
+            for (entity_touched, compound), l_e in self.d_index[p].touches.items():
+                if l_e:
+                    compound.block_items += [self.astfactory(uiid).cached_provider_call for uiid in self.l_uiid(l_e)]
                 l_touch.add(entity_touched)
+        return l_touch
+
+    @timed
+    def eliminate_redundant_guards(self):
+        # Need to be called once all the guards are inserted
+        def flag(entity):
+            return self.factory(self.entity2provider(entity)).memo_flag_name
+
+        d_touch_kill = {entity: {flag(e) for e in s_child}
+                        for entity, s_child in self.d_descendants.items()}
 
+        # Calling a provider (and so the providers of its parents) may execute touches
+        d_provider_touch = defaultdict(set)
+        for p in self.s_provider:
+            for entity_touched, _ in self.d_index[p].touches:
+                d_provider_touch[p.uiid] |= d_touch_kill.get(entity_touched, set())
+        d_guard_kill = {}
+        for entity in self.s_entity:
+            s_kill = set()
+            for e in reachable({entity}, self.parent_adjacency_graph):
+                s_kill |= d_provider_touch[self.entity2provider(e)]
+            if s_kill:
+                # The flag of a provider of many entities is killed by the touches of any of them
+                d_guard_kill.setdefault(flag(entity), set()).update(s_kill)
+
+        eliminator = GuardEliminator(d_touch_kill, d_guard_kill)
+        for f in self.s_provider_and_main:
+            eliminator.run(f.ast)
+        return eliminator.n_removed, eliminator.n_hoisted
+
+    @cached_property
+    def s_entity_function_use(self):
+        # The entities used by the functions other than main and the providers
+        if self.project:
+            return self.project.s_function_use
+        s_name = {p.ast.decl.name for p in self.s_provider} | {'main'}
+        return {node.name for f in self.l_func if f.decl.name not in s_name
+                for node in walk(f) if isinstance(node, ID) and node.name in self.s_entity}
+
+    def d_last_need(self, l_node):
+        # uiid -> index of the last statement of `l_node` (the body of main, with its guards) which may read its entities.
+        # Forward over the statements, `s_valid` are the entities provided since their last touch: their providers
+        # are not called again, they don't need their parents. An entity not valid may be provided: its parents
+        # may be read too, and so on. A statement touching an entity may provide again its dependents.
+        # A guard at the top of main makes valid its entities, and the ones guarded at the top of their provider.
+        d_flag = {self.factory(uiid).memo_flag_name: uiid for uiid in self.d_entity2provider.values()}
+        d_ensure = {self.d_array[entity].ensure_name: entity for entity in self.s_chunked}
+        d_group = defaultdict(set)
+        for entity, uiid in self.d_entity2provider.items():
+            d_group[uiid].add(entity)
+        d_guarded = {p.uiid: {d_flag[guard_flag(node)] for node in p.ast.body.block_items or []
+                              if guard_flag(node) in d_flag}
+                     for p in self.s_provider}
+
+        d_last = {}
+        s_valid = set()
+        for i, node in enumerate(l_node):
+            s_use, s_touch = set(), set()
+            for id_ in walk(node):
+                if not isinstance(id_, ID):
+                    continue
+                name = id_.name
+                if name in self.s_entity:
+                    s_use.add(name)
+                elif name in d_flag:
+                    s_use |= d_group[d_flag[name]]
+                elif name in d_ensure:
+                    s_use.add(d_ensure[name])
+                elif name.startswith('touch_'):
+                    s_touch.add(name[len('touch_'):])
+            s_reset = set().union(*(self.d_descendants.get(entity, set()) for entity in s_touch))
+
+            s_valid_before = s_valid - s_reset
+            l_todo = list(s_use)
+            s_need = set(s_use)
+            while l_todo:
+                uiid = self.entity2provider(l_todo.pop())
+                if d_group[uiid] <= s_valid_before:
+                    continue
+                for entity in d_group[uiid]:
+                    for parent in self.parent_adjacency_graph.get(entity, ()):
+                        if parent not in s_need:
+                            s_need.add(parent)
+                            l_todo.append(parent)
+            for entity in s_need:
+                d_last[self.entity2provider(entity)] = i
+
+            s_valid -= s_reset
+            if guard_flag(node) in d_flag:
+                for uiid in reachable({d_flag[guard_flag(node)]}, d_guarded):
+                    s_valid |= d_group[uiid]
+        return d_last
+
+    @timed
+    def insert_frees(self, context):
+        # After the guards (and their elimination): free the arrays with heap or mmap storage after the last statement
+        # of main which may read them. The flag of their provider is reset, a later use provides them again.
+        # Return the uiid of the providers freed
+        if self.factory.thread_safe:
+            raise ValueError('The entities are shared by the threads, they cannot be freed by main')
+        if not self.main or any(isinstance(node, (Goto, Label)) for node in walk(self.main.ast)):
+            return []
+        l_node = self.main.ast.body.block_items or []
+        d_last = self.d_last_need(l_node)
+
+        d_array = defaultdict(list)
+        for entity, array in sorted(self.d_array.items()):
+            if array.storage != 'static':
+                d_array[self.entity2provider(entity)].append(array)
+        s_function_use = {self.entity2provider(entity) for entity in self.s_entity_function_use}
+
+        d_after = defaultdict(list)
+        l_def = []
+        l_uiid = []
+        for uiid in sorted(d_array):
+            # Not once main returns, nor just before: the last use must be followed by more than the return.
+            # The entities used by the other functions are kept
+            i = d_last.get(uiid)
+            if i is None or isinstance(l_node[i], Return) or all(isinstance(node, Return) for node in l_node[i + 1:]):
+                continue
+            if uiid in s_function_use:
+                continue
+            astfact = self.astfactory(uiid)
+            free_def = arrays.free_definition(astfact.free_name, d_array[uiid])
+            free_def.body.block_items.append(astfact.memo_flag_reset)
+            l_def.append(free_def)
+            d_after[l_node[i]].append(FuncCall(name=ID(name=astfact.free_name), args=None))
+            l_uiid.append(uiid)
+
+        insert_batch(l_node, d_after=d_after)
+        insert_batch(context, {self.main.ast: l_def})
+        return l_uiid
+
+    @timed
+    def inline_providers(self, context):
+        # Once all the guards are inserted, before the tasks and the instrumentation: the small hot providers
+        # called by one guard get their body inlined there (see `irpc.inline`). Not in a project, the other units
+        # may call them. Return the number of providers inlined
+        if self.project or not self.profile:
+            return 0
+        s_uiid = inline.small_hot_providers(self.profile) - self.s_persistent
+        n = 0
+        for p in sorted(self.s_provider, key=operator.attrgetter('uiid')):
+            if p.uiid in s_uiid and not p.s_entity & self.s_chunked:
+                n += inline.inline_provider(context, p.ast, self.factory(p.uiid).memo_flag_name)
+        return n
+
+    @timed
+    def insert_provider_tasks(self, context):
+        # Need to be called last: the other passes don't look for guards inside tasks
+        d_flag2entity = defaultdict(set)
+        for entity, uiid in self.d_entity2provider.items():
+            d_flag2entity[self.factory(uiid).memo_flag_name].add(entity)
+
+        def depend(flag, l_flag):
+            s_out = d_flag2entity[flag]
+            s_sibling = set().union(*(d_flag2entity[f] for f in l_flag if f != flag))
+            s_in = (reachable(s_out, self.parent_adjacency_graph) - s_out) & s_sibling
+            clause = f'depend(out: {", ".join(sorted(s_out))})'
+            if s_in:
+                clause = f'depend(in: {", ".join(sorted(s_in))}) {clause}'
+            return f'omp task {clause}'
+
+        d_rank = {self.factory(uiid).memo_flag_name: i for i, uiid in enumerate(self.l_provider_topological)}
+        n = sum(insert_tasks(f.ast, depend, d_rank.get) for f in self.s_provider_and_main)
+        if self.main:
+            context.insert(context.index(self.main.ast) + 1, parallel_main(self.main.ast))
+        return n
+
+    @timed
+    def insert_eager_schedule(self, context, l_touch):
+        # Replace the guards: `irp_init` provides once, in dependency order, everything main needs.
+        # A touch provides again, in the same order, every dependent of the entity touched.
+        def l_call(s_entity):
+            s_uiid = {self.entity2provider(e) for e in s_entity & self.s_entity_reachable}
+            return [self.astfactory(uiid).provider_call for uiid in self.l_provider_topological if uiid in s_uiid]
+
+        l_def = []
+        l_front = []
+        for entity in sorted(l_touch):
+            astfact = self.factory(entity)
+            touch_def = astfact.touch_definition_node
+            touch_def.body.block_items = l_call(self.d_descendants.get(entity, set()))
+            l_def.append(touch_def)
+            l_front.append(astfact.touch_declaration_node)
+
+        if self.main:
+            init_def = function_definition_node('irp_init', l_call(self.s_entity))
+            l_def.append(init_def)
+            l_front.append(init_def.decl)
+            self.main.ast.body.block_items = [FuncCall(name=ID(name='irp_init'), args=None)] + (self.main.ast.body.block_items or [])
+
+        # The definitions before main, or at the end
+        insert_batch(context, {self.main.ast: l_def} if self.main else None, l_front=l_front[::-1])
+        if not self.main:
+            context += l_def
+
+    @timed
+    def insert_instrumentation(self, context, l_touch):
+        # Need to be called last: the providers are renamed, and their timed version inserted after them
+        insert_batch(context, d_after={p.ast: [instrument_provider(p.ast, p.uiid)] for p in self.l_provider})
+
+        d_touch = {self.factory(entity).c_touch_name: entity for entity in l_touch}
+        for node in context:
+            if isinstance(node, FuncDef) and node.decl.name in d_touch:
+                entity = d_touch[node.decl.name]
+                l_dependent = sorted({self.entity2provider(e) for e in self.d_descendants.get(entity, set())})
+                instrument_touch(node, self.stat(entity), l_dependent)
+
+    def insert_touch_definitions(self, context, l_touch):
+        # A touch invalidates all the entities depending on the one touched, directly or not:
+        #   - by resetting their flags
+        #   - or, with generations, by bumping its counter (the stamp of all its dependents)
+        # The definitions before the last function, the declarations (and counters) of the last entity first
+        l_def = []
+        l_group = []
         for entity in sorted(l_touch):
-            astfact =  ASTfactory(entity)
+            astfact =  self.factory(entity)
             touch_def = astfact.touch_definition_node
-            touch_decl = astfact.touch_declaration_node
-            
-            for ent_touched in sorted(self.child_adjacency_graph[entity]):
-                touch_def.body.block_items.insert(1,ASTfactory(ent_touched).memo_flag_node)
-            
-            context.insert(len(context)-1, touch_def)
-            context.insert(0, touch_decl)
+            l_decl = [astfact.touch_declaration_node]
+
+            if self.generations:
+                touch_def.body.block_items.append(astfact.generation_bump)
+                l_decl.append(astfact.generation_node)
+            else:
+                s_uiid = {self.entity2provider(e) for e in self.d_descendants.get(entity, set())}
+                for uiid in sorted(s_uiid):
+                    touch_def.body.block_items.append(self.factory(uiid).memo_flag_reset)
+                # The chunks provided are forgotten too
+                for e in sorted(self.d_descendants.get(entity, set()) & self.s_chunked):
+                    touch_def.body.block_items.append(arrays.chunk_reset(self.d_array[e]))
+            l_def.append(touch_def)
+            l_group.append(l_decl)
+
+        if l_def:
+            insert_batch(context, {context[-1]: l_def},
+                         l_front=[node for l_decl in reversed(l_group) for node in l_decl])
 
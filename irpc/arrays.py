@@ -0,0 +1,249 @@
+from irpc.irpctyping import *
+from pycparser import c_parser, c_generator
+from pycparser.c_ast import Decl, ArrayDecl, PtrDecl, TypeDecl, FuncDecl, Pragma, FuncCall, ExprList, ID, Constant, UnaryOp
+from dataclasses import dataclass
+import copy
+import re
+
+#                _
+#  /\  ._ ._ _. \_/  _
+# /--\ |  | (_|  |  _>
+#
+# Array entities. The declaration in the provider can be annotated:
+#
+#     void provide_grid(){
+#         #pragma irp storage(mmap) chunk(64)
+#         double grid[N][M];
+#         for (unsigned long i = irp_begin; i < irp_end; i++) ...
+#     }
+#
+#   - storage(static): the default, the array is hoisted as is
+#   - storage(heap) / storage(mmap): the array become a pointer to its rows (`double (*grid)[M]`, the uses don't change),
+#     allocated when provided for the first time. With mmap, the memory is an anonymous mapping:
+#     only the pages written by the provider use memory. With `--free-dead`, `irp_free_x` releases it after its last use
+#     in main (see `CommWorld.insert_frees`).
+#   - chunk(C): the rows are provided on demand, C at a time. The provider fills the rows [irp_begin, irp_end).
+#     `grid[i]` in the other functions become `irp_ensure_grid(i)[0]`: the address of the row i,
+#     once its chunk is provided (if its bit in `grid_chunks` was not set). The whole entity (a use not indexed, or a guard) is still `provide_grid`.
+#     A touch of a parent clears the bits.
+
+_re_annotation = re.compile(r'(\w+)\s*\(\s*([^()]*?)\s*\)')
+
+STORAGES = ('static', 'heap', 'mmap')
+
+@dataclass
+class ArrayEntity:
+    name: str
+    decl: Decl
+    storage: str = 'static'
+    chunk: int = None
+
+    @property
+    def size(self):
+        # Number of rows, as C code
+        return c_generator.CGenerator().visit(self.decl.type.dim)
+
+    @property
+    def chunks_name(self):
+        return f'{self.name}_chunks'
+
+    @property
+    def stamp_name(self):
+        return f'{self.name}_chunks_stamp'
+
+    @property
+    def ensure_name(self):
+        return f'irp_ensure_{self.name}'
+
+    @property
+    def fill_name(self):
+        return f'irp_fill_{self.name}'
+
+    @property
+    def alloc_name(self):
+        return f'irp_alloc_{self.name}'
+
+    @property
+    def n_byte(self):
+        # Size of the bitmap of the chunks, as C code
+        return f'(({self.size}) + {self.chunk * 8 - 1}) / {self.chunk * 8}'
+
+def annotation(pragma):
+    # `#pragma irp storage(heap) chunk(64)` -> {'storage': 'heap', 'chunk': '64'}, None if not for irp
+    l_word = pragma.string.split(None, 1)
+    if not l_word or l_word[0] != 'irp':
+        return None
+    return dict(_re_annotation.findall(l_word[1] if len(l_word) > 1 else ''))
+
+def is_annotation(node):
+    return isinstance(node, Pragma) and annotation(node) is not None
+
+def array_entities(funcdef, s_entity) -> Dict:
+    # The array entities declared in the provider `funcdef`
+    d = {}
+    l_node = funcdef.body.block_items or []
+    for previous, node in zip([None] + l_node, l_node):
+        if not isinstance(node, Decl) or node.name not in s_entity or not isinstance(node.type, ArrayDecl):
+            continue
+        d_annotation = (annotation(previous) if isinstance(previous, Pragma) else None) or {}
+        storage = d_annotation.get('storage', 'static')
+        if storage not in STORAGES:
+            raise ValueError(f'{node.name}: unknown storage {storage}, expected one of {", ".join(STORAGES)}')
+        if node.type.dim is None:
+            raise ValueError(f'{node.name}: an array entity needs a size')
+        chunk = d_annotation.get('chunk')
+        if chunk is not None:
+            if not chunk.isdigit() or not int(chunk):
+                raise ValueError(f'{node.name}: invalid chunk {chunk}, expected a positive number of rows')
+            chunk = int(chunk)
+        if chunk and not is_constant(node.type.dim):
+            # The bitmap of the chunks is declared at file scope
+            raise ValueError(f'{node.name}: an array provided by chunks needs a constant size, '
+                             f'not {c_generator.CGenerator().visit(node.type.dim)}')
+        d[node.name] = ArrayEntity(node.name, node, storage, chunk)
+    return d
+
+def is_constant(expr):
+    # No identifier, but in a sizeof (the macros are expanded with --cpp)
+    l_node = [expr]
+    while l_node:
+        node = l_node.pop()
+        if isinstance(node, ID):
+            return False
+        if not (isinstance(node, UnaryOp) and node.op == 'sizeof'):
+            l_node += [child for _, child in node.children()]
+    return True
+
+def storage_decl(decl, storage):
+    # The declaration at file scope
+    if storage == 'static':
+        return decl
+    return Decl(name=decl.name, quals=decl.quals, storage=decl.storage, funcspec=decl.funcspec,
+                type=PtrDecl(quals=[], type=decl.type.type), init=None, bitsize=None)
+
+def bitmap_decl(array):
+    return f'unsigned char {array.chunks_name}[{array.n_byte}]'
+
+def ensure_declaration(array):
+    # `double (*irp_ensure_grid(unsigned long irp_i))[M]`, the type of the rows is the one of the entity
+    type_ = copy.deepcopy(array.decl.type.type)
+    node = type_
+    while not isinstance(node, TypeDecl):
+        node = node.type
+    node.declname = array.ensure_name
+    args = parse_ext('void f(unsigned long irp_i);')[0].type.args
+    decl = Decl(name=array.ensure_name, quals=[], storage=[], funcspec=[],
+                type=FuncDecl(args=args, type=PtrDecl(quals=[], type=type_)), init=None, bitsize=None)
+    return c_generator.CGenerator().visit(decl)
+
+def ensure_ref(array, ref):
+    # `grid[i]` -> `irp_ensure_grid(i)[0]`, in place: the index keeps the ArrayRef nodes.
+    # The pointer is read after the call, once the storage is allocated.
+    ref.name = FuncCall(name=ID(name=array.ensure_name), args=ExprList(exprs=[ref.subscript]))
+    ref.subscript = Constant(type='int', value='0')
+
+def chunk_reset(array, value='0'):
+    # memset(grid_chunks, value, sizeof(grid_chunks))
+    return FuncCall(name=ID(name='memset'),
+                    args=ExprList(exprs=[ID(name=array.chunks_name), Constant(type='int', value=value),
+                                         UnaryOp(op='sizeof', expr=ID(name=array.chunks_name))]))
+
+def parse_ext(text):
+    return c_parser.CParser().parse(text).ext
+
+def alloc_definition(array):
+    use_mmap = int(array.storage == 'mmap')
+    return parse_ext(f'''
+static void {array.alloc_name}(void)
+{{
+    if (!{array.name})
+        {array.name} = irp_alloc(({array.size}) * sizeof(*{array.name}), {use_mmap});
+}}''')[0]
+
+def free_definition(name, l_array):
+    # `name`: release the storage of the arrays, allocated again when provided (the flag is reset by the caller)
+    l_line = []
+    for array in l_array:
+        use_mmap = int(array.storage == 'mmap')
+        l_line += [f'    if ({array.name}) {{',
+                   f'        irp_free({array.name}, ({array.size}) * sizeof(*{array.name}), {use_mmap});',
+                   f'        {array.name} = 0;',
+                   f'    }}']
+    body = '\n'.join(l_line)
+    funcdef = parse_ext(f'static void {name}(void)\n{{\n{body}\n}}')[0]
+    funcdef.body.block_items += [chunk_reset(array) for array in l_array if array.chunk]
+    return funcdef
+
+def chunk_definitions(array, provider, body, stamp=None):
+    # The function filling the rows [irp_begin, irp_end) with the body of the provider,
+    # `irp_ensure_x` and the new body of the provider (all the rows).
+    # `stamp`: with generation counters, the C expression the chunks were provided with
+    chunk, size, chunks, chunks_stamp = array.chunk, array.size, array.chunks_name, array.stamp_name
+    check_stamp = set_stamp = ''
+    if stamp:
+        check_stamp = f'if ({chunks_stamp} != {stamp}) {{ memset({chunks}, 0, sizeof({chunks})); {chunks_stamp} = {stamp}; }}'
+        set_stamp = f'{chunks_stamp} = {stamp};'
+    l_ext = parse_ext(f'''
+static void {array.fill_name}(unsigned long irp_begin, unsigned long irp_end)
+{{
+}}
+
+{ensure_declaration(array)}
+{{
+    unsigned long irp_c = irp_i / {chunk};
+    {check_stamp}
+    if (!({chunks}[irp_c / 8] & (1 << (irp_c % 8))))
+    {{
+        {array.fill_name}(irp_c * {chunk}, (irp_c + 1) * {chunk} < ({size}) ? (irp_c + 1) * {chunk} : ({size}));
+        {chunks}[irp_c / 8] |= 1 << (irp_c % 8);
+    }}
+    return &{array.name}[irp_i];
+}}
+
+void {provider}()
+{{
+    {array.fill_name}(0, {size});
+    memset({chunks}, 0xff, sizeof({chunks}));
+    {set_stamp}
+}}''')
+    l_ext[0].body = body
+    return l_ext
+
+def declarations(array, stamp=None):
+    # At the top of the file: the bitmap, and the prototype of the ensure function
+    text = f'{bitmap_decl(array)};\n{ensure_declaration(array)};\n'
+    if stamp:
+        text += f'unsigned long {array.stamp_name} = -1;\n'
+    return parse_ext(text)
+
+def runtime_definitions(l_array, free=False):
+    # The includes and `irp_alloc`, if one of the arrays need them. `free`: `irp_free` is used too
+    l_line = []
+    if any(array.chunk for array in l_array) or free:
+        l_line.append('#include <string.h>')
+    allocated = any(array.storage != 'static' for array in l_array)
+    if allocated or free:
+        l_line += ['#include <stdio.h>', '#include <stdlib.h>', '#include <sys/mman.h>']
+    if allocated:
+        l_line += ['',
+                   'static void *irp_alloc(unsigned long size, int use_mmap)',
+                   '{',
+                   '    void *p = use_mmap ? mmap(NULL, size, PROT_READ | PROT_WRITE,',
+                   '                              MAP_PRIVATE | MAP_ANONYMOUS | MAP_NORESERVE, -1, 0)',
+                   '                       : calloc(1, size);',
+                   '    if (!p || p == MAP_FAILED) {',
+                   '        fprintf(stderr, "irp: cannot allocate %lu bytes\\n", size);',
+                   '        exit(1);',
+                   '    }',
+                   '    return p;',
+                   '}']
+    if free:
+        l_line += ['',
+                   'static void irp_free(void *p, unsigned long size, int use_mmap)',
+                   '{',
+                   '    if (use_mmap)',
+                   '        munmap(p, size);',
+                   '    else',
+                   '        free(p);',
+                   '}']
+    return '\n'.join(l_line) + '\n' if l_line else ''
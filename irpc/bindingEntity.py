@@ -1,5 +1,5 @@
 from irpc.irpctyping import *
-from pycparser.c_ast import FuncCall, For, While, FuncDef, Return, FuncDecl, ExprList, ID, Decl, TypeDecl, IdentifierType, If, BinaryOp, UnaryOp, Compound, Assignment, Constant, Switch, Case
+from pycparser.c_ast import FuncCall, For, While, DoWhile, FuncDef, Return, FuncDecl, ExprList, ID, Decl, TypeDecl, IdentifierType, If, BinaryOp, UnaryOp, Compound, Assignment, Constant, Switch, Case, Default, Label, TernaryOp, ArrayRef, StructRef, Cast, InitList, CompoundLiteral, NamedInitializer, ArrayDecl, PtrDecl, DeclList
 
 #       __ ___    _
 #  /\  (_   |    | \  _   _  _  _  ._ _|_
@@ -19,136 +19,287 @@ from pycparser.c_ast import FuncCall, For, While, FuncDef, Return, FuncDecl, Exp
 # - If an entity is used in a compound, we don't need to check children's compound (immutability)
 # - If an entity is present in both branch of a conditional, it can be hoisted out
 # - Similarly, if an entity if present in a loop body, it can be hostied out
+# - The same for a switch: an entity present in all the cases (with a default) can be hoisted out
+#
+# The bodies of the loops, if/else, labels and cases are made compounds first (see `normalize`):
+# a guard can always be inserted just before the statement using the entity, in the same branch.
 
 from collections import defaultdict
 from dataclasses import dataclass, field
 
+# The entities are interned: entity i is the bit 1 << i, and the sets of entities are int bitmasks.
+
+def bits(mask):
+    # The bits set in `mask`, one at a time
+    while mask:
+        low = mask & -mask
+        yield low
+        mask ^= low
+
+class Bound:
+    # Found entities who can't be hoisted: bit -> compounds, and the mask of the bits present.
+    # Shared by the walkers made by `&`.
+    __slots__ = ('d', 'mask')
+
+    def __init__(self):
+        self.d = {}
+        self.mask = 0
+
+class EntityWalker:
+    __slots__ = ('n', 's', 'b')
+
+    def __init__(self, n=0, s=0, b=None):
+        self.n = n # Entities we are looking for
+        self.s = s # Entities we found that can be hoisted
+        self.b = Bound() if b is None else b
+
+    def add_set(self, bit):
+        self.s |= bit
+        self.n &= ~self.s
+
+    def extend_dict(self, d):
+        b = self.b
+        for k, v in d.items():
+            if k in b.d:
+                b.d[k] |= v
+            else:
+                b.d[k] = set(v)
+                b.mask |= k
+
+        # Not sure if needed, commenting this line
+        # make all the test pass
+        # Need to add test who break
+        self.s &= ~b.mask
+
+    def bind(self, mask, compound):
+        # extend_dict({e: {compound} for e in mask})
+        b = self.b
+        for k in bits(mask):
+            if k in b.d:
+                b.d[k].add(compound)
+            else:
+                b.d[k] = {compound}
+                b.mask |= k
+        self.s &= ~b.mask
+
+    def __ior__(self, e):
+        self.extend_dict(e.b.d)
+        self.s |= e.s
+        self.n &= ~self.s
+        return self
+
+    def __and__(self, e):
+        s = self.s & e.s
+        tmp = EntityWalker(self.n & ~s, s, self.b)
+        tmp.extend_dict(e.b.d)
+        return tmp
+
+def run(generator):
+    # The walks of `entity2Compound` are generators: instead of calling a walk, they yield it and get its result.
+    # They are run here with an explicit stack, deep nesting doesn't hit the recursion limit.
+    stack = [generator]
+    value = None
+    while stack:
+        try:
+            walk = stack[-1].send(value)
+        except StopIteration as e:
+            stack.pop()
+            value = e.value
+        else:
+            stack.append(walk)
+            value = None
+    return value
+
 def entity2Compound(compound, s_entity) -> Dict[Entity, Set[Compound]]:
-    @dataclass
-    class EntityWalker:
-        n: Set = field(default_factory=set) # Entities we are looking for
-        s: Set = field(default_factory=set) # Entities we found that can be hoisted
-        d: Dict = field(default_factory=lambda: defaultdict(set)) # Found entities who can't be hoisted
-
-        def add_set(self, v):
-            self.s.add(v)
-            self.n = self.n - self.s
-
-        def extend_dict(self, d):
-            for k, v in d.items():
-                self.d[k] |= v
-
-            # Not sure if needed, commenting this line
-            # make all the test pass
-            # Need to add test who break 
-            self.s = self.s - set(self.d.keys())
-
-        def __ior__(self, e):
-            self.extend_dict(e.d)
-            self.s.update(e.s)
-            self.n = self.n - self.s
-            return self
-
-        def __and__(self, e):
-            s = self.s & e.s
-            tmp = EntityWalker(self.n - s, s, self.d)
-            tmp.extend_dict(e.d)
-            return tmp
+    l_entity = sorted(s_entity)
+    d_bit = {entity: 1 << i for i, entity in enumerate(l_entity)}
+    # id(compound made for an `else if`) -> (this compound, the compound of the if/else): it is not in the function,
+    # the entities bound to it are bound to the compound of the if/else instead
+    d_else_if = {}
 
     def entity2compound_simple(l_node, nodes_aloyed, compound) -> EntityWalker:
-        l_node_to_recurse = set()
+        # Level by level instead of one recursion per level (expressions can be very deep)
         w = EntityWalker(nodes_aloyed)
-
-        for node in l_node:
-            if isinstance(node, ID) and node.name in nodes_aloyed:
-                w.add_set(node.name)
-            elif isinstance(node, Compound):
-                w |= entity2compound_hoisting(node, w.n)
-            elif isinstance(node, BinaryOp):
-                l_node_to_recurse |= {node.left, node.right}
-            elif isinstance(node, Assignment):
-                l_node_to_recurse |= {node.lvalue, node.rvalue}
-            elif isinstance(node, FuncCall) and node.args:
-                l_node_to_recurse |= set(node.args)
-            elif isinstance(node, ExprList):
-                l_node_to_recurse |= set(node.exprs)
-
-        if l_node_to_recurse:
-            w |= entity2compound_simple(l_node_to_recurse, w.n, compound)
-
+        while l_node:
+            l_node_to_recurse = []
+            for node in l_node:
+                if isinstance(node, ID):
+                    bit = d_bit.get(node.name, 0) & w.n
+                    if bit:
+                        w.add_set(bit)
+                elif isinstance(node, Compound):
+                    w |= yield entity2compound_hoisting(node, w.n)
+                elif node is not None:
+                    # Including the ternary operators: both branches are hoisted with the statement
+                    l_node_to_recurse += node_extract(node)
+            l_node = l_node_to_recurse
         return w
 
+    def branches(node, compound):
+        # The compound of each branch of a if/else or of a switch (None: no else / no default).
+        # An `else if` is not a compound, it is seen as a compound with only this if.
+        if isinstance(node, If):
+            iffalse = node.iffalse
+            if iffalse is not None and not isinstance(iffalse, Compound):
+                iffalse = Compound(block_items=[iffalse])
+                d_else_if[id(iffalse)] = (iffalse, compound)
+            return [node.iftrue, iffalse]
+        l_case = [n for n in node.stmt.block_items or [] if isinstance(n, (Case, Default))]
+        if not all(len(n.stmts) == 1 and isinstance(n.stmts[0], Compound) for n in l_case):
+            return None
+        l_compound = [n.stmts[0] for n in l_case]
+        if not any(isinstance(n, Default) for n in l_case):
+            l_compound.append(None)
+        return l_compound
+
     def entity2compound_hoisting(compound, l_entity) -> EntityWalker:
 
-        l = compound.block_items
-        head = [x for x in l if not isinstance(x, (If, For))]
-        tail_if = [x for x in l if isinstance(x, If)]
-        tail_for = [x for x in l if isinstance(x, For)]
+        l = compound.block_items or []
+        head = [x for x in l if not isinstance(x, (If, For, While, DoWhile, Switch))]
+        tail_if = [x for x in l if isinstance(x, (If, Switch))]
+        tail_for = [x for x in l if isinstance(x, (For, While, DoWhile))]
 
         # Bound to this current compound
-        w = entity2compound_simple(head, l_entity, compound)
+        w = yield entity2compound_simple(head, l_entity, compound)
 
-        # All the entity in the for loop will be bound to this particular compound
+        # All the entity in the loop will be bound to this particular compound
         for f in tail_for:
-            l_ast_node = [f.init, f.cond, f.next] + f.stmt.block_items
-            w |= entity2compound_simple(l_ast_node, w.n, compound)
+            l_ast_node = [f.init, f.cond, f.next] if isinstance(f, For) else [f.cond]
+            l_ast_node += f.stmt.block_items or [] if isinstance(f.stmt, Compound) else [f.stmt]
+            w |= yield entity2compound_simple(l_ast_node, w.n, compound)
 
-        # If statement:
+        # If (or switch) statement:
         #     - entity in the cond -> this compound
-        #     - entity in both  branches -> this compound
-        #     - entity in one and only one branch -> compound of the associate branch
+        #     - entity in all the branches -> this compound
+        #     - entity in some branches -> compound of the associate branches
         for i in tail_if:
-            w |= entity2compound_simple([i.cond], w.n, compound)
+            w |= yield entity2compound_simple([i.cond], w.n, compound)
+
+            l_compound = branches(i, compound)
+            if l_compound is None:
+                # Case labels inside a case, cannot be split in branches
+                w |= yield entity2compound_simple([i.stmt], w.n, compound)
+                continue
 
-            w_t = entity2compound_hoisting(i.iftrue, w.n)
-            w_f = entity2compound_hoisting(i.iffalse, w.n) if i.iffalse else EntityWalker(w.n)
+            l_w = []
+            for c in l_compound:
+                l_w.append((yield entity2compound_hoisting(c, w.n)) if c is not None else EntityWalker(w.n))
 
-            # Update with the value who are in both branches
-            w |= (w_t & w_f)
+            # Update with the value who are in all the branches
+            w_all = l_w[0]
+            for w_branch in l_w[1:]:
+                w_all = w_all & w_branch
+            w |= w_all
 
             # Update the rest with the compound who are present only on their branch
-            w.extend_dict({e: {i.iftrue} for e in w_t.s - w.s})
-            w.extend_dict({e: {i.iffalse} for e in w_f.s - w.s})
+            for c, w_branch in zip(l_compound, l_w):
+                w.bind(w_branch.s & ~w.s, c)
 
         return w
 
-    w = entity2compound_hoisting(compound, s_entity)
+    w = run(entity2compound_hoisting(compound, (1 << len(l_entity)) - 1))
     # Bound the remaining entity to the current compound
-    w.extend_dict({e: {compound} for e in w.s})
-    return w.d
+    w.bind(w.s, compound)
 
+    def real(c):
+        while id(c) in d_else_if:
+            c = d_else_if[id(c)][1]
+        return c
+
+    return defaultdict(set, {l_entity[bit.bit_length() - 1]: {real(c) for c in l_c} for bit, l_c in w.b.d.items()})
+
+
+LOOP = (While, DoWhile, For)
 
 def node_extract(node):
+    # The children which may use an entity, in evaluation order.
+    # The condition of a loop comes before its body (and `next` before the body of a for).
     if isinstance(node, Compound):
         return node.block_items if node.block_items else []
     elif isinstance(node, If):
-        return [node.iftrue, node.iffalse]
-    elif isinstance(node, (While, For) ):
+        return [node.cond, node.iftrue, node.iffalse]
+    elif isinstance(node, (While, DoWhile) ):
         return [ node.cond, node.stmt ]
+    elif isinstance(node, For):
+        return [ node.init, node.cond, node.next, node.stmt ]
     elif isinstance(node, FuncDef):
         return [ node.body ]
-    elif isinstance(node, ( Switch, Case ) ):
-        return [node.stmts]
+    elif isinstance(node, Switch):
+        return [ node.cond, node.stmt ]
+    elif isinstance(node, (Case, Default)):
+        return node.stmts or []
+    elif isinstance(node, Label):
+        return [ node.stmt ]
     elif isinstance(node, BinaryOp):
         return [node.left, node.right]
     elif isinstance(node, Assignment):
         return [node.lvalue, node.rvalue]
+    elif isinstance(node, TernaryOp):
+        return [node.cond, node.iftrue, node.iffalse]
     elif isinstance(node, ID):
         return [node.name]
-    elif isinstance(node, ExprList):
+    elif isinstance(node, (ExprList, InitList)):
         return node.exprs
-    elif isinstance(node, FuncCall) and node.args:
-        return node.args
-    elif  isinstance(node, (Return, Decl, Constant)):
-        return []
-    elif isinstance(node, UnaryOp):
+    elif isinstance(node, FuncCall):
+        # The name of a function is not an entity, but a pointer to a function may be
+        l_node = [] if isinstance(node.name, ID) else [node.name]
+        return l_node + ([node.args] if node.args else [])
+    elif isinstance(node, ArrayRef):
+        return [ node.name, node.subscript ]
+    elif isinstance(node, StructRef):
+        # The field is not an identifier of the scope
+        return [ node.name ]
+    elif isinstance(node, (UnaryOp, Cast, Return, NamedInitializer)):
         return [ node.expr ]
+    elif isinstance(node, CompoundLiteral):
+        return [ node.init ]
+    elif isinstance(node, Decl):
+        return [ node.type, node.init ]
+    elif isinstance(node, ArrayDecl):
+        # Variable length array
+        return [ node.type, node.dim ]
+    elif isinstance(node, PtrDecl):
+        return [ node.type ]
+    elif isinstance(node, DeclList):
+        return node.decls
     else:
         return []
 
+def normalize(funcdef):
+    # Make compounds of the bodies of the loops, if/else (but `else if`), labels and cases,
+    # so the guard of an entity used in one of them can be inserted inside, just before the use:
+    #     while (c) x = a;  ->  while (c) { x = a; }
+    # Cases containing other case labels (Duff's device) are left as is.
+    def compound(node):
+        return node if node is None or isinstance(node, Compound) else Compound(block_items=[node])
+
+    l_todo = [funcdef]
+    while l_todo:
+        node = l_todo.pop()
+        if isinstance(node, (While, DoWhile, For, Label)):
+            node.stmt = compound(node.stmt)
+        elif isinstance(node, If):
+            node.iftrue = compound(node.iftrue)
+            if not isinstance(node.iffalse, If):
+                node.iffalse = compound(node.iffalse)
+        elif isinstance(node, (Case, Default)) and node.stmts:
+            if not any(isinstance(n, (Case, Default)) for n in node.stmts):
+                if len(node.stmts) != 1 or not isinstance(node.stmts[0], Compound):
+                    node.stmts = [Compound(block_items=node.stmts)]
+        l_todo += [child for _, child in node.children()]
+    return funcdef
+
+# The walk below uses an explicit stack instead of the recursion, so deeply nested code doesn't hit the
+# recursion limit. A frame is what a recursive call would have: the node, the iterator on its children
+# (`node_extract` order) and the state given to the children. The next child of the top frame is
+# processed, and the frame of this child pushed on top of it, so the nodes are visited in the order of the recursion.
+#
+# The compound (and the loop) of a node is given to its children only, not to the nodes following it:
+#     { y = b; } x = a;   ->  `a` is used in the outer compound
+
 def entity2CompoundSimple(astnode, l_ent, _type_, old_compound = None, idx_old_compound = 0):
     """
-    Recursively search through AST to locate all instances of ID nodes
+    Search through AST to locate all instances of ID nodes
 
     Args:
         param1: Node to be analyzed (ie. FuncDef, Compound, etc)
@@ -164,44 +315,108 @@ def entity2CompoundSimple(astnode, l_ent, _type_, old_compound = None, idx_old_c
         return {astnode.name : { (old_compound, idx_old_compound) } }
 
     d = defaultdict(set)
-    
-    if isinstance(astnode, Compound):
-                old_compound = astnode
-
-    # Recurses through elements in body of head node
-    for i, node in enumerate(node_extract(astnode)):
-        if isinstance(node, Compound):
-            old_compound = node
 
+    def frame(astnode, old_compound, idx_old_compound):
         if isinstance(astnode, Compound):
-            idx_old_compound = i
-        # Append any entries of ID node names to d so long as it is a function with a provider
-        if isinstance(node, _type_):
-            if node.name in l_ent:
-                #if d[node.name] == [] or ( d[node.name][-1] != (old_compound, idx_old_compound) ):
-                d[node.name].add( (old_compound, idx_old_compound) )
-        # If anything but instance of ID -> recurse
+            old_compound = astnode
+        return [astnode, enumerate(node_extract(astnode)), old_compound, idx_old_compound]
+
+    stack = [frame(astnode, old_compound, idx_old_compound)]
+    while stack:
+        astnode, children, old_compound, idx_old_compound = stack[-1]
+        # Elements in body of the node
+        for i, node in children:
+            if isinstance(astnode, Compound):
+                idx_old_compound = i
+            # Append any entries of ID node names to d so long as it is a function with a provider
+            if isinstance(node, _type_):
+                if node.name in l_ent:
+                    d[node.name].add( (old_compound, idx_old_compound) )
+            # If anything but instance of ID -> visit it before the next child
+            else:
+                stack.append(frame(node, old_compound, idx_old_compound))
+                break
         else:
-            # Recursive call followed by updating the dictionary
-            for k,v in entity2CompoundSimple(node, l_ent, _type_, old_compound, idx_old_compound).items():
-                d[k] |= v
+            stack.pop()
     return d
 
-# Find the compound associated to the touch
-def touch2entity(astnode,l_ent, old_compound=None, old_entity=None):
-    d = defaultdict(set)
-    for i, node in enumerate(node_extract(astnode)):
-        if isinstance(node, (While, For ) ):
-            old_entity = set(entity2CompoundSimple(node.cond, l_ent, ID))
-            old_compound = node.stmt 
-
-        if isinstance(node, FuncCall) and node.name.name.startswith('touch_'):
-            entity_touched = node.name.name.split("touch_").pop()
-            d[ (entity_touched, old_compound) ] |= old_entity - set([entity_touched])
-        else:
-            for k,v in touch2entity(node, l_ent, old_compound, old_entity).items():
-                d[k] |= v
 
-    return d
+#  ___
+#   |  ._   _|  _
+#  _|_ | | (_| (/_ ><
+#
+# All the transformations of CommWorld need the same information about a function.
+# Instead of walking the function once per transformation (and once per entity set),
+# we walk it once and keep the result:
+#   - uses:     entity -> {(compound, index)}          (same as entity2CompoundSimple)
+#   - touches:  (entity touched, compound) -> {entity} (the entities of the condition of the loop around the touch)
+#   - hoisting: entity -> {compound}                   (same as entity2Compound)
+#   - chunks:   entity -> [ArrayRef]                   (`x[i]` of the entities provided by chunks, see `irpc.arrays`)
+#
+# The chunked entities indexed by `x[i]` are not uses: the subscript will ensure the chunk, there is no guard.
+#
+# The index is computed against the full entity table, callers filter out the entities they don't want.
+# The (compound, index) are only valid before the function is modified.
+
+@dataclass
+class EntityIndex:
+    uses: Dict = field(default_factory=lambda: defaultdict(set))
+    touches: Dict = field(default_factory=lambda: defaultdict(set))
+    hoisting: Dict = field(default_factory=dict)
+    chunks: Dict = field(default_factory=lambda: defaultdict(list))
+
+def is_chunk_ref(node, s_chunked):
+    return isinstance(node, ArrayRef) and isinstance(node.name, ID) and node.name.name in s_chunked
 
+def entity_index(funcdef, s_entity, s_chunked=frozenset()) -> EntityIndex:
+    normalize(funcdef)
+    index = EntityIndex()
+
+    def frame(astnode, old_compound, idx_old_compound, loop_compound, loop_entity, sink):
+        if isinstance(astnode, Compound):
+            old_compound = astnode
+        # Touches inside a loop need the entity of the loop condition.
+        # The condition is visited before the body, so `loop_entity` is filled before the touches are found.
+        if isinstance(astnode, LOOP):
+            loop_compound, loop_entity = astnode.stmt, set()
+        l_child = [astnode.subscript] if is_chunk_ref(astnode, s_chunked) else node_extract(astnode)
+        return [astnode, enumerate(l_child),
+                old_compound, idx_old_compound, loop_compound, loop_entity, sink]
+
+    stack = [frame(funcdef, None, 0, None, set(), None)]
+    while stack:
+        astnode, children, old_compound, idx_old_compound, loop_compound, loop_entity, sink = stack[-1]
+        for i, node in children:
+            if isinstance(astnode, Compound):
+                idx_old_compound = i
+
+            # Evaluated at each iteration
+            is_cond = isinstance(astnode, LOOP) and node is not None and \
+                      (node is astnode.cond or node is getattr(astnode, 'next', None))
+
+            if isinstance(node, ID):
+                if node.name in s_entity:
+                    index.uses[node.name].add((old_compound, idx_old_compound))
+                    # `while (x)`: the condition is the entity itself
+                    if is_cond:
+                        loop_entity.add(node.name)
+                    elif sink is not None:
+                        sink.add(node.name)
+                continue
+
+            if isinstance(node, FuncCall) and isinstance(node.name, ID) and node.name.name.startswith('touch_'):
+                entity_touched = node.name.name.split("touch_").pop()
+                index.touches[(entity_touched, loop_compound)] |= loop_entity - set([entity_touched])
+
+            if is_chunk_ref(node, s_chunked):
+                index.chunks[node.name.name].append(node)
+
+            stack.append(frame(node, old_compound, idx_old_compound, loop_compound, loop_entity,
+                               loop_entity if is_cond else sink))
+            break
+        else:
+            stack.pop()
 
+    # Only the entities found in the function are interned, the masks stay small in a program with many entities
+    index.hoisting = entity2Compound(funcdef.body, index.uses.keys() | index.chunks.keys())
+    return index
@@ -0,0 +1,245 @@
+from irpc.bindingEntity import EntityIndex, entity_index, normalize
+from irpc.frontend import split_toplevel
+from pycparser.c_ast import Compound, ArrayRef, ID, FileAST, FuncDef, Typedef
+from pycparser import c_generator, plyparser
+from collections import defaultdict
+import hashlib
+import pickle
+import os
+import re
+
+# Cache of the parsing and of the analysis of each function (ccache-like).
+#
+# The text of a file is split in its top level declarations (see `irpc.frontend.split_toplevel`). Each one is parsed
+# alone (after a `typedef int T;` for each type declared before it), and its nodes are kept pickled: after an edit
+# only the declarations which changed are parsed again, the other ones are unpickled.
+# If a declaration cannot be parsed alone, the whole file is.
+#
+# A function is keyed by the hash of the text of its declaration (of its generated C code if it was not parsed
+# by the cache), and its entry stores:
+#    - the identifiers referenced by the function
+#    - the entity table restricted to these identifiers, at the time the index was computed
+#    - the index itself: uses, touches and hoisting (the child_adjacency_graph and parent_adjacency_graph edges),
+#      and chunks (the subscripts of the chunked entities)
+#    - the provider-call insertions (see `CommWorld.provider_insertions`), with the providers of the entities
+#      they were computed with
+#
+# Compounds (and the ArrayRef of the chunks) are stored as the path of `children()` names from the FuncDef
+# (eg: body/block_items[2]/iftrue).
+# An entry is reused only if the function didn't change and none of the entities it references appeared or vanished,
+# so after an edit only the modified functions and the ones referencing a renamed provider are recomputed.
+# The insertions are reused only if the providers of the entities used are the same.
+#
+# With a directory, the declarations and the entries of a file are stored together in one file, read once by `parse`
+# and written once by `save`. Without, they are kept in memory (the watch mode, see `irpc.watch`).
+
+_re_child = re.compile(r'(\w+)(?:\[(\d+)\])?$')
+
+# Part of the keys, changed with the parsing or the indexing: the entries of a previous version are not reused
+VERSION = 4
+
+def compound_paths(funcdef):
+    d = {}
+    l_todo = [(funcdef, '')]
+    while l_todo:
+        node, path = l_todo.pop()
+        if isinstance(node, (Compound, ArrayRef)):
+            d[node] = path
+        l_todo += [(child, f'{path}/{name}' if path else name) for name, child in node.children()]
+    return d
+
+def resolve_path(funcdef, path):
+    if path is None:
+        return None
+    node = funcdef
+    for name in path.split('/'):
+        attr, idx = _re_child.match(name).groups()
+        node = getattr(node, attr)
+        if idx is not None:
+            node = node[int(idx)]
+    return node
+
+def identifiers(funcdef):
+    s = set()
+    l_todo = [funcdef]
+    while l_todo:
+        node = l_todo.pop()
+        if isinstance(node, ID):
+            s.add(node.name)
+        l_todo += [child for _, child in node.children()]
+    return s
+
+def digest(text):
+    return hashlib.sha256(f'{VERSION}\n{text}'.encode()).hexdigest()
+
+
+class IndexCache():
+
+    def __init__(self, directory=None):
+        self.directory = directory
+        # key -> entry
+        self.d_entry = {}
+        # filename -> {key of a declaration: pickled nodes}, of the last version of the file
+        self.d_file_chunk = {}
+        # id(FuncDef) -> key, for the functions parsed by `parse` (and the ones indexed)
+        self.d_key = {}
+        # id(FuncDef) -> compound_paths, for the functions indexed in this run, until their insertions are stored
+        self.d_path = {}
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.hits = 0
+        self.misses = 0
+        self.n_parsed = 0
+        self.n_reused = 0
+
+    def key(self, funcdef):
+        # Of the function normalized
+        if id(funcdef) not in self.d_key:
+            self.d_key[id(funcdef)] = digest(c_generator.CGenerator().visit(funcdef))
+        return self.d_key[id(funcdef)]
+
+    def path(self, filename):
+        return os.path.join(self.directory, f'{digest(os.path.realpath(filename))[:32]}.pickle')
+
+    def parse(self, parser, text, filename):
+        # The FileAST of the declarations of `filename` in `text`
+        # (the other ones come from the headers, see `irpc.frontend.Preprocessor`)
+        if filename not in self.d_file_chunk:
+            self.load(filename)
+        d_chunk_old = self.d_file_chunk[filename]
+        d_chunk = {}
+        s_typedef = frozenset()
+        l_node = []
+        self.d_key = {}
+        self.d_path = {}
+        try:
+            for file, chunk in split_toplevel(text):
+                prefix = ''.join(f'typedef int {name};\n' for name in sorted(s_typedef))
+                key = digest(prefix + chunk)
+                data = d_chunk_old.get(key) or d_chunk.get(key)
+                if data:
+                    d_chunk[key] = data
+                    l = pickle.loads(data)
+                    self.n_reused += 1
+                else:
+                    l = parser.parse(prefix + chunk).ext[len(s_typedef):]
+                    self.n_parsed += 1
+                    # Kept as indexed, see `entity_index`
+                    for node in l:
+                        if isinstance(node, FuncDef):
+                            normalize(node)
+                    try:
+                        d_chunk[key] = pickle.dumps(l, protocol=pickle.HIGHEST_PROTOCOL)
+                    except RecursionError:
+                        # Too deep to be pickled, parsed at each run
+                        pass
+                l_typedef = [node.name for node in l if isinstance(node, Typedef)]
+                if l_typedef:
+                    s_typedef = s_typedef.union(l_typedef)
+                if file is None or file == filename:
+                    l_node += l
+                for node in l:
+                    self.d_key[id(node)] = key
+        except plyparser.ParseError:
+            # Not a sequence of independent declarations (eg: a K&R definition)
+            d_chunk = {}
+            self.d_key = {}
+            ast = parser.parse(text, filename)
+            l_node = [node for node in ast.ext if node.coord is None or node.coord.file in (None, filename)]
+        self.d_file_chunk[filename] = d_chunk
+        return FileAST(l_node)
+
+    def load(self, filename):
+        self.d_file_chunk[filename] = {}
+        if not self.directory:
+            return
+        try:
+            with open(self.path(filename), 'rb') as f:
+                d = pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError):
+            return
+        if d.get('version') == VERSION:
+            self.d_file_chunk[filename] = d['chunks']
+            self.d_entry.update(d['entries'])
+
+    def save(self):
+        # Write the declarations of the files parsed, and the entries of their functions
+        # (and of the functions of the last one not parsed by declaration)
+        if not self.directory:
+            return
+        for filename, d_chunk in self.d_file_chunk.items():
+            s_key = set(d_chunk) | set(self.d_key.values())
+            d = {'version': VERSION,
+                 'chunks': d_chunk,
+                 'entries': {key: self.d_entry[key] for key in s_key if key in self.d_entry}}
+            path = self.path(filename)
+            # Write then rename, so concurrent runs never see a partial file
+            tmp = f'{path}.{os.getpid()}.tmp'
+            with open(tmp, 'wb') as f:
+                pickle.dump(d, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp, path)
+
+    def entity_index(self, funcdef, s_entity, s_chunked=frozenset()) -> EntityIndex:
+        # The paths are the ones of the normalized function. The functions with a key are normalized already
+        key = self.d_key.get(id(funcdef)) or self.key(normalize(funcdef))
+        entry = self.d_entry.get(key)
+
+        if entry is not None and set(entry['entities']) == s_entity.intersection(entry['identifiers']) \
+                and set(entry['chunked']) == set(s_chunked).intersection(entry['identifiers']):
+            self.hits += 1
+            return self.load_index(funcdef, entry)
+
+        self.misses += 1
+        index = entity_index(funcdef, s_entity, s_chunked)
+        self.d_path[id(funcdef)] = compound_paths(funcdef)
+        self.d_entry[key] = self.entry(funcdef, s_entity, s_chunked, index, self.d_path[id(funcdef)])
+        return index
+
+    def insertions(self, funcdef, d_provider):
+        # The insertions stored for `funcdef` computed with the providers `d_provider` (entity -> uiid), else None.
+        # Before any of them is done: the paths are the ones of the function indexed
+        entry = self.d_entry.get(self.d_key.get(id(funcdef)))
+        if entry is None or entry.get('insertions') is None or entry['insertions'][0] != d_provider:
+            return None
+        return [(resolve_path(funcdef, path), i, l_uiid) for path, i, l_uiid in entry['insertions'][1]]
+
+    def store_insertions(self, funcdef, d_provider, l_insertion):
+        entry = self.d_entry.get(self.d_key.get(id(funcdef)))
+        if entry is not None:
+            d_path = self.d_path.pop(id(funcdef), None) or compound_paths(funcdef)
+            entry['insertions'] = (d_provider, [(d_path[c], i, l_uiid) for c, i, l_uiid in l_insertion])
+
+    @staticmethod
+    def load_index(funcdef, entry) -> EntityIndex:
+        d_compound = {}
+        def resolve(path):
+            if path not in d_compound:
+                d_compound[path] = resolve_path(funcdef, path)
+            return d_compound[path]
+
+        index = EntityIndex()
+        for entity, l_use in entry['uses'].items():
+            index.uses[entity] = {(resolve(path), i) for path, i in l_use}
+        for entity_touched, path, l_e in entry['touches']:
+            index.touches[(entity_touched, resolve(path))] = set(l_e)
+        index.hoisting = defaultdict(set, {entity: {resolve(path) for path in l_path}
+                                           for entity, l_path in entry['hoisting'].items()})
+        for entity, l_path in entry['chunks'].items():
+            index.chunks[entity] = [resolve(path) for path in l_path]
+        return index
+
+    @staticmethod
+    def entry(funcdef, s_entity, s_chunked, index, d_path):
+        s_identifier = identifiers(funcdef)
+        return {'identifiers': sorted(s_identifier),
+                'entities': sorted(s_entity & s_identifier),
+                'chunked': sorted(set(s_chunked) & s_identifier),
+                'uses': {entity: [(d_path.get(c), i) for c, i in l_use]
+                         for entity, l_use in index.uses.items()},
+                'touches': [[entity_touched, d_path.get(c), sorted(l_e)]
+                            for (entity_touched, c), l_e in index.touches.items()],
+                'hoisting': {entity: sorted(d_path[c] for c in l_c)
+                             for entity, l_c in index.hoisting.items()},
+                'chunks': {entity: [d_path[node] for node in l_node]
+                           for entity, l_node in index.chunks.items()},
+                'insertions': None}
@@ -0,0 +1,242 @@
+from irpc.arrays import parse_ext
+from pycparser import c_generator
+from pycparser.c_ast import Decl, TypeDecl, FuncDecl, PtrDecl
+import hashlib
+
+#  _
+# /  |_   _   _ |   ._   _  o ._ _|_
+# \_ | | (/_ (_ |< |_) (_) | | | |_
+#                  |
+#
+# `irp_checkpoint(path)` / `irp_restore(path)`: the memo state (the entities, their flags, the generation counters
+# and the bitmaps of the chunks) written to / read from one snapshot file.
+#
+# The layout is derived from the declarations hoisted at file scope, one region per variable:
+#
+#     header   "IRPSNAP1", hash of the layout, number of regions
+#     table    offset and size of each region
+#     regions  the bytes of each variable, 16-byte aligned. The arrays with heap or mmap storage are page aligned
+#              (size 0 if they were not allocated).
+#
+# The file is filled through a shared mapping (one memcpy per region), written in a temporary file then renamed.
+# The restore checks the header and the size of every region, then copies the regions back: the flags come back true
+# and the providers are not called again. A snapshot which cannot be restored leaves the memo state as it is.
+# An array with mmap storage is not copied: it is mapped copy-on-write from the file, and read only when used.
+# A snapshot is only restored by a program with the same layout (same entities, same types).
+
+MAGIC = 'IRPSNAP1'
+
+def decl_name(decl):
+    node = decl.type
+    while not isinstance(node, TypeDecl):
+        node = node.type
+    return node.declname
+
+def snapshot_decls(l_node, s_name):
+    # The file scope declarations of the variables to save, in a deterministic order
+    d = {decl_name(node): node for node in l_node
+         if isinstance(node, Decl) and not isinstance(node.type, FuncDecl) and decl_name(node) in s_name}
+    return [d[name] for name in sorted(d)]
+
+def bare_decl(decl):
+    # The declaration without storage nor initializer: `extern double x = 1.` and `double x` have the same layout
+    return Decl(name=decl.name, quals=decl.quals, storage=[], funcspec=[], type=decl.type, init=None, bitsize=None)
+
+def layout_hash(l_decl):
+    generator = c_generator.CGenerator()
+    text = '\n'.join(generator.visit(bare_decl(decl)) for decl in l_decl)
+    return int(hashlib.sha256(text.encode()).hexdigest()[:15], 16)
+
+def region(decl, d_array):
+    # `(struct irp_region){address, size, pointer, use_mmap}`
+    name = decl_name(decl)
+    array = d_array.get(name)
+    if array and array.storage != 'static' and isinstance(decl.type, PtrDecl):
+        use_mmap = int(array.storage == 'mmap')
+        return f'(struct irp_region){{0, ({array.size}) * sizeof(*{name}), (void **) &{name}, {use_mmap}}}'
+    return f'(struct irp_region){{&{name}, sizeof({name}), 0, 0}}'
+
+def checkpoint_definitions(l_decl, d_array):
+    n = len(l_decl)
+    l_region = '\n'.join(f'    r[{i}] = {region(decl, d_array)};' for i, decl in enumerate(l_decl))
+    layout = f'{layout_hash(l_decl):#x}UL'
+    return parse_ext(f'''
+static void irp_regions(struct irp_region *r)
+{{
+{l_region}
+}}
+
+int irp_checkpoint(const char *path)
+{{
+    struct irp_region r[{n} + 1];
+    irp_regions(r);
+    return irp_snapshot_write(path, r, {n}, {layout});
+}}
+
+int irp_restore(const char *path)
+{{
+    struct irp_region r[{n} + 1];
+    irp_regions(r);
+    return irp_snapshot_read(path, r, {n}, {layout});
+}}''')
+
+def declarations():
+    # For the users of the snapshot, the prototypes
+    return parse_ext('int irp_checkpoint(const char *path);\nint irp_restore(const char *path);')
+
+def runtime_definitions():
+    return f'''\
+#include <fcntl.h>
+#include <stdio.h>
+#include <stdlib.h>
+#include <string.h>
+#include <sys/mman.h>
+#include <sys/stat.h>
+#include <unistd.h>
+
+struct irp_region {{
+    void *address;
+    unsigned long size;
+    void **pointer;  /* heap or mmap storage: the address is *pointer */
+    int use_mmap;
+}};
+
+struct irp_snapshot_header {{
+    char magic[8];
+    unsigned long layout, n_region;
+}};
+
+static unsigned long irp_align(unsigned long offset, unsigned long alignment) {{
+    return (offset + alignment - 1) / alignment * alignment;
+}}
+
+static int irp_snapshot_write(const char *path, struct irp_region *r, unsigned long n, unsigned long layout) {{
+    unsigned long page = sysconf(_SC_PAGESIZE);
+    unsigned long *table = malloc(2 * (n + 1) * sizeof(unsigned long));
+    unsigned long offset = irp_align(sizeof(struct irp_snapshot_header) + 2 * n * sizeof(unsigned long), page);
+    for (unsigned long i = 0; i < n; i++) {{
+        if (r[i].pointer) {{
+            r[i].address = *r[i].pointer;
+            if (!r[i].address)
+                r[i].size = 0;
+            offset = irp_align(offset, page);
+        }} else
+            offset = irp_align(offset, 16);
+        table[2 * i] = offset;
+        table[2 * i + 1] = r[i].size;
+        offset += r[i].size;
+    }}
+
+    /* Unique, two processes may write the same snapshot */
+    char *tmp = malloc(strlen(path) + 32);
+    sprintf(tmp, "%s.%d.tmp", path, (int) getpid());
+    int fd = open(tmp, O_RDWR | O_CREAT | O_TRUNC, 0644);
+    char *map = MAP_FAILED;
+    if (fd >= 0 && !ftruncate(fd, offset))
+        map = mmap(NULL, offset, PROT_READ | PROT_WRITE, MAP_SHARED, fd, 0);
+    if (map == MAP_FAILED) {{
+        perror(path);
+        if (fd >= 0)
+            close(fd);
+        free(tmp);
+        free(table);
+        return -1;
+    }}
+
+    struct irp_snapshot_header header = {{"{MAGIC}", layout, n}};
+    memcpy(map, &header, sizeof(header));
+    memcpy(map + sizeof(header), table, 2 * n * sizeof(unsigned long));
+    for (unsigned long i = 0; i < n; i++)
+        memcpy(map + table[2 * i], r[i].address, r[i].size);
+    munmap(map, offset);
+    close(fd);
+    int status = rename(tmp, path);
+    if (status)
+        perror(path);
+    free(tmp);
+    free(table);
+    return status;
+}}
+
+static int irp_snapshot_read(const char *path, struct irp_region *r, unsigned long n, unsigned long layout) {{
+    int fd = open(path, O_RDONLY);
+    struct stat st;
+    if (fd < 0 || fstat(fd, &st)) {{
+        perror(path);
+        if (fd >= 0)
+            close(fd);
+        return -1;
+    }}
+    if (st.st_size < (off_t) sizeof(struct irp_snapshot_header)) {{
+        fprintf(stderr, "%s: not a snapshot of this program\\n", path);
+        close(fd);
+        return -1;
+    }}
+    char *map = mmap(NULL, st.st_size, PROT_READ, MAP_PRIVATE, fd, 0);
+    if (map == MAP_FAILED) {{
+        perror(path);
+        close(fd);
+        return -1;
+    }}
+
+    struct irp_snapshot_header *header = (struct irp_snapshot_header *) map;
+    unsigned long *table = (unsigned long *) (map + sizeof(*header));
+    unsigned long file_size = st.st_size;
+    int status = 0;
+    if (memcmp(header->magic, "{MAGIC}", 8) || header->layout != layout || header->n_region != n
+        || sizeof(*header) + 2 * n * sizeof(unsigned long) > file_size) {{
+        fprintf(stderr, "%s: not a snapshot of this program\\n", path);
+        status = -1;
+    }}
+    /* Everything is checked before the first copy: a snapshot which cannot be restored leaves the state as it is */
+    for (unsigned long i = 0; !status && i < n; i++) {{
+        unsigned long offset = table[2 * i], size = table[2 * i + 1];
+        if (offset > file_size || size > file_size - offset) {{
+            fprintf(stderr, "%s: truncated snapshot\\n", path);
+            status = -1;
+        }} else if (r[i].pointer ? size && *r[i].pointer && size != r[i].size : size != r[i].size) {{
+            fprintf(stderr, "%s: not a snapshot of this program\\n", path);
+            status = -1;
+        }}
+    }}
+    /* The storage of the arrays not allocated yet */
+    void **fresh = calloc(n + 1, sizeof(void *));
+    if (!fresh) {{
+        perror(path);
+        status = -1;
+    }}
+    for (unsigned long i = 0; !status && i < n; i++) {{
+        unsigned long offset = table[2 * i], size = table[2 * i + 1];
+        if (!r[i].pointer || !size || *r[i].pointer)
+            continue;
+        /* With mmap, copy-on-write: the pages are read from the snapshot when used */
+        fresh[i] = r[i].use_mmap ? mmap(NULL, size, PROT_READ | PROT_WRITE, MAP_PRIVATE, fd, offset) : malloc(size);
+        if (!fresh[i] || fresh[i] == MAP_FAILED) {{
+            perror(path);
+            fresh[i] = 0;
+            status = -1;
+        }}
+    }}
+    for (unsigned long i = 0; fresh && i < n; i++) {{
+        unsigned long offset = table[2 * i], size = table[2 * i + 1];
+        if (status) {{
+            if (fresh[i] && r[i].use_mmap)
+                munmap(fresh[i], size);
+            else
+                free(fresh[i]);
+        }} else if (!r[i].pointer) {{
+            memcpy(r[i].address, map + offset, size);
+        }} else if (fresh[i]) {{
+            if (!r[i].use_mmap)
+                memcpy(fresh[i], map + offset, size);
+            *r[i].pointer = fresh[i];
+        }} else if (size) {{
+            memcpy(*r[i].pointer, map + offset, size);
+        }}
+    }}
+    free(fresh);
+    munmap(map, st.st_size);
+    close(fd);
+    return status;
+}}
+'''
@@ -0,0 +1,182 @@
+from irpc.ASTfactory import guard_flag
+from pycparser.c_ast import Compound, If, For, While, DoWhile, Switch, Case, Default, FuncCall, ID, Goto, Label, \
+    Break, Continue, Return, Constant, BinaryOp, Assignment, DeclList
+import operator
+
+#  _                                   _
+# |_)  _   _| |_|  _|  _. ._ _|_    /\ (_   _. ._ _|
+# | \ (/_ (_|   | (_| (_| | | |_   /--\ __) (_| | | (_|
+#
+# `insert_provider_calls` put a guard before every use of an entity. Many of them are useless:
+#   - a guard dominated by a guard of the same flag, with no touch of a parent in between, is always false
+#   - a guard on top of a loop body, whose flag is not reset by any touch of the loop, is loop invariant.
+#     It is hoisted only if the body is run at least once (see `runs_once`), and reached before any break, continue
+#     or return: the provider is not called if the program would not have called it.
+#
+# This is a forward dataflow on the structured control flow of the function:
+# `available` is the set of flags known to be true at the current statement.
+#   - a guard of flag f: f become available
+#   - a touch_x: the flags of every (transitive) dependent of x are killed
+#   - a guard whose provider touches something: kill the flags touched
+#   - if/else: intersection of both branches
+#   - loop / switch: entry and exit are what is available before, minus all the flags killed anywhere in the loop
+#
+# Functions with goto / label are left untouched. Touches done inside user functions are not seen.
+
+class GuardEliminator():
+
+    def __init__(self, d_touch_kill, d_guard_kill):
+        # touched entity -> flags reset
+        self.d_touch_kill = d_touch_kill
+        # guard flag -> flags reset by the call of the provider
+        self.d_guard_kill = d_guard_kill
+        self.d_kill = {}
+        self.n_removed = 0
+        self.n_hoisted = 0
+
+    def kill(self, node):
+        # All the flags which may be reset by executing `node`
+        if node is None or isinstance(node, str):
+            return frozenset()
+        if node in self.d_kill:
+            return self.d_kill[node]
+
+        s = set()
+        flag = guard_flag(node)
+        if flag:
+            s |= self.d_guard_kill.get(flag, set())
+        elif isinstance(node, FuncCall) and isinstance(node.name, ID) and node.name.name.startswith('touch_'):
+            s |= self.d_touch_kill.get(node.name.name.split("touch_").pop(), set())
+        for _, child in node.children():
+            s |= self.kill(child)
+
+        s = self.d_kill[node] = frozenset(s)
+        return s
+
+    def run(self, funcdef):
+        if any(isinstance(node, (Goto, Label)) for node in walk(funcdef)):
+            return
+        self.hoist(funcdef.body)
+        self.eliminate(funcdef.body, frozenset())
+
+    #
+    # Loop invariant guards
+    #
+    def hoist(self, node):
+        for l_node in nested_lists(node):
+            l_node[:] = self.hoist_list(l_node)
+
+    def hoist_list(self, l_node):
+        l = []
+        for node in l_node:
+            # Innermost loops first, so a guard can go through many levels
+            self.hoist(node)
+            if isinstance(node, (For, While, DoWhile)) and isinstance(node.stmt, Compound) and runs_once(node):
+                s_kill = self.kill(node)
+                body = node.stmt.block_items or []
+                i_jump = next((i for i, n in enumerate(body) if any(isinstance(c, JUMP) for c in walk(n))), len(body))
+                l_invariant = [n for n in body[:i_jump]
+                               if guard_flag(n) and guard_flag(n) not in s_kill and not self.kill(n)]
+                if l_invariant:
+                    node.stmt.block_items = [n for n in body if not any(n is i for i in l_invariant)]
+                    l += l_invariant
+                    self.n_hoisted += len(l_invariant)
+            l.append(node)
+        return l
+
+    #
+    # Dominated guards
+    #
+    def eliminate(self, node, available):
+        if isinstance(node, Compound):
+            node.block_items, available = self.eliminate_list(node.block_items or [], available)
+            return available
+        elif isinstance(node, If):
+            available = available - self.kill(node.cond)
+            available_true = self.eliminate(node.iftrue, available)
+            available_false = self.eliminate(node.iffalse, available) if node.iffalse else available
+            return available_true & available_false
+        elif isinstance(node, (For, While, DoWhile)):
+            available = available - self.kill(node)
+            self.eliminate(node.stmt, available)
+            return available
+        elif isinstance(node, Switch):
+            # Any case can be entered from the switch, or by fall through
+            available = available - self.kill(node)
+            for n in (node.stmt.block_items or [] if isinstance(node.stmt, Compound) else [node.stmt]):
+                if isinstance(n, (Case, Default)):
+                    n.stmts, _ = self.eliminate_list(n.stmts or [], available)
+                else:
+                    self.eliminate(n, available)
+            return available
+        else:
+            return available - self.kill(node)
+
+    def eliminate_list(self, l_node, available):
+        l = []
+        for node in l_node:
+            flag = guard_flag(node)
+            if flag and flag in available:
+                self.n_removed += 1
+                continue
+            l.append(node)
+            if flag:
+                available = (available - self.kill(node)) | {flag}
+            else:
+                available = self.eliminate(node, available)
+        return l, available
+
+
+JUMP = (Break, Continue, Return, Goto)
+
+COMPARE = {'<': operator.lt, '<=': operator.le, '>': operator.gt, '>=': operator.ge, '!=': operator.ne}
+
+def constant(node):
+    # The value of an integer constant, None if `node` is not one
+    if not isinstance(node, Constant) or node.type not in ('int', 'unsigned int', 'long int', 'unsigned long int'):
+        return None
+    value = node.value.rstrip('uUlL')
+    base = 16 if value[:2].lower() == '0x' else 8 if value[:1] == '0' else 10
+    try:
+        return int(value, base)
+    except ValueError:
+        return None
+
+def runs_once(loop):
+    # The body of the loop is run at least once: a do while, a loop without condition or with a constant one not zero,
+    # or `for (i = a; i < b; ...)` with constants making the condition true
+    if isinstance(loop, DoWhile) or loop.cond is None:
+        return True
+    if constant(loop.cond) is not None:
+        return constant(loop.cond) != 0
+    cond = loop.cond
+    if not isinstance(loop, For) or not isinstance(cond, BinaryOp) or cond.op not in COMPARE \
+            or not isinstance(cond.left, ID) or constant(cond.right) is None:
+        return False
+    init = loop.init
+    if isinstance(init, DeclList) and len(init.decls) == 1:
+        name, value = init.decls[0].name, init.decls[0].init
+    elif isinstance(init, Assignment) and init.op == '=' and isinstance(init.lvalue, ID):
+        name, value = init.lvalue.name, init.rvalue
+    else:
+        return False
+    return name == cond.left.name and constant(value) is not None and COMPARE[cond.op](constant(value), constant(cond.right))
+
+def walk(node):
+    l_todo = [node]
+    while l_todo:
+        node = l_todo.pop()
+        yield node
+        l_todo += [child for _, child in node.children()]
+
+def nested_lists(node):
+    # The statement lists directly inside `node`
+    if isinstance(node, Compound):
+        return [node.block_items] if node.block_items else []
+    elif isinstance(node, (Case, Default)):
+        return [node.stmts] if node.stmts else []
+    elif isinstance(node, If):
+        return [l for n in (node.iftrue, node.iffalse) if n for l in nested_lists(n)]
+    elif isinstance(node, (For, While, DoWhile, Switch)):
+        return nested_lists(node.stmt)
+    return []
@@ -0,0 +1,205 @@
+from pycparser import c_parser, plyparser
+from pycparser.c_ast import Typedef
+import subprocess
+import threading
+import os
+import re
+
+def remove_headers(filename):
+    l_header = ['#include <stdbool.h>\n']
+    trim_file = []
+    with open(filename, 'r') as f:
+        for line in f:
+            if 'stdbool' in line:
+                continue
+            a = l_header if line.startswith("#include") else trim_file
+            a.append(line)
+    return map("".join, (l_header, trim_file))
+
+#  _
+# /  ._  ._
+# \_ |_) |_)
+#    |   |
+#
+# `remove_headers` drops the #include lines and parses the rest as is: no macros, no typedefs from the headers.
+# `Preprocessor` runs the real C preprocessor instead:
+#
+#   - The system headers (#include <...>) of a file are preprocessed and parsed once per run for each set of them.
+#     What is kept is a small prelude: one `typedef int name;` per type they declare (all the parser needs)
+#     and the macros they define. The same prelude is reused by all the files including the same headers.
+#   - The file itself is streamed to cpp after the prelude, its system includes replaced by empty lines.
+#     A `#line` directive maps it back to the original file, so the coordinates of the AST are the ones of the source.
+#   - Only the nodes coming from the file are kept. The #include lines are emitted again in the generated code.
+#
+# Without fake libc headers (pycparser/utils/fake_libc_include), the GNU extensions
+# of the system headers are defined away so pycparser can parse them.
+
+_re_include = re.compile(r'\s*#\s*include\b')
+_re_system_include = re.compile(r'\s*#\s*include\s*<')
+
+GNU_DEFINES = ['-D__attribute__(x)=', '-D__asm__(x)=', '-D__extension__=', '-D__restrict=', '-D__inline=',
+               '-D__builtin_va_list=int', '-D_Float128=double']
+
+class Preprocessor():
+
+    def __init__(self, cpp_path='cpp', cpp_args=(), fake_libc=None):
+        self.cpp_path = cpp_path
+        self.cpp_args = list(cpp_args) + (['-I', fake_libc] if fake_libc else GNU_DEFINES)
+        # system #include lines -> prelude
+        self.d_prelude = {}
+
+    def cpp(self, args, text):
+        result = subprocess.run([self.cpp_path] + self.cpp_args + args + ['-'], input=text,
+                                stdout=subprocess.PIPE, universal_newlines=True, check=True)
+        return result.stdout
+
+    def prelude(self, l_include):
+        key = tuple(l_include)
+        if key not in self.d_prelude:
+            text = ''.join(l_include)
+            try:
+                ast = c_parser.CParser().parse(self.cpp([], text), '<headers>')
+            except plyparser.ParseError as e:
+                raise ValueError(f'Cannot parse the system headers ({e}), try fake libc headers') from e
+            l_typedef = [f'typedef int {node.name};\n' for node in ast.ext if isinstance(node, Typedef)]
+            # The macros predefined by cpp would be defined twice
+            s_predefined = set(self.cpp(['-dM'], '').splitlines())
+            l_define = [line + '\n' for line in self.cpp(['-dM'], text).splitlines() if line not in s_predefined]
+            self.d_prelude[key] = ''.join(l_typedef + l_define)
+        return self.d_prelude[key]
+
+    @staticmethod
+    def includes(filename):
+        # The #include lines to emit again, and the system ones to preprocess in the prelude
+        l_header = ['#include <stdbool.h>\n']
+        l_include = []
+        with open(filename) as f:
+            for line in f:
+                if _re_include.match(line) and 'stdbool' not in line:
+                    l_header.append(line)
+                if _re_system_include.match(line):
+                    l_include.append(line)
+        return l_header, l_include
+
+    def preprocess(self, filename):
+        # The #include lines, and the text to parse: the prelude then `filename`, after a `#line` directive
+        l_header, l_include = self.includes(filename)
+        prelude = self.prelude(l_include)
+
+        args = [self.cpp_path] + self.cpp_args + ['-iquote', os.path.dirname(filename) or '.', '-']
+        process = subprocess.Popen(args, stdin=subprocess.PIPE, stdout=subprocess.PIPE, universal_newlines=True)
+
+        def feed():
+            # In a thread: cpp may fill its output before having read all its input
+            try:
+                process.stdin.write(prelude)
+                process.stdin.write(f'#line 1 "{filename}"\n')
+                with open(filename) as f:
+                    for line in f:
+                        process.stdin.write('\n' if _re_system_include.match(line) else line)
+                process.stdin.close()
+            except BrokenPipeError:
+                pass
+
+        writer = threading.Thread(target=feed)
+        writer.start()
+        text = process.stdout.read()
+        writer.join()
+        if process.wait():
+            raise subprocess.CalledProcessError(process.returncode, args)
+        return ''.join(l_header), text
+
+    def parse(self, filename, parser=None):
+        # Same return as `remove_headers`, but the AST (only the nodes of `filename`) instead of the text
+        headers, text = self.preprocess(filename)
+        ast = (parser or c_parser.CParser()).parse(text, filename)
+        ast.ext = [node for node in ast.ext if node.coord is None or node.coord.file == filename]
+        return headers, ast
+
+_re_line_marker = re.compile(r'#\s*(?:line\s+)?\d+\s+"([^"]*)"')
+# The characters without meaning for the split, skipped a run at a time
+_re_blank = re.compile(r'[ \t\r\f\v]+')
+_re_plain = re.compile(r'[^\s#/"\'{}=;]+')
+
+def split_toplevel(text):
+    # The top level declarations of a C text: [(file, chunk)].
+    # Each chunk has the preprocessor lines before its declaration,
+    # `file` is the one of the last line marker (`# 12 "a.c"`) before the declaration, None without marker.
+    l_chunk = []
+    file = None
+    start = i = depth = 0
+    chunk_file = None
+    function_body = initializer = False
+    last = ''          # last significant character at depth 0
+    line_start = True  # only spaces since the last new line
+    n = len(text)
+    while i < n:
+        c = text[i]
+        if c == '\n':
+            line_start = True
+            i += 1
+            continue
+        if c in ' \t\r\f\v':
+            i = _re_blank.match(text, i).end()
+            continue
+        match = _re_plain.match(text, i)
+        if match:
+            if depth == 0:
+                if last == '':
+                    chunk_file = file
+                last = text[match.end() - 1]
+            line_start = False
+            i = match.end()
+            continue
+        if c == '#' and line_start:
+            end = i
+            while True:
+                end = text.find('\n', end)
+                if end < 0:
+                    end = n
+                    break
+                if text[end - 1] != '\\':
+                    break
+                end += 1
+            match = _re_line_marker.match(text, i, end)
+            if match:
+                file = match.group(1)
+            i = end
+            continue
+        line_start = False
+        if text.startswith('//', i):
+            i = text.find('\n', i)
+            i = n if i < 0 else i
+            continue
+        if text.startswith('/*', i):
+            i = text.find('*/', i + 2)
+            i = n if i < 0 else i + 2
+            continue
+
+        if last == '' and depth == 0:
+            chunk_file = file
+        if c in '"\'':
+            i += 1
+            while i < n and text[i] != c:
+                i += 2 if text[i] == '\\' else 1
+        elif c == '{':
+            if depth == 0:
+                # `f(...) {`: a function body. Not `= (type){...}`, a compound literal
+                function_body = last == ')' and not initializer
+            depth += 1
+        elif c == '}':
+            depth -= 1
+        elif c == '=' and depth == 0:
+            initializer = True
+        if depth == 0 and (c == ';' or c == '}' and function_body):
+            l_chunk.append((chunk_file, text[start:i + 1]))
+            start = i + 1
+            last = ''
+            function_body = initializer = False
+        elif depth == 0:
+            last = c
+        i += 1
+
+    if text[start:].strip():
+        l_chunk.append((file, text[start:]))
+    return l_chunk
@@ -0,0 +1,178 @@
+from irpc.instrument import read_profile
+import json
+
+#  __
+# /__ ._ _. ._  |_
+# \_| | (_| |_) | |
+#           |
+#
+# The dependency graph of the providers (`CommWorld.d_provider_parents`), for `irpc.py graph`:
+#   - exported as DOT (edges from the parent to the provider using it) or as JSON
+#   - its shape: depth (longest chain of providers), width (most providers at the same depth), fan-in / fan-out
+#   - its cycles (strongly connected components), the program cannot be generated with them
+#   - with a profile of an `--instrument` run: the critical path, the chain of providers with the largest
+#     exclusive time, and the available parallelism, total time / critical path time.
+#
+# A cycle is collapsed in one node for the depth and the critical path. Everything is linear in the size of the graph.
+
+def strongly_connected_components(d_parent):
+    # Tarjan, with an explicit stack. The components come each one after the components of its parents.
+    d_index, d_low = {}, {}
+    l_stack, s_stack = [], set()
+    l_component = []
+    for root in sorted(d_parent):
+        if root in d_index:
+            continue
+        l_todo = [(root, iter(sorted(d_parent[root])))]
+        d_index[root] = d_low[root] = len(d_index)
+        l_stack.append(root)
+        s_stack.add(root)
+        while l_todo:
+            node, it_parent = l_todo[-1]
+            parent = next(it_parent, None)
+            if parent is not None:
+                if parent not in d_index:
+                    d_index[parent] = d_low[parent] = len(d_index)
+                    l_stack.append(parent)
+                    s_stack.add(parent)
+                    l_todo.append((parent, iter(sorted(d_parent.get(parent, ())))))
+                elif parent in s_stack:
+                    d_low[node] = min(d_low[node], d_index[parent])
+                continue
+            l_todo.pop()
+            if l_todo:
+                child = l_todo[-1][0]
+                d_low[child] = min(d_low[child], d_low[node])
+            if d_low[node] == d_index[node]:
+                component = []
+                while True:
+                    member = l_stack.pop()
+                    s_stack.remove(member)
+                    component.append(member)
+                    if member == node:
+                        break
+                l_component.append(sorted(component))
+    return l_component
+
+def d_children(d_parent):
+    d = {uiid: set() for uiid in d_parent}
+    for uiid, s_parent in d_parent.items():
+        for parent in s_parent:
+            d.setdefault(parent, set()).add(uiid)
+    return d
+
+def critical_path(d_parent, d_weight, l_component=None):
+    # The chain of providers with the largest total weight, and this weight
+    if l_component is None:
+        l_component = strongly_connected_components(d_parent)
+    d_component = {uiid: i for i, component in enumerate(l_component) for uiid in component}
+    l_best, l_previous = [], []
+    for i, component in enumerate(l_component):
+        s_parent = {d_component[p] for uiid in component for p in d_parent.get(uiid, ())} - {i}
+        previous = max(s_parent, key=lambda j: (l_best[j], -j), default=None)
+        l_best.append(sum(d_weight.get(uiid, 0.) for uiid in component) + (l_best[previous] if previous is not None else 0.))
+        l_previous.append(previous)
+
+    i = max(range(len(l_component)), key=lambda j: (l_best[j], -j), default=None)
+    if i is None:
+        return [], 0.
+    span = l_best[i]
+    l_path = []
+    while i is not None:
+        l_path += reversed(l_component[i])
+        i = l_previous[i]
+    return l_path[::-1], span
+
+def statistics(d_parent, d_weight=None):
+    l_component = strongly_connected_components(d_parent)
+    d_child = d_children(d_parent)
+
+    # Depth of each component: 1 + the one of its deepest parent
+    d_component = {uiid: i for i, component in enumerate(l_component) for uiid in component}
+    l_depth = []
+    for i, component in enumerate(l_component):
+        s_parent = {d_component[p] for uiid in component for p in d_parent.get(uiid, ())} - {i}
+        l_depth.append(1 + max((l_depth[j] for j in s_parent), default=0))
+    d_width = {}
+    for i, component in enumerate(l_component):
+        d_width[l_depth[i]] = d_width.get(l_depth[i], 0) + len(component)
+
+    def extremum(d_edge):
+        uiid = max(sorted(d_edge), key=lambda u: len(d_edge[u]), default=None)
+        return (len(d_edge[uiid]), uiid) if uiid is not None else (0, None)
+
+    n_edge = sum(len(s_parent) for s_parent in d_parent.values())
+    d = {
+        'providers': len(d_parent),
+        'edges': n_edge,
+        'roots': sum(1 for s_parent in d_parent.values() if not s_parent),
+        'leaves': sum(1 for s_child in d_child.values() if not s_child),
+        'depth': max(l_depth, default=0),
+        'width': max(d_width.values(), default=0),
+        'max_fan_in': extremum(d_parent),
+        'max_fan_out': extremum(d_child),
+        'mean_fan_out': n_edge / len(d_parent) if d_parent else 0.,
+        'cycles': [component for component in l_component
+                   if len(component) > 1 or component[0] in d_parent.get(component[0], ())],
+    }
+    if d_weight is not None:
+        l_path, span = critical_path(d_parent, d_weight, l_component)
+        work = sum(d_weight.get(uiid, 0.) for uiid in d_parent)
+        d['work'] = work
+        d['critical_path'] = l_path
+        d['span'] = span
+        d['parallelism'] = work / span if span else 1.
+    return d
+
+def profile_weights(path):
+    # uiid -> exclusive time (ns) of all its invocations, from the `irp_profile.json` of an instrumented run
+    return {uiid: float(stat['exclusive_ns']) for uiid, stat in read_profile(path).items()}
+
+def report(d_stat, file):
+    for name in ('providers', 'edges', 'roots', 'leaves', 'depth', 'width'):
+        print(f'{name:<24} {d_stat[name]}', file=file)
+    for name in ('max_fan_in', 'max_fan_out'):
+        n, uiid = d_stat[name]
+        print(f'{name:<24} {n}' + (f' ({uiid})' if uiid is not None else ''), file=file)
+    print(f'{"mean_fan_out":<24} {d_stat["mean_fan_out"]:.2f}', file=file)
+    print(f'{"cycles":<24} {len(d_stat["cycles"])}', file=file)
+    for component in d_stat['cycles']:
+        print(f'    {", ".join(component)}', file=file)
+    if 'critical_path' in d_stat:
+        print(f'{"work":<24} {1e-9 * d_stat["work"]:.6f} s', file=file)
+        print(f'{"span":<24} {1e-9 * d_stat["span"]:.6f} s', file=file)
+        print(f'{"parallelism":<24} {d_stat["parallelism"]:.2f}', file=file)
+        print(f'{"critical_path":<24} {" -> ".join(d_stat["critical_path"])}', file=file)
+
+def to_dot(d_parent, d_entity, s_reachable, d_weight=None, l_critical=()):
+    # `d_entity`: uiid -> entities provided. The unreachable providers are dashed, the critical path is red.
+    s_critical = set(l_critical)
+    s_critical_edge = set(zip(l_critical, l_critical[1:]))
+    l_line = ['digraph irp {', '    rankdir=LR;', '    node [shape=box];']
+    for uiid in sorted(d_parent):
+        label = ', '.join(sorted(d_entity.get(uiid, (uiid,))))
+        if d_weight is not None:
+            label += f'\\n{1e-6 * d_weight.get(uiid, 0.):.3f} ms'
+        l_attr = [f'label="{label}"']
+        if uiid not in s_reachable:
+            l_attr.append('style=dashed')
+        if uiid in s_critical:
+            l_attr.append('color=red')
+        l_line.append(f'    "{uiid}" [{", ".join(l_attr)}];')
+    for uiid in sorted(d_parent):
+        for parent in sorted(d_parent[uiid]):
+            critical = ' [color=red]' if (parent, uiid) in s_critical_edge else ''
+            l_line.append(f'    "{parent}" -> "{uiid}"{critical};')
+    l_line.append('}')
+    return '\n'.join(l_line) + '\n'
+
+def to_json(d_parent, d_entity, s_reachable, d_stat, d_weight=None):
+    l_node = []
+    for uiid in sorted(d_parent):
+        node = {'id': uiid, 'entities': sorted(d_entity.get(uiid, (uiid,))),
+                'parents': sorted(d_parent[uiid]), 'reachable': uiid in s_reachable}
+        if d_weight is not None:
+            node['exclusive_ns'] = d_weight.get(uiid, 0.)
+        l_node.append(node)
+    stat = dict(d_stat, max_fan_in=list(d_stat['max_fan_in']), max_fan_out=list(d_stat['max_fan_out']))
+    return json.dumps({'nodes': l_node, 'statistics': stat}, indent=1) + '\n'
@@ -0,0 +1,73 @@
+from irpc.ASTfactory import guard_flag
+from irpc.dominance import walk
+from pycparser.c_ast import Compound, Decl, FuncDef, FuncCall, ID, Return, Goto, Label
+
+#  ___
+#   |  ._  | o ._   _
+#  _|_ | | | | | | (/_
+#
+# Profile guided placement of the guards and inlining of the providers, from the `irp_profile.json`
+# of an `--instrument` run (see `irpc.instrument`):
+#   - a provider is hot when its guards are evaluated at least HOT times (hits + misses). Its guards are inserted
+#     where `entity2Compound` hoists the entity: once before the loop, or the if/else, using it (see
+#     `CommWorld.guarded_uses`), instead of before each use. The provider may be called even if the uses are not
+#     reached, the cold ones are still guarded at each use.
+#   - a provider is small and hot when it ran at least HOT times, less than SMALL_NS each time (exclusive time).
+#     If it is called by one guard only, its body replaces the call, and its function is removed.
+#
+# A body is not inlined if it returns or jumps, or if it uses a global shadowed by a variable of the function
+# it is inlined in.
+
+HOT = 1000
+SMALL_NS = 1000.
+
+def hot_guards(d_profile):
+    # uiid of the providers whose guards are evaluated at least HOT times
+    return {uiid for uiid, stat in d_profile.items() if stat['hits'] + stat['misses'] >= HOT}
+
+def small_hot_providers(d_profile):
+    return {uiid for uiid, stat in d_profile.items()
+            if stat['invocations'] >= HOT and stat['exclusive_ns'] <= SMALL_NS * stat['invocations']}
+
+def declared_names(node):
+    return {n.name for n in walk(node) if isinstance(n, Decl)}
+
+def guarded_call(funcdef, provider, flag):
+    # (list, index) of the only reference to `provider` in `funcdef`, if it is a call in a guard of `flag`, else None.
+    # And the number of references
+    l_found = []
+    n = 0
+    for node in walk(funcdef):
+        if isinstance(node, ID) and node.name == provider:
+            n += 1
+        if guard_flag(node) == flag and isinstance(node.iftrue, Compound):
+            l_node = node.iftrue.block_items or []
+            l_found += [(l_node, i) for i, child in enumerate(l_node)
+                        if isinstance(child, FuncCall) and isinstance(child.name, ID) and child.name.name == provider]
+    return (l_found[0] if len(l_found) == 1 else None), n
+
+def inline_provider(context, funcdef, flag):
+    # Replace the only call of the provider `funcdef` by its body. Return if it was inlined
+    provider = funcdef.decl.name
+    if any(isinstance(node, (Return, Goto, Label)) for node in walk(funcdef.body)):
+        return False
+
+    l_call = []
+    n = 0
+    for caller in context:
+        if caller is funcdef or not isinstance(caller, FuncDef):
+            continue
+        call, n_caller = guarded_call(caller, provider, flag)
+        n += n_caller
+        if call:
+            l_call.append((caller, call))
+    if n != 1 or len(l_call) != 1:
+        return False
+
+    caller, (l_node, i) = l_call[0]
+    s_global = {node.name for node in walk(funcdef.body) if isinstance(node, ID)} - declared_names(funcdef.body)
+    if s_global & declared_names(caller):
+        return False
+    l_node[i] = funcdef.body
+    context[:] = [node for node in context if node is not funcdef]
+    return True
@@ -0,0 +1,161 @@
+from irpc.ASTfactory import ASTfactory, function_definition_node
+from pycparser.c_ast import FuncCall, ExprList, ID, ArrayRef, StructRef, Assignment
+import json
+
+#  _
+# |_) ._ _  _|_ o |  _
+# |   | (_) |   | | (/_
+#
+# Runtime profile of the generated program, to know which entities dominate the runtime
+# and which touches trigger the recomputations.
+#
+# Each provider (and each touched entity) has a slot in `irp_stats`:
+#   - invocations: number of times the provider ran
+#   - misses / hits: guards which had to call the provider / found the entity already provided
+#   - recomputes: invocations after the first one (the entity was invalidated by a touch)
+#   - touches: calls of the touch function of the entity
+#   - recomputes_caused: recomputations of the dependents invalidated by this touch. The touch function records
+#     itself as the `cause` of each of them, cleared once the dependent is provided again
+#   - inclusive / exclusive: time spent in the provider, with / without the parent providers it called
+#
+# The provider `provide_x` is renamed `irp_provide_x`, and a new `provide_x` calls it between
+# `irp_enter` and `irp_leave`, so early returns are timed too. The guards count the hits and misses
+# (see `InstrumentedASTfactory`), the touch functions call `irp_touch`.
+#
+# At exit the report is written as JSON in $IRP_PROFILE (default: irp_profile.json).
+# If $IRP_FOLDED is set, one line per provider invocation is written there in the folded-stack format
+# of flamegraph.pl (`main;x_next;f 1250`, exclusive time in ns).
+
+DEFAULT_PROFILE = 'irp_profile.json'
+
+def read_profile(path):
+    # uiid (or touched entity) -> {'invocations': ..., 'exclusive_ns': ...}, the report written at exit
+    with open(path) as f:
+        return json.load(f)
+
+def runtime_declarations(l_name):
+    l_enum = ', '.join([ASTfactory(name).stat_name for name in l_name] + ['irp_n_stat'])
+    return f'''\
+#include <stdio.h>
+#include <stdlib.h>
+#include <time.h>
+
+struct irp_stat {{
+    const char *name;
+    unsigned long invocations, misses, hits, recomputes, touches, recomputes_caused;
+    double inclusive, exclusive;
+    int cause;  /* the touch which invalidated the entity, -1 if none */
+}};
+enum {{ {l_enum} }};
+extern struct irp_stat irp_stats[irp_n_stat];
+void irp_enter(int);
+void irp_leave(int);
+void irp_touch(int);
+'''
+
+def runtime_definitions(l_name):
+    l_init = ', '.join(f'{{"{name}"}}' for name in l_name)
+    return f'''\
+struct irp_stat irp_stats[irp_n_stat] = {{ {l_init} }};
+
+#define IRP_MAX_DEPTH 1024
+static int irp_depth = 0;
+static int irp_stack[IRP_MAX_DEPTH];
+static double irp_start[IRP_MAX_DEPTH], irp_children[IRP_MAX_DEPTH];
+static FILE *irp_folded = NULL;
+
+static double irp_now(void) {{
+    struct timespec t;
+    clock_gettime(CLOCK_MONOTONIC, &t);
+    return t.tv_sec + 1e-9 * t.tv_nsec;
+}}
+
+void irp_enter(int i) {{
+    if (irp_stats[i].invocations++) {{
+        irp_stats[i].recomputes++;
+        if (irp_stats[i].cause >= 0)
+            irp_stats[irp_stats[i].cause].recomputes_caused++;
+    }}
+    irp_stats[i].cause = -1;
+    if (irp_depth == IRP_MAX_DEPTH) {{
+        fprintf(stderr, "irp: providers nested deeper than %d\\n", IRP_MAX_DEPTH);
+        exit(1);
+    }}
+    irp_stack[irp_depth] = i;
+    irp_children[irp_depth] = 0.;
+    irp_start[irp_depth++] = irp_now();
+}}
+
+void irp_leave(int i) {{
+    double t = irp_now() - irp_start[--irp_depth];
+    double self = t - irp_children[irp_depth];
+    irp_stats[i].inclusive += t;
+    irp_stats[i].exclusive += self;
+    if (irp_depth)
+        irp_children[irp_depth - 1] += t;
+    if (irp_folded) {{
+        fputs("main", irp_folded);
+        for (int d = 0; d <= irp_depth; d++)
+            fprintf(irp_folded, ";%s", irp_stats[irp_stack[d]].name);
+        fprintf(irp_folded, " %.0f\\n", 1e9 * self);
+    }}
+}}
+
+void irp_touch(int i) {{
+    irp_stats[i].touches++;
+}}
+
+static void irp_report(void) {{
+    const char *path = getenv("IRP_PROFILE");
+    FILE *f = fopen(path ? path : "{DEFAULT_PROFILE}", "w");
+    if (irp_folded)
+        fclose(irp_folded);
+    if (!f)
+        return;
+    fputs("{{", f);
+    for (int i = 0; i < irp_n_stat; i++) {{
+        struct irp_stat *s = &irp_stats[i];
+        fprintf(f, "%s\\n  \\"%s\\": {{\\"invocations\\": %lu, \\"misses\\": %lu, \\"hits\\": %lu, "
+                   "\\"recomputes\\": %lu, \\"touches\\": %lu, \\"recomputes_caused\\": %lu, "
+                   "\\"inclusive_ns\\": %.0f, \\"exclusive_ns\\": %.0f}}",
+                i ? "," : "", s->name, s->invocations, s->misses, s->hits,
+                s->recomputes, s->touches, s->recomputes_caused, 1e9 * s->inclusive, 1e9 * s->exclusive);
+    }}
+    fputs("\\n}}\\n", f);
+    fclose(f);
+}}
+
+__attribute__((constructor)) static void irp_profile_init(void) {{
+    const char *path = getenv("IRP_FOLDED");
+    for (int i = 0; i < irp_n_stat; i++)
+        irp_stats[i].cause = -1;
+    if (path)
+        irp_folded = fopen(path, "w");
+    atexit(irp_report);
+}}
+'''
+
+def stat_call(function, name):
+    return FuncCall(name=ID(name=function), args=ExprList(exprs=[ID(name=ASTfactory(name).stat_name)]))
+
+def instrument_provider(funcdef, name):
+    # Rename the provider `irp_provide_x` and return the timed `provide_x` calling it
+    provider = funcdef.decl.name
+    renamed = f'irp_{provider}'
+    funcdef.decl.name = renamed
+    funcdef.decl.type.type.declname = renamed
+    funcdef.decl.storage = ['static']
+    return function_definition_node(provider, [stat_call('irp_enter', name),
+                                               FuncCall(name=ID(name=renamed), args=None),
+                                               stat_call('irp_leave', name)])
+
+def cause_node(name, dependent):
+    # `irp_stats[irp_stat_dependent].cause = irp_stat_name;`
+    stat = ArrayRef(name=ID(name='irp_stats'), subscript=ID(name=ASTfactory(dependent).stat_name))
+    return Assignment(op='=', lvalue=StructRef(name=stat, type='.', field=ID(name='cause')),
+                      rvalue=ID(name=ASTfactory(name).stat_name))
+
+def instrument_touch(funcdef, name, l_dependent=()):
+    # `l_dependent`: the slots of the providers invalidated by the touch, their next invocation is caused by it
+    funcdef.body.block_items = [stat_call('irp_touch', name)] + [cause_node(name, d) for d in l_dependent] \
+                               + (funcdef.body.block_items or [])
@@ -0,0 +1,83 @@
+from irpc.ASTfactory import guard_flag
+from irpc.dominance import walk
+from pycparser.c_ast import Pragma, Compound, Case, Default, Decl, FuncDef, FuncDecl, TypeDecl, IdentifierType, Assignment, FuncCall, ExprList, ID, Return, Constant
+
+#  _                   ___
+# / \ ._   _  ._ |\/|  |_)
+# \_/ |_) (/_ | ||  |  |
+#     |
+#
+# Consecutive guards are independent call of providers:
+#     each of them become a task, ordered with `depend` clauses derived from the provider graph
+#     (the tasks are created in the topological order of the providers, so an `in` follows its `out`),
+#     followed by a taskwait so the entities are available for the next statement.
+# The guards need to be thread safe (see `OpenMPASTfactory`), two tasks may need the same parent.
+#
+# The original main is renamed and called inside a parallel region (by only one thread),
+# so the tasks created anywhere in the program have a team to run on.
+
+def insert_tasks(funcdef, depend, rank):
+    # `depend(flag, l_flag)`: the pragma of the task of the guard of `flag`, given all the flags of the group
+    # `rank(flag)`: the position of its provider in the topological order
+    n = 0
+    for node in walk(funcdef):
+        if isinstance(node, Compound) and node.block_items:
+            node.block_items, n_task = tasks_list(node.block_items, depend, rank)
+        elif isinstance(node, (Case, Default)) and node.stmts:
+            node.stmts, n_task = tasks_list(node.stmts, depend, rank)
+        else:
+            continue
+        n += n_task
+    return n
+
+def tasks_list(l_node, depend, rank):
+    l, l_group, n = [], [], 0
+
+    def flush():
+        nonlocal n
+        if len(l_group) < 2:
+            l.extend(l_group)
+        else:
+            l_group.sort(key=lambda g: rank(guard_flag(g)))
+            l_flag = [guard_flag(g) for g in l_group]
+            for flag, guard in zip(l_flag, l_group):
+                l.extend([Pragma(depend(flag, l_flag)), guard])
+            l.append(Pragma('omp taskwait'))
+            n += len(l_group)
+        l_group.clear()
+
+    for node in l_node:
+        if guard_flag(node):
+            l_group.append(node)
+        else:
+            flush()
+            l.append(node)
+    flush()
+    return l, n
+
+def parallel_main(main):
+    # Rename `main` into `irp_main`, and return a new main calling it in a parallel region
+    args = main.decl.type.args
+    l_arg = [ID(name=p.name) for p in (args.params if args else []) if isinstance(p, Decl)]
+
+    main.decl.name = 'irp_main'
+    main.decl.type.type.declname = 'irp_main'
+    # Reaching the end of main returns 0, not the end of any other function
+    l_node = main.body.block_items or []
+    if not l_node or not isinstance(l_node[-1], Return):
+        main.body.block_items = l_node + [Return(expr=Constant(type='int', value='0'))]
+
+    type_ = FuncDecl(args=args,
+                     type=TypeDecl(declname='main', quals=[], type=IdentifierType(names=['int'])))
+    ret = Decl(name='irp_ret', quals=[], storage=[], funcspec=[],
+               type=TypeDecl(declname='irp_ret', quals=[], type=IdentifierType(names=['int'])),
+               init=None, bitsize=None)
+    call = FuncCall(name=ID(name='irp_main'), args=ExprList(exprs=l_arg) if l_arg else None)
+    body = Compound(block_items=[ret,
+                                 Pragma('omp parallel'),
+                                 Pragma('omp single'),
+                                 Assignment(op='=', lvalue=ID(name='irp_ret'), rvalue=call),
+                                 Return(expr=ID(name='irp_ret'))])
+    return FuncDef(decl=Decl(name='main', quals=[], storage=[], funcspec=[],
+                             type=type_, init=None, bitsize=None),
+                   param_decls=None, body=body)
@@ -0,0 +1,203 @@
+from irpc.arrays import parse_ext
+from irpc.checkpoint import region
+from pycparser import c_generator
+from pycparser.c_ast import Pragma
+import hashlib
+import re
+
+#  _
+# |_) _  ._ _ o  _ _|_  _  ._ _|_
+# |  (/_ | _> | _>  |_ (/_ | | |_
+#
+# Memo across runs for the pure providers: the ones depending only on input files and on the value of their parents.
+#
+#     void provide_table(){
+#         #pragma irp persistent("table.dat", filename)
+#         ...
+#     }
+#
+# The arguments are C expressions, the paths of the input files. The guard of the entity becomes
+#     if (!table_provided) { if (!irp_load_table()) { provide_table(); irp_store_table(); } table_provided = true; }
+# The key of the result is a hash of:
+#   - the C code of the provider
+#   - the path, size and modification time of each input file
+#   - the value of each parent: the bytes of the variable, the characters of a string (char *),
+#     the elements of an array with heap or mmap storage. For any other pointer it is the address,
+#     so the result is never found again.
+#
+# A result is a snapshot of the entities of the provider (see `irpc.checkpoint`) in $IRP_CACHE_DIR (default: .irp_cache).
+# An array with mmap storage is loaded zero-copy: mapped from the file. Once the files exceed $IRP_CACHE_SIZE bytes
+# (default: 1 GiB) the least recently used ones are removed.
+
+DEFAULT_CACHE_DIR = '.irp_cache'
+DEFAULT_CACHE_SIZE = 1 << 30
+
+_re_persistent = re.compile(r'irp\s+persistent\b\s*(?:\((.*)\))?\s*$')
+
+def inputs(funcdef):
+    # The input files (C code) of a provider annotated persistent, else None
+    for node in funcdef.body.block_items or []:
+        if isinstance(node, Pragma):
+            match = _re_persistent.match(node.string)
+            if match:
+                args = match.group(1)
+                if not args or not args.strip():
+                    return []
+                call = parse_ext(f'void f(void) {{ f({args}); }}')[0].body.block_items[0]
+                generator = c_generator.CGenerator()
+                return [generator.visit(expr) for expr in call.args.exprs]
+    return None
+
+def source_hash(funcdef):
+    text = c_generator.CGenerator().visit(funcdef)
+    return int(hashlib.sha256(text.encode()).hexdigest()[:15], 16)
+
+def hash_statement(parent, array):
+    if array and array.storage != 'static':
+        return f'h = irp_hash(h, {parent}, {parent} ? ({array.size}) * sizeof(*{parent}) : 0);'
+    return f'h = irp_hash_entity(h, {parent});'
+
+def definitions(uiid, l_decl, l_input, l_parent, key, d_array):
+    # `irp_key_x`, `irp_load_x` and `irp_store_x`, `l_decl` the declarations of the entities provided
+    n = len(l_decl)
+    l_region = '\n'.join(f'    r[{i}] = {region(decl, d_array)};' for i, decl in enumerate(l_decl))
+    l_hash = [f'h = irp_hash_file(h, {path});' for path in l_input]
+    l_hash += [hash_statement(parent, d_array.get(parent)) for parent in sorted(l_parent)]
+    l_hash = '\n'.join(f'    {line}' for line in l_hash)
+    return parse_ext(f'''
+static unsigned long irp_key_{uiid}(void)
+{{
+    unsigned long h = {key:#x}UL;
+{l_hash}
+    return h;
+}}
+
+int irp_load_{uiid}(void)
+{{
+    struct irp_region r[{n} + 1];
+{l_region}
+    return irp_persist_load("{uiid}", irp_key_{uiid}(), r, {n});
+}}
+
+void irp_store_{uiid}(void)
+{{
+    struct irp_region r[{n} + 1];
+{l_region}
+    irp_persist_store("{uiid}", irp_key_{uiid}(), r, {n});
+}}''')
+
+def declarations(uiid):
+    return parse_ext(f'int irp_load_{uiid}(void);\nvoid irp_store_{uiid}(void);')
+
+def runtime_definitions():
+    # After the one of `irpc.checkpoint`
+    return f'''\
+#include <dirent.h>
+#include <sys/stat.h>
+#include <utime.h>
+
+/* FNV-1a */
+static unsigned long irp_hash(unsigned long h, const void *p, unsigned long n) {{
+    const unsigned char *c = p;
+    for (unsigned long i = 0; i < n; i++)
+        h = (h ^ c[i]) * 1099511628211UL;
+    return h;
+}}
+
+static unsigned long irp_hash_string(unsigned long h, const char *s) {{
+    return s ? irp_hash(h, s, strlen(s) + 1) : irp_hash(h, "", 0);
+}}
+
+#define irp_hash_entity(h, x) _Generic((x), \\
+    char *: irp_hash_string((h), *(char **) &(x)), \\
+    const char *: irp_hash_string((h), *(const char **) &(x)), \\
+    default: irp_hash((h), &(x), sizeof(x)))
+
+static unsigned long irp_hash_file(unsigned long h, const char *path) {{
+    struct stat st;
+    h = irp_hash_string(h, path);
+    if (stat(path, &st))
+        return irp_hash(h, "missing", 7);
+    h = irp_hash(h, &st.st_size, sizeof(st.st_size));
+    return irp_hash(h, &st.st_mtim, sizeof(st.st_mtim));
+}}
+
+static const char *irp_cache_dir(void) {{
+    const char *dir = getenv("IRP_CACHE_DIR");
+    return dir ? dir : "{DEFAULT_CACHE_DIR}";
+}}
+
+static int irp_cache_path(char *path, unsigned long size, const char *name, unsigned long key) {{
+    return snprintf(path, size, "%s/%s-%016lx.irp", irp_cache_dir(), name, key) >= (int) size;
+}}
+
+struct irp_cache_entry {{
+    double t;
+    unsigned long size;
+    char name[256];
+}};
+
+static int irp_cache_entry_older(const void *a, const void *b) {{
+    double ta = ((const struct irp_cache_entry *) a)->t, tb = ((const struct irp_cache_entry *) b)->t;
+    return (ta > tb) - (ta < tb);
+}}
+
+static void irp_cache_evict(void) {{
+    const char *limit = getenv("IRP_CACHE_SIZE");
+    unsigned long max_size = limit ? strtoul(limit, NULL, 10) : {DEFAULT_CACHE_SIZE}UL;
+    char path[4096];
+    DIR *dir = opendir(irp_cache_dir());
+    if (!dir)
+        return;
+    /* One scan, then the oldest entries are removed until the total fits */
+    struct irp_cache_entry *l_entry = NULL, *l;
+    unsigned long n = 0, capacity = 0, total = 0;
+    struct dirent *entry;
+    struct stat st;
+    while ((entry = readdir(dir))) {{
+        unsigned long len = strlen(entry->d_name);
+        if (len < 4 || len >= sizeof(l_entry->name) || strcmp(entry->d_name + len - 4, ".irp"))
+            continue;
+        snprintf(path, sizeof(path), "%s/%s", irp_cache_dir(), entry->d_name);
+        if (stat(path, &st))
+            continue;
+        if (n == capacity) {{
+            capacity = capacity ? 2 * capacity : 64;
+            if (!(l = realloc(l_entry, capacity * sizeof(*l_entry))))
+                break;
+            l_entry = l;
+        }}
+        l_entry[n].t = st.st_mtim.tv_sec + 1e-9 * st.st_mtim.tv_nsec;
+        l_entry[n].size = st.st_size;
+        strcpy(l_entry[n].name, entry->d_name);
+        total += st.st_size;
+        n++;
+    }}
+    closedir(dir);
+    if (total > max_size)
+        qsort(l_entry, n, sizeof(*l_entry), irp_cache_entry_older);
+    for (unsigned long i = 0; i < n && total > max_size; i++) {{
+        snprintf(path, sizeof(path), "%s/%s", irp_cache_dir(), l_entry[i].name);
+        if (!unlink(path))
+            total -= l_entry[i].size;
+    }}
+    free(l_entry);
+}}
+
+static int irp_persist_load(const char *name, unsigned long key, struct irp_region *r, unsigned long n) {{
+    char path[4096];
+    if (irp_cache_path(path, sizeof(path), name, key) || access(path, R_OK) || irp_snapshot_read(path, r, n, key))
+        return 0;
+    /* Recently used, evicted last */
+    utime(path, NULL);
+    return 1;
+}}
+
+static void irp_persist_store(const char *name, unsigned long key, struct irp_region *r, unsigned long n) {{
+    char path[4096];
+    mkdir(irp_cache_dir(), 0755);
+    if (irp_cache_path(path, sizeof(path), name, key) || irp_snapshot_write(path, r, n, key))
+        return;
+    irp_cache_evict();
+}}
+'''
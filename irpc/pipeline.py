@@ -0,0 +1,74 @@
+from irpc.ASTprocessing import CommWorld
+from irpc.instrument import runtime_declarations, runtime_definitions
+from irpc.project import factory_class
+from irpc.utils import write_ast
+from irpc import arrays, checkpoint, persistent
+from pycparser.c_ast import FuncDef
+import io
+
+# The transformations of one file, shared by `irpc.py` and the watch mode (see `irpc.watch`).
+# `options`: prune, eliminate_guards, free_dead, openmp, eager, threads, thread_local, generations, instrument, checkpoint,
+# profile (the counters of an `--instrument` run, see `irpc.inline`), the same as for a project
+# (see `irpc.project.generate_project`).
+
+def write_file(f, headers, ast, cache=None, log=None, **options):
+    # Write the generated C code in the stream `f`, a function at a time, and return the `CommWorld` (for its timings).
+    # `log`: where to report the pruning and the guards removed
+    l_func = {f for f in ast.ext if isinstance(f, FuncDef)}
+    world = CommWorld(l_func, cache, factory=factory_class(options), generations=options.get('generations'),
+                      guard_functions=options.get('threads') or options.get('thread_local'), profile=options.get('profile'))
+    if options.get('prune'):
+        s_pruned = world.prune_unreachable_providers(ast.ext)
+        if log:
+            print(f'pruned {len(s_pruned)} of {len(s_pruned) + len(world.s_provider)} providers', file=log)
+    if options.get('eager'):
+        world.hoist_declarations(ast.ext, memo_flags=False)
+        world.insert_eager_schedule(ast.ext, world.s_entity_touched)
+    else:
+        world.insert_provider_calls()
+        world.hoist_declarations(ast.ext)
+        world.insert_touches_stuff(ast.ext)
+    world.insert_chunk_providers(ast.ext)
+    world.insert_persistent(ast.ext, memo_flags=not options.get('eager'))
+    if options.get('checkpoint'):
+        world.insert_checkpoint(ast.ext)
+    if options.get('thread_local'):
+        world.insert_thread_local(ast.ext)
+    if options.get('eliminate_guards'):
+        n_removed, n_hoisted = world.eliminate_redundant_guards()
+        if log:
+            print(f'removed {n_removed} redundant guards, hoisted {n_hoisted} out of loops', file=log)
+    l_free = world.insert_frees(ast.ext) if options.get('free_dead') else []
+    if log and options.get('free_dead'):
+        print(f'freed {len(l_free)} providers after their last use', file=log)
+    if options.get('profile') and not options.get('instrument'):
+        n_inlined = world.inline_providers(ast.ext)
+        if log:
+            print(f'inlined {n_inlined} providers', file=log)
+    if options.get('openmp'):
+        world.insert_provider_tasks(ast.ext)
+    if options.get('instrument'):
+        world.insert_instrumentation(ast.ext, world.s_entity_touched)
+
+    l_part = [headers]
+    if options.get('threads'):
+        l_part.append('#include <pthread.h>')
+    if arrays.runtime_definitions(world.l_array, free=bool(l_free)):
+        l_part.append(arrays.runtime_definitions(world.l_array, free=bool(l_free)))
+    if options.get('checkpoint') or world.d_persistent:
+        l_part.append(checkpoint.runtime_definitions())
+    if world.d_persistent:
+        l_part.append(persistent.runtime_definitions())
+    if options.get('instrument'):
+        l_part.append(runtime_declarations(world.l_stat) + runtime_definitions(world.l_stat))
+    for part in l_part:
+        f.write(f'{part}\n')
+    write_ast(f, ast)
+    f.write('\n')
+    return world
+
+def generate_file(headers, ast, cache=None, log=None, **options):
+    # The generated C code as a string, and the `CommWorld`
+    f = io.StringIO()
+    world = write_file(f, headers, ast, cache, log, **options)
+    return f.getvalue(), world
@@ -0,0 +1,344 @@
+from irpc.irpctyping import *
+from irpc.ASTprocessing import CommWorld, reachable
+from irpc.ASTfactory import ASTfactory, OpenMPASTfactory, PthreadASTfactory, InstrumentedASTfactory
+from irpc.bindingEntity import entity_index
+from irpc.cache import identifiers
+from irpc.frontend import remove_headers
+from irpc.instrument import runtime_declarations, runtime_definitions
+from irpc.utils import write_ast
+from irpc import arrays, checkpoint, persistent
+from pycparser import c_parser, c_generator
+from pycparser.c_ast import FuncDef, Decl, FileAST
+from concurrent.futures import ProcessPoolExecutor
+from collections import defaultdict
+from dataclasses import dataclass, field
+import os
+
+#  _
+# |_) ._ _  o  _   _ _|_
+# |   | (_) | (/_ (_  |_
+#         _|
+#
+# Many translation units (.irp.c files) sharing the same entities.
+#
+#  1. Each file is parsed and summarized in parallel:
+#       the entities it provides, their declarations, the identifiers each provider depends on and the entities touched.
+#  2. The summaries are merged serially into one global entity table and one provider graph (`ProjectTable`).
+#  3. Each file is transformed and generated in parallel against this table.
+#
+# Every generated file includes a shared header declaring the entities, their `*_provided` flags,
+# the providers and the touch functions. An entity (and its flag) is defined in the file of its provider,
+# a touch function in the file providing the touched entity.
+
+HEADER = 'irp.h'
+
+@dataclass
+class ProjectTable:
+    s_entity: Set = field(default_factory=set)
+    d_entity2provider: Dict = field(default_factory=dict)
+    d_provider_name: Dict = field(default_factory=dict)
+    child_adjacency_graph: Dict = field(default_factory=lambda: defaultdict(set))
+    parent_adjacency_graph: Dict = field(default_factory=lambda: defaultdict(set))
+    s_entity_reachable: Set = field(default_factory=set)
+    s_entity_touched: Set = field(default_factory=set)
+    d_array: Dict = field(default_factory=dict)
+    s_persistent: Set = field(default_factory=set)
+    s_function_use: Set = field(default_factory=set)
+
+@dataclass
+class TranslationUnit:
+    filename: str
+    headers: str
+    ast: FileAST
+    d_provider: Dict = field(default_factory=dict)  # uiid -> entities provided
+    d_provider_name: Dict = field(default_factory=dict)  # uiid -> name of the provider function
+    d_decl: Dict = field(default_factory=dict)      # entity -> Decl
+    l_edge: List = field(default_factory=list)      # (entities provided, identifiers the provider may depend on)
+    l_use: List = field(default_factory=list)       # (entities provided, identifiers used by the provider)
+    s_main_use: Set = None                          # identifiers used by main, if this unit has it
+    s_function_use: Set = field(default_factory=set)  # identifiers used by the other functions
+    s_touch: Set = field(default_factory=set)       # entities touched
+    d_array: Dict = field(default_factory=dict)     # entity -> irpc.arrays.ArrayEntity
+    s_persistent: Set = field(default_factory=set)  # uiid of the persistent providers
+
+def input_files(l_path):
+    l_filename = []
+    for path in l_path:
+        if not os.path.isdir(path):
+            l_filename.append(path)
+            continue
+        for root, _, l_file in sorted(os.walk(path)):
+            l_filename += [os.path.join(root, f) for f in sorted(l_file) if f.endswith('.irp.c')]
+    return l_filename
+
+def output_name(filename):
+    name = os.path.basename(filename)
+    return (name[:-len('.irp.c')] if name.endswith('.irp.c') else os.path.splitext(name)[0]) + '.c'
+
+# One parser per worker process, building the parser tables is expensive
+_parser = None
+# Optional `irpc.frontend.Preprocessor`, with the preludes of all the files already computed
+_preprocessor = None
+
+def init_worker(preprocessor):
+    global _preprocessor
+    _preprocessor = preprocessor
+
+def parse_unit(filename) -> TranslationUnit:
+    global _parser
+    if _parser is None:
+        _parser = c_parser.CParser()
+
+    if _preprocessor:
+        headers, ast = _preprocessor.parse(filename, _parser)
+    else:
+        headers, text = remove_headers(filename)
+        ast = _parser.parse(text, filename)
+    unit = TranslationUnit(filename, headers, ast)
+
+    # The global entity table is not known yet, so the index is computed against all the identifiers of the function.
+    # The entity which are not provided anywhere will be filtered during the merge.
+    world = CommWorld({f for f in ast.ext if isinstance(f, FuncDef)})
+    for p in world.s_provider:
+        unit.d_provider[p.uiid] = p.s_entity
+        unit.d_provider_name[p.uiid] = p.ast.decl.name
+        index = entity_index(p.ast, identifiers(p.ast))
+        unit.l_edge.append((p.s_entity, set(index.hoisting.keys()) - p.s_entity))
+        unit.l_use.append((p.s_entity, (index.uses.keys() | index.hoisting.keys()) - p.s_entity))
+        unit.s_touch |= {entity_touched for entity_touched, _ in index.touches}
+        for node in p.ast.body.block_items or []:
+            if isinstance(node, Decl) and node.name in p.s_entity:
+                unit.d_decl[node.name] = node
+        unit.d_array.update(arrays.array_entities(p.ast, p.s_entity))
+        if persistent.inputs(p.ast) is not None:
+            unit.s_persistent.add(p.uiid)
+
+    if world.main:
+        index = entity_index(world.main.ast, identifiers(world.main.ast))
+        unit.s_touch |= {entity_touched for entity_touched, _ in index.touches}
+        unit.s_main_use = set(index.uses.keys())
+    # The other functions: called by main, or the entry points of the threads with `guard_functions`
+    s_name = {p.ast.decl.name for p in world.s_provider} | {'main'}
+    for f in world.l_func:
+        if f.decl.name in s_name:
+            continue
+        index = entity_index(f, identifiers(f))
+        unit.s_function_use |= set(index.uses.keys())
+    return unit
+
+def merge(l_unit):
+    table = ProjectTable()
+    d_entity2file = {}
+    for unit in l_unit:
+        for uiid, s_entity in unit.d_provider.items():
+            for entity in s_entity:
+                if entity in d_entity2file:
+                    raise ValueError(f'{entity} is provided in {d_entity2file[entity]} and in {unit.filename}')
+                d_entity2file[entity] = unit.filename
+                table.d_entity2provider[entity] = uiid
+        table.d_provider_name.update(unit.d_provider_name)
+        table.d_array.update(unit.d_array)
+        table.s_persistent |= unit.s_persistent
+    table.s_entity = set(table.d_entity2provider)
+
+    for unit in l_unit:
+        for s_provided, s_parent in unit.l_edge:
+            for parent_entity in s_parent & table.s_entity:
+                table.child_adjacency_graph[parent_entity] |= s_provided
+        for s_provided, s_use in unit.l_use:
+            for entity in s_provided:
+                table.parent_adjacency_graph[entity] |= s_use & table.s_entity
+
+    table.s_function_use = set().union(*(unit.s_function_use for unit in l_unit)) & table.s_entity
+    l_main_use = [unit.s_main_use for unit in l_unit if unit.s_main_use is not None]
+    if l_main_use:
+        # The entities used by main, and by the functions it may call
+        s_use = l_main_use[0].union(*(unit.s_function_use for unit in l_unit))
+        table.s_entity_reachable = reachable(s_use & table.s_entity, table.parent_adjacency_graph)
+    else:
+        table.s_entity_reachable = table.s_entity
+
+    # Each touch function is defined once, by the owner of the entity (or the first file touching it)
+    d_file2touch = defaultdict(set)
+    for unit in l_unit:
+        for entity in unit.s_touch:
+            d_file2touch[d_entity2file.setdefault(entity, unit.filename)].add(entity)
+        table.s_entity_touched |= unit.s_touch
+
+    return table, d_file2touch
+
+def factory_class(options):
+    if options.get('openmp'):
+        return OpenMPASTfactory
+    if options.get('threads'):
+        return PthreadASTfactory
+    if options.get('instrument'):
+        return InstrumentedASTfactory
+    return ASTfactory
+
+def extern_node(decl):
+    return Decl(name=decl.name, quals=decl.quals,
+                storage=['extern'], funcspec=[],
+                type=decl.type, init=None, bitsize=None)
+
+def header_world(table, options):
+    # A world without function, only to name the flags like the units do
+    return CommWorld(set(), project=table, factory=factory_class(options), generations=options.get('generations'))
+
+def extern_decls(l_unit, table, s_touch, options):
+    # The variables declared in the shared header: the entities, their flags (and chunks), the generation counters
+    world = header_world(table, options)
+    d_decl = {entity: decl for unit in l_unit for entity, decl in unit.d_decl.items()}
+    if options.get('prune'):
+        d_decl = {entity: decl for entity, decl in d_decl.items() if entity in table.s_entity_reachable}
+
+    l_decl = []
+    s_flag = set()
+    for entity in sorted(d_decl):
+        array = table.d_array.get(entity)
+        l_decl.append(extern_node(arrays.storage_decl(d_decl[entity], array.storage) if array else d_decl[entity]))
+        if array and array.chunk:
+            l_decl += arrays.parse_ext(f'extern {arrays.bitmap_decl(array)};')
+        # One flag for all the entities of a provider, after the first one
+        uiid = table.d_entity2provider[entity]
+        if not options.get('eager') and uiid not in s_flag:
+            s_flag.add(uiid)
+            l_decl.append(extern_node(world.astfactory(uiid).memo_flag_node))
+    if options.get('generations'):
+        l_decl += [extern_node(world.factory(entity).generation_node) for entity in sorted(s_touch)]
+    if options.get('thread_local'):
+        for decl in l_decl:
+            decl.storage = decl.storage + ['_Thread_local']
+    if not options.get('eager'):
+        s_uiid = {table.d_entity2provider[entity] for entity in d_decl}
+        l_decl += [extern_node(decl) for uiid in sorted(s_uiid) for decl in world.astfactory(uiid).lock_nodes]
+    return l_decl
+
+def header_text(l_unit, table, s_touch, options):
+    generator = c_generator.CGenerator()
+    prune = options.get('prune')
+    world = header_world(table, options)
+
+    l_line = ['#ifndef IRP_H', '#define IRP_H']
+    for unit in l_unit:
+        l_line += [line for line in unit.headers.splitlines() if line not in l_line]
+    if any(array.chunk for array in table.d_array.values()) and '#include <string.h>' not in l_line:
+        l_line.append('#include <string.h>')
+    if options.get('threads') and '#include <pthread.h>' not in l_line:
+        l_line.append('#include <pthread.h>')
+    l_line.append('')
+
+    l_line += [generator.visit(decl) + ';' for decl in extern_decls(l_unit, table, s_touch, options)]
+    for entity in sorted(table.s_entity):
+        array = table.d_array.get(entity)
+        if array and array.chunk and (not prune or entity in table.s_entity_reachable):
+            l_line.append(arrays.ensure_declaration(array) + ';')
+
+    for uiid in sorted({uiid for entity, uiid in table.d_entity2provider.items()
+                        if not prune or entity in table.s_entity_reachable}):
+        l_line.append(f'void {world.astfactory(uiid).provider}();')
+        if uiid in table.s_persistent:
+            l_line += [generator.visit(decl) + ';' for decl in persistent.declarations(uiid)]
+
+    for entity in sorted(s_touch):
+        l_line.append(generator.visit(world.factory(entity).touch_declaration_node) + ';')
+
+    if options.get('checkpoint'):
+        l_line += [generator.visit(decl) + ';' for decl in checkpoint.declarations()]
+    if options.get('instrument'):
+        l_line += ['', runtime_declarations(world.l_stat)]
+
+    l_line.append('#endif')
+    return '\n'.join(l_line) + '\n'
+
+def generate_unit(unit, table, s_touch, output_dir, options, runtime=False, l_extern=None):
+    # `runtime`: this unit defines the counters of `--instrument` and the snapshot of `--checkpoint`
+    # (the one with main, or the first one). `l_extern`: the declarations of the shared header, saved by the snapshot
+    ast = unit.ast
+    world = CommWorld({f for f in ast.ext if isinstance(f, FuncDef)}, project=table, factory=factory_class(options),
+                      generations=options.get('generations'),
+                      guard_functions=options.get('threads') or options.get('thread_local'), profile=options.get('profile'))
+    s_pruned = world.prune_unreachable_providers(ast.ext) if options.get('prune') else set()
+    if options.get('eager'):
+        world.hoist_declarations(ast.ext, memo_flags=False)
+        world.insert_eager_schedule(ast.ext, s_touch)
+    else:
+        world.insert_provider_calls()
+        world.hoist_declarations(ast.ext)
+        world.insert_touch_provider_calls()
+        world.insert_touch_definitions(ast.ext, s_touch)
+    world.insert_chunk_providers(ast.ext)
+    world.insert_persistent(ast.ext, memo_flags=not options.get('eager'))
+    if options.get('checkpoint') and runtime:
+        world.insert_checkpoint(ast.ext, l_extern)
+    if options.get('thread_local'):
+        world.insert_thread_local(ast.ext)
+    if options.get('eliminate_guards'):
+        world.eliminate_redundant_guards()
+    l_free = world.insert_frees(ast.ext) if options.get('free_dead') else []
+    if options.get('openmp'):
+        world.insert_provider_tasks(ast.ext)
+    if options.get('instrument'):
+        world.insert_instrumentation(ast.ext, s_touch)
+
+    path = os.path.join(output_dir, output_name(unit.filename))
+    with open(path, 'w') as f:
+        f.write(f'#include "{HEADER}"\n')
+        f.write(unit.headers)
+        f.write('\n')
+        if arrays.runtime_definitions(world.l_array, free=bool(l_free)):
+            f.write(arrays.runtime_definitions(world.l_array, free=bool(l_free)) + '\n')
+        if runtime and options.get('checkpoint') or world.d_persistent:
+            f.write(checkpoint.runtime_definitions() + '\n')
+        if world.d_persistent:
+            f.write(persistent.runtime_definitions() + '\n')
+        if runtime and options.get('instrument'):
+            f.write(runtime_definitions(world.l_stat) + '\n')
+        write_ast(f, ast)
+    return path, len(s_pruned)
+
+def project_table(l_path, max_workers=None, preprocessor=None):
+    # The entities and the provider graph of all the files, without generating them
+    l_filename = input_files(l_path)
+    if preprocessor:
+        for filename in l_filename:
+            preprocessor.prelude(preprocessor.includes(filename)[1])
+    with ProcessPoolExecutor(max_workers, initializer=init_worker, initargs=(preprocessor,)) as executor:
+        l_unit = list(executor.map(parse_unit, l_filename))
+    table, _ = merge(l_unit)
+    return table
+
+def generate_project(l_path, output_dir, max_workers=None, **options):
+    # `options`: the same transformations as for one file
+    # (prune, eliminate_guards, free_dead, openmp, eager, threads, thread_local, generations, instrument, checkpoint, profile),
+    # and `preprocessor`: an `irpc.frontend.Preprocessor` to parse the files with
+    l_filename = input_files(l_path)
+
+    l_output = [output_name(f) for f in l_filename]
+    if len(set(l_output)) != len(l_output):
+        raise ValueError('Two input files would be generated in the same output file')
+
+    # The system headers are parsed once here, not in each worker
+    preprocessor = options.get('preprocessor')
+    if preprocessor:
+        for filename in l_filename:
+            preprocessor.prelude(preprocessor.includes(filename)[1])
+
+    os.makedirs(output_dir, exist_ok=True)
+    with ProcessPoolExecutor(max_workers, initializer=init_worker, initargs=(preprocessor,)) as executor:
+        l_unit = list(executor.map(parse_unit, l_filename))
+
+        table, d_file2touch = merge(l_unit)
+        s_touch = set().union(*d_file2touch.values())
+        with open(os.path.join(output_dir, HEADER), 'w') as f:
+            f.write(header_text(l_unit, table, s_touch, options))
+
+        runtime_unit = next((unit for unit in l_unit if unit.s_main_use is not None), l_unit[0])
+        l_extern = extern_decls(l_unit, table, s_touch, options) if options.get('checkpoint') else None
+        l_future = [executor.submit(generate_unit, unit, table, d_file2touch[unit.filename], output_dir, options,
+                                    runtime=unit is runtime_unit, l_extern=l_extern)
+                    for unit in l_unit]
+        l_result = [future.result() for future in l_future]
+
+    # The generated files, and the number of providers pruned
+    return [path for path, _ in l_result], sum(n for _, n in l_result)
@@ -16,3 +16,54 @@ class cached_property(object):
         value = obj.__dict__[self.func.__name__] = self.func(obj)
 
         return value
+
+from functools import wraps
+from time import perf_counter
+def timed(func):
+    """
+    Accumulate the wall time of a method in `self.timings[method_name]`.
+    Time spent in nested timed methods is not counted twice, so the entries add up to the total.
+    """
+
+    @wraps(func)
+    def wrapper(self, *args, **kwargs):
+        outer_nested = getattr(self, '_timed_nested', 0.)
+        self._timed_nested = 0.
+        start = perf_counter()
+        try:
+            return func(self, *args, **kwargs)
+        finally:
+            elapsed = perf_counter() - start
+            name = func.__name__
+            self.timings[name] = self.timings.get(name, 0.) + elapsed - self._timed_nested
+            self._timed_nested = outer_nested + elapsed
+
+    return wrapper
+
+def insert_batch(l_node, d_before=None, d_after=None, l_front=()):
+    """
+    Apply many insertions to the list `l_node` in one pass, instead of shifting it at each `insert`.
+    `d_before` / `d_after`: node of `l_node` -> nodes to insert just before / after it, `l_front`: nodes to insert first.
+    """
+    d_before = d_before or {}
+    d_after = d_after or {}
+    l = list(l_front)
+    for node in l_node:
+        l += d_before.get(node, ())
+        l.append(node)
+        l += d_after.get(node, ())
+    l_node[:] = l
+
+from pycparser import c_ast, c_generator
+def write_ast(f, ast, generator=None):
+    """
+    Write the C code of the FileAST `ast` in the stream `f`, one top level declaration at a time.
+    Same output as `CGenerator().visit(ast)`, without building the text of the whole file.
+    """
+    generator = generator or c_generator.CGenerator()
+    for ext in ast.ext:
+        f.write(generator.visit(ext))
+        if isinstance(ext, c_ast.Pragma):
+            f.write('\n')
+        elif not isinstance(ext, c_ast.FuncDef):
+            f.write(';\n')
@@ -0,0 +1,128 @@
+from irpc.cache import IndexCache
+from irpc.frontend import remove_headers
+from irpc.pipeline import generate_file
+from irpc.project import output_name
+from pycparser import c_parser
+import selectors
+import socket
+import time
+import os
+
+#
+# \    / _. _|_  _ |_
+#  \/\/ (_|  |_ (_ | |
+#
+# A long lived process regenerating the files when they are saved, instead of one `irpc.py` per build:
+# the parser tables are built once, the system headers preprocessed once (see `irpc.frontend.Preprocessor`).
+#
+# The files are parsed by an in memory `irpc.cache.IndexCache`: the text of a file is split in its top level
+# declarations, and after an edit only the declarations which changed are parsed again.
+# The index of the unchanged functions is reused too.
+#
+# The files are polled. The generated code is written in a directory, and/or served on a Unix socket:
+# a client sends the path of a file (one line) and reads the generated code, up to date, until the end of the stream.
+# An error (the file cannot be parsed, ...) is reported as an `#error` line.
+
+class Watcher():
+
+    def __init__(self, l_filename, output_dir=None, preprocessor=None, log=None, **options):
+        self.l_filename = list(l_filename)
+        # Where to write the generated files, None to only serve them
+        self.output_dir = output_dir
+        # Optional `irpc.frontend.Preprocessor`
+        self.preprocessor = preprocessor
+        self.log = log
+        # The transformations, see `irpc.pipeline.generate_file`
+        self.options = options
+        self.parser = c_parser.CParser()
+        self.cache = IndexCache()
+        # filename -> (mtime, size) of the version generated, and the generated code
+        self.d_stat = {}
+        self.d_output = {}
+
+    def parse(self, filename):
+        headers, text = self.preprocessor.preprocess(filename) if self.preprocessor else remove_headers(filename)
+        return headers, self.cache.parse(self.parser, text, filename)
+
+    def generate(self, filename):
+        headers, ast = self.parse(filename)
+        text, _ = generate_file(headers, ast, self.cache, log=self.log, **self.options)
+        return text
+
+    def update(self, filename):
+        # Generate again `filename` if it changed since the last time. Return if it did
+        try:
+            st = os.stat(filename)
+            stat = (st.st_mtime_ns, st.st_size)
+        except OSError:
+            stat = None
+        if filename in self.d_output and self.d_stat.get(filename) == stat:
+            return False
+
+        start = time.perf_counter()
+        n_parsed = self.cache.n_parsed
+        try:
+            self.d_output[filename] = self.generate(filename)
+            if self.log:
+                print(f'{filename}: generated in {time.perf_counter() - start:.3f} s, '
+                      f'{self.cache.n_parsed - n_parsed} declarations parsed', file=self.log, flush=True)
+        except Exception as e:
+            message = f'{filename}: {type(e).__name__}: {e}'.replace('\n', ' ').replace('"', "'")
+            self.d_output[filename] = f'#error "{message}"\n'
+            if self.log:
+                print(message, file=self.log, flush=True)
+        self.d_stat[filename] = stat
+
+        if self.output_dir:
+            path = os.path.join(self.output_dir, output_name(filename))
+            tmp = f'{path}.{os.getpid()}.tmp'
+            with open(tmp, 'w') as f:
+                f.write(self.d_output[filename])
+            os.replace(tmp, path)
+        return True
+
+    def poll(self):
+        return [filename for filename in self.l_filename if self.update(filename)]
+
+    def serve(self, socket_path=None, interval=0.2):
+        # Forever: poll the files every `interval` seconds, and answer the clients of `socket_path`
+        if self.output_dir:
+            os.makedirs(self.output_dir, exist_ok=True)
+        selector = selectors.DefaultSelector()
+        server = None
+        if socket_path:
+            if os.path.exists(socket_path):
+                os.unlink(socket_path)
+            server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            server.bind(socket_path)
+            server.listen()
+            selector.register(server, selectors.EVENT_READ)
+        try:
+            while True:
+                self.poll()
+                for _ in selector.select(interval):
+                    connection, _ = server.accept()
+                    with connection:
+                        self.answer(connection)
+        finally:
+            if server:
+                server.close()
+                os.unlink(socket_path)
+
+    def answer(self, connection):
+        connection.settimeout(5)
+        try:
+            with connection.makefile('rb') as f:
+                path = f.readline().decode(errors='replace').strip()
+            # Only the files given on the command line are served
+            d_path = {os.path.realpath(filename): filename for filename in self.l_filename}
+            filename = d_path.get(os.path.realpath(path)) if path else None
+            if filename is None:
+                message = f'{path}: not watched'.replace('"', "'")
+                connection.sendall(f'#error "{message}"\n'.encode())
+                return
+            self.update(filename)
+            connection.sendall(self.d_output[filename].encode())
+        except OSError as e:
+            if self.log:
+                print(f'client: {e}', file=self.log, flush=True)
@@ -0,0 +1,142 @@
+#include <stdbool.h>
+#include <stdio.h>
+
+#include <string.h>
+#include <stdio.h>
+#include <stdlib.h>
+#include <sys/mman.h>
+
+static void *irp_alloc(unsigned long size, int use_mmap)
+{
+    void *p = use_mmap ? mmap(NULL, size, PROT_READ | PROT_WRITE,
+                              MAP_PRIVATE | MAP_ANONYMOUS | MAP_NORESERVE, -1, 0)
+                       : calloc(1, size);
+    if (!p || p == MAP_FAILED) {
+        fprintf(stderr, "irp: cannot allocate %lu bytes\n", size);
+        exit(1);
+    }
+    return p;
+}
+
+static void irp_free(void *p, unsigned long size, int use_mmap)
+{
+    if (use_mmap)
+        munmap(p, size);
+    else
+        free(p);
+}
+
+unsigned char grid_chunks[(1000 + 511) / 512];
+double *irp_ensure_grid(unsigned long irp_i);
+void touch_scale();
+double *grid;
+bool grid_provided = false;
+double scale;
+bool scale_provided = false;
+double *squares;
+bool squares_provided = false;
+void provide_scale()
+{
+  scale = 2.;
+}
+
+static void irp_alloc_grid(void)
+{
+  if (!grid)
+    grid = irp_alloc(1000 * (sizeof(*grid)), 1);
+
+}
+
+static void irp_fill_grid(unsigned long irp_begin, unsigned long irp_end)
+{
+  irp_alloc_grid();
+  for (unsigned long i = irp_begin; i < irp_end; i++)
+  {
+    if (!scale_provided)
+    {
+      provide_scale();
+      scale_provided = true;
+    }
+
+    grid[i] = scale * i;
+  }
+
+}
+
+double *irp_ensure_grid(unsigned long irp_i)
+{
+  unsigned long irp_c = irp_i / 64;
+  if (!(grid_chunks[irp_c / 8] & (1 << (irp_c % 8))))
+  {
+    irp_fill_grid(irp_c * 64, (((irp_c + 1) * 64) < 1000) ? ((irp_c + 1) * 64) : (1000));
+    grid_chunks[irp_c / 8] |= 1 << (irp_c % 8);
+  }
+
+  return &grid[irp_i];
+}
+
+void provide_grid()
+{
+  irp_fill_grid(0, 1000);
+  memset(grid_chunks, 0xff, sizeof(grid_chunks));
+}
+
+static void irp_alloc_squares(void)
+{
+  if (!squares)
+    squares = irp_alloc(100 * (sizeof(*squares)), 0);
+
+}
+
+void provide_squares()
+{
+  irp_alloc_squares();
+  for (int i = 0; i < 100; i++)
+  {
+    squares[i] = i * i;
+  }
+
+}
+
+void touch_scale()
+{
+  grid_provided = false;
+  memset(grid_chunks, 0, sizeof(grid_chunks));
+}
+
+static void irp_free_squares(void)
+{
+  if (squares)
+  {
+    irp_free(squares, 100 * (sizeof(*squares)), 0);
+    squares = 0;
+  }
+
+  squares_provided = false;
+}
+
+int main()
+{
+  printf("grid[5] = %g\n", irp_ensure_grid(5)[0]);
+  printf("grid[900] = %g\n", irp_ensure_grid(900)[0]);
+  if (!squares_provided)
+  {
+    provide_squares();
+    squares_provided = true;
+  }
+
+  printf("squares[9] = %g\n", squares[9]);
+  irp_free_squares();
+  if (!scale_provided)
+  {
+    provide_scale();
+    scale_provided = true;
+  }
+
+  scale = 3.;
+  touch_scale();
+  printf("grid[900] = %g\n", irp_ensure_grid(900)[0]);
+  return 0;
+}
+
+
@@ -0,0 +1,164 @@
+#include <stdbool.h>
+#include <stdio.h>
+
+int limit;
+bool limit_provided = false;
+int n;
+bool n_provided = false;
+int offset;
+bool offset_provided = false;
+int origin;
+bool origin_provided = false;
+double scale;
+bool scale_provided = false;
+int step;
+bool step_provided = false;
+struct point
+{
+  int x;
+  int y;
+};
+void provide_n()
+{
+  n = 3;
+}
+
+void provide_step()
+{
+  step = 2;
+}
+
+void provide_scale()
+{
+  scale = 0.5;
+}
+
+void provide_offset()
+{
+  offset = 10;
+}
+
+void provide_origin()
+{
+  origin = -1;
+}
+
+void provide_limit()
+{
+  limit = 4;
+}
+
+int main()
+{
+  int i = 0;
+  if (!n_provided)
+  {
+    provide_n();
+    n_provided = true;
+  }
+
+  do
+  {
+    if (!step_provided)
+    {
+      provide_step();
+      step_provided = true;
+    }
+
+    i += step;
+  }
+  while (i < n);
+  printf("i = %d\n", i);
+  if (!n_provided)
+  {
+    provide_n();
+    n_provided = true;
+  }
+
+  switch (n)
+  {
+    case 3:
+    {
+      if (!step_provided)
+      {
+        provide_step();
+        step_provided = true;
+      }
+
+      printf("three, step = %d\n", step);
+      break;
+    }
+
+    default:
+    {
+      if (!n_provided)
+      {
+        provide_n();
+        n_provided = true;
+      }
+
+      printf("n = %d\n", n);
+    }
+
+  }
+
+  if (!scale_provided)
+  {
+    provide_scale();
+    scale_provided = true;
+  }
+
+  int half = (int) (scale * 10);
+  printf("half = %d\n", half);
+  if (!origin_provided)
+  {
+    provide_origin();
+    origin_provided = true;
+  }
+
+  int sign = (origin < 0) ? (-1) : (1);
+  printf("sign = %d\n", sign);
+  if (!origin_provided)
+  {
+    provide_origin();
+    origin_provided = true;
+  }
+
+  if (!offset_provided)
+  {
+    provide_offset();
+    offset_provided = true;
+  }
+
+  struct point p = {offset, origin};
+  int a[2] = {0, 0};
+  if (!n_provided)
+  {
+    provide_n();
+    n_provided = true;
+  }
+
+  a[n - 2] = p.x + p.y;
+  printf("a = %d %d\n", a[0], a[1]);
+  int k = 0;
+  again:
+  {
+    k++;
+  }
+
+  if (!limit_provided)
+  {
+    provide_limit();
+    limit_provided = true;
+  }
+
+  if (k < limit)
+  {
+    goto again;
+  }
+
+  printf("k = %d\n", k);
+  return 0;
+}
+
+
@@ -0,0 +1,161 @@
+#include <stdbool.h>
+#include <stdio.h>
+
+#include <string.h>
+#include <stdio.h>
+#include <stdlib.h>
+#include <sys/mman.h>
+
+static void *irp_alloc(unsigned long size, int use_mmap)
+{
+    void *p = use_mmap ? mmap(NULL, size, PROT_READ | PROT_WRITE,
+                              MAP_PRIVATE | MAP_ANONYMOUS | MAP_NORESERVE, -1, 0)
+                       : calloc(1, size);
+    if (!p || p == MAP_FAILED) {
+        fprintf(stderr, "irp: cannot allocate %lu bytes\n", size);
+        exit(1);
+    }
+    return p;
+}
+
+static void irp_free(void *p, unsigned long size, int use_mmap)
+{
+    if (use_mmap)
+        munmap(p, size);
+    else
+        free(p);
+}
+
+double *grid;
+bool grid_provided = false;
+double *last;
+bool last_provided = false;
+double *table;
+bool table_provided = false;
+double total;
+bool total_provided = false;
+static void irp_alloc_table(void)
+{
+  if (!table)
+    table = irp_alloc(1000 * (sizeof(*table)), 0);
+
+}
+
+void provide_table()
+{
+  irp_alloc_table();
+  for (int i = 0; i < 1000; i++)
+  {
+    table[i] = 0.5 * i;
+  }
+
+}
+
+static void irp_alloc_grid(void)
+{
+  if (!grid)
+    grid = irp_alloc(1000 * (sizeof(*grid)), 1);
+
+}
+
+void provide_grid()
+{
+  irp_alloc_grid();
+  for (int i = 0; i < 1000; i++)
+  {
+    if (!table_provided)
+    {
+      provide_table();
+      table_provided = true;
+    }
+
+    grid[i] = table[i] + 1.;
+  }
+
+}
+
+void provide_total()
+{
+  total = 0.;
+  for (int i = 0; i < 1000; i++)
+  {
+    if (!grid_provided)
+    {
+      provide_grid();
+      grid_provided = true;
+    }
+
+    total += grid[i];
+  }
+
+}
+
+static void irp_alloc_last(void)
+{
+  if (!last)
+    last = irp_alloc(10 * (sizeof(*last)), 0);
+
+}
+
+void provide_last()
+{
+  irp_alloc_last();
+  for (int i = 0; i < 10; i++)
+  {
+    last[i] = i;
+  }
+
+}
+
+static void irp_free_grid(void)
+{
+  if (grid)
+  {
+    irp_free(grid, 1000 * (sizeof(*grid)), 1);
+    grid = 0;
+  }
+
+  grid_provided = false;
+}
+
+static void irp_free_table(void)
+{
+  if (table)
+  {
+    irp_free(table, 1000 * (sizeof(*table)), 0);
+    table = 0;
+  }
+
+  table_provided = false;
+}
+
+int main()
+{
+  if (!total_provided)
+  {
+    provide_total();
+    total_provided = true;
+  }
+
+  printf("total = %g\n", total);
+  if (!grid_provided)
+  {
+    provide_grid();
+    grid_provided = true;
+  }
+
+  irp_free_table();
+  printf("grid[10] = %g\n", grid[10]);
+  irp_free_grid();
+  printf("done\n");
+  if (!last_provided)
+  {
+    provide_last();
+    last_provided = true;
+  }
+
+  printf("last[9] = %g\n", last[9]);
+  return 0;
+}
+
+
@@ -0,0 +1,75 @@
+#include <stdbool.h>
+#include <stdio.h>
+
+int a;
+bool a_provided = false;
+int b;
+bool b_provided = false;
+int c;
+bool c_provided = false;
+void provide_a()
+{
+  printf("provide a\n");
+  a = 2;
+}
+
+void provide_b()
+{
+  printf("provide b\n");
+  b = 3;
+}
+
+void provide_c()
+{
+  printf("provide c\n");
+  c = 5;
+}
+
+int main()
+{
+  int n = 0;
+  int s = 0;
+  if (!a_provided)
+  {
+    provide_a();
+    a_provided = true;
+  }
+
+  for (int i = 0; i < 4; i++)
+  {
+    s += a;
+  }
+
+  for (int i = 0; i < n; i++)
+  {
+    if (!b_provided)
+    {
+      provide_b();
+      b_provided = true;
+    }
+
+    s += b;
+  }
+
+  while (n < 3)
+  {
+    n++;
+    if (n == 2)
+    {
+      break;
+    }
+
+    if (!c_provided)
+    {
+      provide_c();
+      c_provided = true;
+    }
+
+    s += c;
+  }
+
+  printf("s = %d\n", s);
+  return 0;
+}
+
+
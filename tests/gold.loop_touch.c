@@ -0,0 +1,62 @@
+#include <stdbool.h>
+#include <stdio.h>
+
+void touch_x();
+int x;
+bool x_provided = false;
+int y;
+bool y_provided = false;
+void provide_x()
+{
+  x = 3;
+}
+
+void provide_y()
+{
+  if (!x_provided)
+  {
+    provide_x();
+    x_provided = true;
+  }
+
+  y = x;
+}
+
+void touch_x()
+{
+  y_provided = false;
+}
+
+int main()
+{
+  int n = 0;
+  if (!y_provided)
+  {
+    provide_y();
+    y_provided = true;
+  }
+
+  while (y)
+  {
+    n++;
+    if (!x_provided)
+    {
+      provide_x();
+      x_provided = true;
+    }
+
+    x = x - 1;
+    touch_x();
+    if (!y_provided)
+    {
+      provide_y();
+      y_provided = true;
+    }
+
+  }
+
+  printf("n = %d\n", n);
+  return 0;
+}
+
+
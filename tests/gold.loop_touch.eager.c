@@ -0,0 +1,44 @@
+#include <stdbool.h>
+#include <stdio.h>
+
+void irp_init();
+void touch_x();
+int x;
+int y;
+void provide_x()
+{
+  x = 3;
+}
+
+void provide_y()
+{
+  y = x;
+}
+
+void touch_x()
+{
+  provide_y();
+}
+
+void irp_init()
+{
+  provide_x();
+  provide_y();
+}
+
+int main()
+{
+  irp_init();
+  int n = 0;
+  while (y)
+  {
+    n++;
+    x = x - 1;
+    touch_x();
+  }
+
+  printf("n = %d\n", n);
+  return 0;
+}
+
+
@@ -0,0 +1,191 @@
+#include <stdbool.h>
+#include <stdio.h>
+
+#include <stdio.h>
+#include <stdlib.h>
+#include <time.h>
+
+struct irp_stat {
+    const char *name;
+    unsigned long invocations, misses, hits, recomputes, touches, recomputes_caused;
+    double inclusive, exclusive;
+    int cause;  /* the touch which invalidated the entity, -1 if none */
+};
+enum { irp_stat_x, irp_stat_y, irp_n_stat };
+extern struct irp_stat irp_stats[irp_n_stat];
+void irp_enter(int);
+void irp_leave(int);
+void irp_touch(int);
+struct irp_stat irp_stats[irp_n_stat] = { {"x"}, {"y"} };
+
+#define IRP_MAX_DEPTH 1024
+static int irp_depth = 0;
+static int irp_stack[IRP_MAX_DEPTH];
+static double irp_start[IRP_MAX_DEPTH], irp_children[IRP_MAX_DEPTH];
+static FILE *irp_folded = NULL;
+
+static double irp_now(void) {
+    struct timespec t;
+    clock_gettime(CLOCK_MONOTONIC, &t);
+    return t.tv_sec + 1e-9 * t.tv_nsec;
+}
+
+void irp_enter(int i) {
+    if (irp_stats[i].invocations++) {
+        irp_stats[i].recomputes++;
+        if (irp_stats[i].cause >= 0)
+            irp_stats[irp_stats[i].cause].recomputes_caused++;
+    }
+    irp_stats[i].cause = -1;
+    if (irp_depth == IRP_MAX_DEPTH) {
+        fprintf(stderr, "irp: providers nested deeper than %d\n", IRP_MAX_DEPTH);
+        exit(1);
+    }
+    irp_stack[irp_depth] = i;
+    irp_children[irp_depth] = 0.;
+    irp_start[irp_depth++] = irp_now();
+}
+
+void irp_leave(int i) {
+    double t = irp_now() - irp_start[--irp_depth];
+    double self = t - irp_children[irp_depth];
+    irp_stats[i].inclusive += t;
+    irp_stats[i].exclusive += self;
+    if (irp_depth)
+        irp_children[irp_depth - 1] += t;
+    if (irp_folded) {
+        fputs("main", irp_folded);
+        for (int d = 0; d <= irp_depth; d++)
+            fprintf(irp_folded, ";%s", irp_stats[irp_stack[d]].name);
+        fprintf(irp_folded, " %.0f\n", 1e9 * self);
+    }
+}
+
+void irp_touch(int i) {
+    irp_stats[i].touches++;
+}
+
+static void irp_report(void) {
+    const char *path = getenv("IRP_PROFILE");
+    FILE *f = fopen(path ? path : "irp_profile.json", "w");
+    if (irp_folded)
+        fclose(irp_folded);
+    if (!f)
+        return;
+    fputs("{", f);
+    for (int i = 0; i < irp_n_stat; i++) {
+        struct irp_stat *s = &irp_stats[i];
+        fprintf(f, "%s\n  \"%s\": {\"invocations\": %lu, \"misses\": %lu, \"hits\": %lu, "
+                   "\"recomputes\": %lu, \"touches\": %lu, \"recomputes_caused\": %lu, "
+                   "\"inclusive_ns\": %.0f, \"exclusive_ns\": %.0f}",
+                i ? "," : "", s->name, s->invocations, s->misses, s->hits,
+                s->recomputes, s->touches, s->recomputes_caused, 1e9 * s->inclusive, 1e9 * s->exclusive);
+    }
+    fputs("\n}\n", f);
+    fclose(f);
+}
+
+__attribute__((constructor)) static void irp_profile_init(void) {
+    const char *path = getenv("IRP_FOLDED");
+    for (int i = 0; i < irp_n_stat; i++)
+        irp_stats[i].cause = -1;
+    if (path)
+        irp_folded = fopen(path, "w");
+    atexit(irp_report);
+}
+
+void touch_x();
+int x;
+bool x_provided = false;
+int y;
+bool y_provided = false;
+static void irp_provide_x()
+{
+  x = 3;
+}
+
+void provide_x()
+{
+  irp_enter(irp_stat_x);
+  irp_provide_x();
+  irp_leave(irp_stat_x);
+}
+
+static void irp_provide_y()
+{
+  if (!x_provided)
+  {
+    irp_stats[irp_stat_x].misses++;
+    provide_x();
+    x_provided = true;
+  }
+  else
+  {
+    irp_stats[irp_stat_x].hits++;
+  }
+
+  y = x;
+}
+
+void provide_y()
+{
+  irp_enter(irp_stat_y);
+  irp_provide_y();
+  irp_leave(irp_stat_y);
+}
+
+void touch_x()
+{
+  irp_touch(irp_stat_x);
+  irp_stats[irp_stat_y].cause = irp_stat_x;
+  y_provided = false;
+}
+
+int main()
+{
+  int n = 0;
+  if (!y_provided)
+  {
+    irp_stats[irp_stat_y].misses++;
+    provide_y();
+    y_provided = true;
+  }
+  else
+  {
+    irp_stats[irp_stat_y].hits++;
+  }
+
+  while (y)
+  {
+    n++;
+    if (!x_provided)
+    {
+      irp_stats[irp_stat_x].misses++;
+      provide_x();
+      x_provided = true;
+    }
+    else
+    {
+      irp_stats[irp_stat_x].hits++;
+    }
+
+    x = x - 1;
+    touch_x();
+    if (!y_provided)
+    {
+      irp_stats[irp_stat_y].misses++;
+      provide_y();
+      y_provided = true;
+    }
+    else
+    {
+      irp_stats[irp_stat_y].hits++;
+    }
+
+  }
+
+  printf("n = %d\n", n);
+  return 0;
+}
+
+
@@ -0,0 +1,42 @@
+#include <stdbool.h>
+#include <stdio.h>
+#include <stdlib.h>
+
+int n;
+bool n_provided = false;
+unsigned long squares;
+bool squares_provided = false;
+void provide_n()
+{
+  n = 5;
+}
+
+void provide_squares()
+{
+  squares = 0;
+  if (!n_provided)
+  {
+    provide_n();
+    n_provided = true;
+  }
+
+  for (int i = 0; i < n; i++)
+  {
+    squares += i * i;
+  }
+
+}
+
+int main()
+{
+  if (!squares_provided)
+  {
+    provide_squares();
+    squares_provided = true;
+  }
+
+  printf("squares = %lu\n", squares);
+  return 0;
+}
+
+
@@ -0,0 +1,69 @@
+#include <stdbool.h>
+#include <stdio.h>
+
+void touch_n();
+int n;
+bool n_provided = false;
+int s;
+int q;
+bool q__s_provided = false;
+int calls = 0;
+void provide_n()
+{
+  n = 4;
+}
+
+void provide_sprovide_q()
+{
+  calls++;
+  s = 0;
+  q = 0;
+  if (!n_provided)
+  {
+    provide_n();
+    n_provided = true;
+  }
+
+  for (int i = 0; i < n; i++)
+  {
+    s += i;
+    q += i * i;
+  }
+
+}
+
+void touch_n()
+{
+  q__s_provided = false;
+}
+
+int main()
+{
+  if (!q__s_provided)
+  {
+    provide_sprovide_q();
+    q__s_provided = true;
+  }
+
+  printf("s = %d, q = %d\n", s, q);
+  printf("q = %d\n", q);
+  if (!n_provided)
+  {
+    provide_n();
+    n_provided = true;
+  }
+
+  n = 6;
+  touch_n();
+  if (!q__s_provided)
+  {
+    provide_sprovide_q();
+    q__s_provided = true;
+  }
+
+  printf("s = %d, q = %d\n", s, q);
+  printf("calls = %d\n", calls);
+  return 0;
+}
+
+
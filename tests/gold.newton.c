@@ -63,8 +63,9 @@ void provide_x_next()
 
 void touch_x()
 {
-  bool f_provided = false;
-  bool x_next_provided = false;
+  f_provided = false;
+  fprime_provided = false;
+  x_next_provided = false;
 }
 
 int main()
@@ -0,0 +1,202 @@
+#include <stdbool.h>
+#include <stdio.h>
+#include <math.h>
+
+#include <pthread.h>
+void touch_x();
+float f;
+pthread_mutex_t irp_mutex_f = PTHREAD_MUTEX_INITIALIZER;
+_Atomic bool f_provided = false;
+float fprime;
+pthread_mutex_t irp_mutex_fprime = PTHREAD_MUTEX_INITIALIZER;
+_Atomic bool fprime_provided = false;
+float x;
+pthread_mutex_t irp_mutex_x = PTHREAD_MUTEX_INITIALIZER;
+_Atomic bool x_provided = false;
+float x_next;
+pthread_mutex_t irp_mutex_x_next = PTHREAD_MUTEX_INITIALIZER;
+_Atomic bool x_next_provided = false;
+void provide_x()
+{
+  x = 1;
+}
+
+void provide_f()
+{
+  if (!x_provided)
+  {
+    pthread_mutex_lock(&irp_mutex_x);
+    if (!x_provided)
+    {
+      provide_x();
+      x_provided = true;
+    }
+
+    pthread_mutex_unlock(&irp_mutex_x);
+  }
+
+  f = cos(x) - x;
+}
+
+void provide_fprime()
+{
+  if (!x_provided)
+  {
+    pthread_mutex_lock(&irp_mutex_x);
+    if (!x_provided)
+    {
+      provide_x();
+      x_provided = true;
+    }
+
+    pthread_mutex_unlock(&irp_mutex_x);
+  }
+
+  fprime = (-sin(x)) - 1;
+}
+
+void provide_x_next()
+{
+  if (!x_provided)
+  {
+    pthread_mutex_lock(&irp_mutex_x);
+    if (!x_provided)
+    {
+      provide_x();
+      x_provided = true;
+    }
+
+    pthread_mutex_unlock(&irp_mutex_x);
+  }
+
+  if (!fprime_provided)
+  {
+    pthread_mutex_lock(&irp_mutex_fprime);
+    if (!fprime_provided)
+    {
+      provide_fprime();
+      fprime_provided = true;
+    }
+
+    pthread_mutex_unlock(&irp_mutex_fprime);
+  }
+
+  if (!f_provided)
+  {
+    pthread_mutex_lock(&irp_mutex_f);
+    if (!f_provided)
+    {
+      provide_f();
+      f_provided = true;
+    }
+
+    pthread_mutex_unlock(&irp_mutex_f);
+  }
+
+  x_next = x - (f / fprime);
+}
+
+void touch_x()
+{
+  f_provided = false;
+  fprime_provided = false;
+  x_next_provided = false;
+}
+
+int main()
+{
+  if (!x_provided)
+  {
+    pthread_mutex_lock(&irp_mutex_x);
+    if (!x_provided)
+    {
+      provide_x();
+      x_provided = true;
+    }
+
+    pthread_mutex_unlock(&irp_mutex_x);
+  }
+
+  printf("x %f\n", x);
+  if (!x_next_provided)
+  {
+    pthread_mutex_lock(&irp_mutex_x_next);
+    if (!x_next_provided)
+    {
+      provide_x_next();
+      x_next_provided = true;
+    }
+
+    pthread_mutex_unlock(&irp_mutex_x_next);
+  }
+
+  if (!x_provided)
+  {
+    pthread_mutex_lock(&irp_mutex_x);
+    if (!x_provided)
+    {
+      provide_x();
+      x_provided = true;
+    }
+
+    pthread_mutex_unlock(&irp_mutex_x);
+  }
+
+  while ((x - x_next) > 1.e-9)
+  {
+    if (!x_next_provided)
+    {
+      pthread_mutex_lock(&irp_mutex_x_next);
+      if (!x_next_provided)
+      {
+        provide_x_next();
+        x_next_provided = true;
+      }
+
+      pthread_mutex_unlock(&irp_mutex_x_next);
+    }
+
+    if (!x_provided)
+    {
+      pthread_mutex_lock(&irp_mutex_x);
+      if (!x_provided)
+      {
+        provide_x();
+        x_provided = true;
+      }
+
+      pthread_mutex_unlock(&irp_mutex_x);
+    }
+
+    x = x_next;
+    touch_x();
+    if (!x_next_provided)
+    {
+      pthread_mutex_lock(&irp_mutex_x_next);
+      if (!x_next_provided)
+      {
+        provide_x_next();
+        x_next_provided = true;
+      }
+
+      pthread_mutex_unlock(&irp_mutex_x_next);
+    }
+
+  }
+
+  if (!x_provided)
+  {
+    pthread_mutex_lock(&irp_mutex_x);
+    if (!x_provided)
+    {
+      provide_x();
+      x_provided = true;
+    }
+
+    pthread_mutex_unlock(&irp_mutex_x);
+  }
+
+  printf("x convergerded %f\n", x);
+}
+
+
@@ -0,0 +1,290 @@
+#include <stdbool.h>
+#include <stdio.h>
+#include <sys/stat.h>
+#include <unistd.h>
+
+#include <stdio.h>
+#include <stdlib.h>
+#include <sys/mman.h>
+
+static void *irp_alloc(unsigned long size, int use_mmap)
+{
+    void *p = use_mmap ? mmap(NULL, size, PROT_READ | PROT_WRITE,
+                              MAP_PRIVATE | MAP_ANONYMOUS | MAP_NORESERVE, -1, 0)
+                       : calloc(1, size);
+    if (!p || p == MAP_FAILED) {
+        fprintf(stderr, "irp: cannot allocate %lu bytes\n", size);
+        exit(1);
+    }
+    return p;
+}
+
+#include <fcntl.h>
+#include <stdio.h>
+#include <stdlib.h>
+#include <string.h>
+#include <sys/mman.h>
+#include <sys/stat.h>
+#include <unistd.h>
+
+struct irp_region {
+    void *address;
+    unsigned long size;
+    void **pointer;  /* heap or mmap storage: the address is *pointer */
+    int use_mmap;
+};
+
+struct irp_snapshot_header {
+    char magic[8];
+    unsigned long layout, n_region;
+};
+
+static unsigned long irp_align(unsigned long offset, unsigned long alignment) {
+    return (offset + alignment - 1) / alignment * alignment;
+}
+
+static int irp_snapshot_write(const char *path, struct irp_region *r, unsigned long n, unsigned long layout) {
+    unsigned long page = sysconf(_SC_PAGESIZE);
+    unsigned long *table = malloc(2 * (n + 1) * sizeof(unsigned long));
+    unsigned long offset = irp_align(sizeof(struct irp_snapshot_header) + 2 * n * sizeof(unsigned long), page);
+    for (unsigned long i = 0; i < n; i++) {
+        if (r[i].pointer) {
+            r[i].address = *r[i].pointer;
+            if (!r[i].address)
+                r[i].size = 0;
+            offset = irp_align(offset, page);
+        } else
+            offset = irp_align(offset, 16);
+        table[2 * i] = offset;
+        table[2 * i + 1] = r[i].size;
+        offset += r[i].size;
+    }
+
+    /* Unique, two processes may write the same snapshot */
+    char *tmp = malloc(strlen(path) + 32);
+    sprintf(tmp, "%s.%d.tmp", path, (int) getpid());
+    int fd = open(tmp, O_RDWR | O_CREAT | O_TRUNC, 0644);
+    char *map = MAP_FAILED;
+    if (fd >= 0 && !ftruncate(fd, offset))
+        map = mmap(NULL, offset, PROT_READ | PROT_WRITE, MAP_SHARED, fd, 0);
+    if (map == MAP_FAILED) {
+        perror(path);
+        if (fd >= 0)
+            close(fd);
+        free(tmp);
+        free(table);
+        return -1;
+    }
+
+    struct irp_snapshot_header header = {"IRPSNAP1", layout, n};
+    memcpy(map, &header, sizeof(header));
+    memcpy(map + sizeof(header), table, 2 * n * sizeof(unsigned long));
+    for (unsigned long i = 0; i < n; i++)
+        memcpy(map + table[2 * i], r[i].address, r[i].size);
+    munmap(map, offset);
+    close(fd);
+    int status = rename(tmp, path);
+    if (status)
+        perror(path);
+    free(tmp);
+    free(table);
+    return status;
+}
+
+static int irp_snapshot_read(const char *path, struct irp_region *r, unsigned long n, unsigned long layout) {
+    int fd = open(path, O_RDONLY);
+    struct stat st;
+    if (fd < 0 || fstat(fd, &st)) {
+        perror(path);
+        if (fd >= 0)
+            close(fd);
+        return -1;
+    }
+    if (st.st_size < (off_t) sizeof(struct irp_snapshot_header)) {
+        fprintf(stderr, "%s: not a snapshot of this program\n", path);
+        close(fd);
+        return -1;
+    }
+    char *map = mmap(NULL, st.st_size, PROT_READ, MAP_PRIVATE, fd, 0);
+    if (map == MAP_FAILED) {
+        perror(path);
+        close(fd);
+        return -1;
+    }
+
+    struct irp_snapshot_header *header = (struct irp_snapshot_header *) map;
+    unsigned long *table = (unsigned long *) (map + sizeof(*header));
+    unsigned long file_size = st.st_size;
+    int status = 0;
+    if (memcmp(header->magic, "IRPSNAP1", 8) || header->layout != layout || header->n_region != n
+        || sizeof(*header) + 2 * n * sizeof(unsigned long) > file_size) {
+        fprintf(stderr, "%s: not a snapshot of this program\n", path);
+        status = -1;
+    }
+    /* Everything is checked before the first copy: a snapshot which cannot be restored leaves the state as it is */
+    for (unsigned long i = 0; !status && i < n; i++) {
+        unsigned long offset = table[2 * i], size = table[2 * i + 1];
+        if (offset > file_size || size > file_size - offset) {
+            fprintf(stderr, "%s: truncated snapshot\n", path);
+            status = -1;
+        } else if (r[i].pointer ? size && *r[i].pointer && size != r[i].size : size != r[i].size) {
+            fprintf(stderr, "%s: not a snapshot of this program\n", path);
+            status = -1;
+        }
+    }
+    /* The storage of the arrays not allocated yet */
+    void **fresh = calloc(n + 1, sizeof(void *));
+    if (!fresh) {
+        perror(path);
+        status = -1;
+    }
+    for (unsigned long i = 0; !status && i < n; i++) {
+        unsigned long offset = table[2 * i], size = table[2 * i + 1];
+        if (!r[i].pointer || !size || *r[i].pointer)
+            continue;
+        /* With mmap, copy-on-write: the pages are read from the snapshot when used */
+        fresh[i] = r[i].use_mmap ? mmap(NULL, size, PROT_READ | PROT_WRITE, MAP_PRIVATE, fd, offset) : malloc(size);
+        if (!fresh[i] || fresh[i] == MAP_FAILED) {
+            perror(path);
+            fresh[i] = 0;
+            status = -1;
+        }
+    }
+    for (unsigned long i = 0; fresh && i < n; i++) {
+        unsigned long offset = table[2 * i], size = table[2 * i + 1];
+        if (status) {
+            if (fresh[i] && r[i].use_mmap)
+                munmap(fresh[i], size);
+            else
+                free(fresh[i]);
+        } else if (!r[i].pointer) {
+            memcpy(r[i].address, map + offset, size);
+        } else if (fresh[i]) {
+            if (!r[i].use_mmap)
+                memcpy(fresh[i], map + offset, size);
+            *r[i].pointer = fresh[i];
+        } else if (size) {
+            memcpy(*r[i].pointer, map + offset, size);
+        }
+    }
+    free(fresh);
+    munmap(map, st.st_size);
+    close(fd);
+    return status;
+}
+
+int irp_checkpoint(const char *path);
+int irp_restore(const char *path);
+int a;
+bool a_provided = false;
+double *values;
+bool values_provided = false;
+void provide_a()
+{
+  printf("provide a\n");
+  a = 42;
+}
+
+static void irp_alloc_values(void)
+{
+  if (!values)
+    values = irp_alloc(1000 * (sizeof(*values)), 0);
+
+}
+
+void provide_values()
+{
+  irp_alloc_values();
+  printf("provide values\n");
+  for (int i = 0; i < 1000; i++)
+  {
+    if (!a_provided)
+    {
+      provide_a();
+      a_provided = true;
+    }
+
+    values[i] = a * i;
+  }
+
+}
+
+static void irp_regions(struct irp_region *r)
+{
+  r[0] = (struct irp_region){&a, sizeof(a), 0, 0};
+  r[1] = (struct irp_region){&a_provided, sizeof(a_provided), 0, 0};
+  r[2] = (struct irp_region){0, 1000 * (sizeof(*values)), (void **) (&values), 0};
+  r[3] = (struct irp_region){&values_provided, sizeof(values_provided), 0, 0};
+}
+
+int irp_checkpoint(const char *path)
+{
+  struct irp_region r[4 + 1];
+  irp_regions(r);
+  return irp_snapshot_write(path, r, 4, 0xc072db3c2badf04UL);
+}
+
+int irp_restore(const char *path)
+{
+  struct irp_region r[4 + 1];
+  irp_regions(r);
+  return irp_snapshot_read(path, r, 4, 0xc072db3c2badf04UL);
+}
+
+int main()
+{
+  const char *path = "irp_snapshot_test.snap";
+  struct stat st;
+  if (!values_provided)
+  {
+    provide_values();
+    values_provided = true;
+  }
+
+  printf("values[999] = %g\n", values[999]);
+  irp_checkpoint(path);
+  if (!a_provided)
+  {
+    provide_a();
+    a_provided = true;
+  }
+
+  a = 7;
+  stat(path, &st);
+  truncate(path, st.st_size - 100);
+  printf("restore = %d\n", irp_restore(path));
+  if (!a_provided)
+  {
+    provide_a();
+    a_provided = true;
+  }
+
+  printf("a = %d\n", a);
+  irp_checkpoint(path);
+  if (!a_provided)
+  {
+    provide_a();
+    a_provided = true;
+  }
+
+  a = 1;
+  printf("restore = %d\n", irp_restore(path));
+  if (!a_provided)
+  {
+    provide_a();
+    a_provided = true;
+  }
+
+  printf("a = %d\n", a);
+  if (!values_provided)
+  {
+    provide_values();
+    values_provided = true;
+  }
+
+  printf("values[999] = %g\n", values[999]);
+  unlink(path);
+  return 0;
+}
+
+
@@ -0,0 +1,83 @@
+#include <stdbool.h>
+#include <pthread.h>
+#include <stdio.h>
+
+#include <pthread.h>
+int n;
+pthread_mutex_t irp_mutex_n = PTHREAD_MUTEX_INITIALIZER;
+_Atomic bool n_provided = false;
+long total;
+pthread_mutex_t irp_mutex_total = PTHREAD_MUTEX_INITIALIZER;
+_Atomic bool total_provided = false;
+int calls = 0;
+void provide_n()
+{
+  n = 1000;
+}
+
+void provide_total()
+{
+  calls++;
+  total = 0;
+  if (!n_provided)
+  {
+    pthread_mutex_lock(&irp_mutex_n);
+    if (!n_provided)
+    {
+      provide_n();
+      n_provided = true;
+    }
+
+    pthread_mutex_unlock(&irp_mutex_n);
+  }
+
+  for (int i = 0; i < n; i++)
+  {
+    total += i;
+  }
+
+}
+
+void *worker(void *arg)
+{
+  long *result = arg;
+  if (!total_provided)
+  {
+    pthread_mutex_lock(&irp_mutex_total);
+    if (!total_provided)
+    {
+      provide_total();
+      total_provided = true;
+    }
+
+    pthread_mutex_unlock(&irp_mutex_total);
+  }
+
+  *result = total;
+  return (void *) 0;
+}
+
+int main()
+{
+  pthread_t l_thread[8];
+  long l_result[8];
+  for (int i = 0; i < 8; i++)
+  {
+    pthread_create(&l_thread[i], (void *) 0, worker, &l_result[i]);
+  }
+
+  for (int i = 0; i < 8; i++)
+  {
+    pthread_join(l_thread[i], (void *) 0);
+  }
+
+  for (int i = 0; i < 8; i++)
+  {
+    printf("%ld\n", l_result[i]);
+  }
+
+  printf("calls = %d\n", calls);
+  return 0;
+}
+
+
@@ -0,0 +1,94 @@
+#include <stdbool.h>
+#include <stdio.h>
+
+#include <stdio.h>
+#include <stdlib.h>
+#include <sys/mman.h>
+
+static void *irp_alloc(unsigned long size, int use_mmap)
+{
+    void *p = use_mmap ? mmap(NULL, size, PROT_READ | PROT_WRITE,
+                              MAP_PRIVATE | MAP_ANONYMOUS | MAP_NORESERVE, -1, 0)
+                       : calloc(1, size);
+    if (!p || p == MAP_FAILED) {
+        fprintf(stderr, "irp: cannot allocate %lu bytes\n", size);
+        exit(1);
+    }
+    return p;
+}
+
+void irp_init();
+void touch_n();
+int n;
+double sum;
+int total;
+double *values;
+void provide_n()
+{
+  n = 4;
+}
+
+void provide_total()
+{
+  total = 0;
+  for (int i = 0; i < n; i++)
+  {
+    total += i;
+  }
+
+}
+
+static void irp_alloc_values(void)
+{
+  if (!values)
+    values = irp_alloc(8 * (sizeof(*values)), 0);
+
+}
+
+void provide_values()
+{
+  irp_alloc_values();
+  for (int i = 0; i < n; i++)
+  {
+    values[i] = 0.5 * i;
+  }
+
+}
+
+void provide_sum()
+{
+  sum = 0.;
+  for (int i = 0; i < n; i++)
+  {
+    sum += values[i];
+  }
+
+}
+
+void touch_n()
+{
+  provide_total();
+  provide_values();
+  provide_sum();
+}
+
+void irp_init()
+{
+  provide_n();
+  provide_total();
+  provide_values();
+  provide_sum();
+}
+
+int main()
+{
+  irp_init();
+  printf("sum = %g\n", sum);
+  printf("total = %d\n", total);
+  n = 6;
+  touch_n();
+  printf("total = %d\n", total);
+  return 0;
+}
+
+
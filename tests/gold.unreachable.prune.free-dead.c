@@ -0,0 +1,157 @@
+#include <stdbool.h>
+#include <stdio.h>
+
+#include <string.h>
+#include <stdio.h>
+#include <stdlib.h>
+#include <sys/mman.h>
+
+static void *irp_alloc(unsigned long size, int use_mmap)
+{
+    void *p = use_mmap ? mmap(NULL, size, PROT_READ | PROT_WRITE,
+                              MAP_PRIVATE | MAP_ANONYMOUS | MAP_NORESERVE, -1, 0)
+                       : calloc(1, size);
+    if (!p || p == MAP_FAILED) {
+        fprintf(stderr, "irp: cannot allocate %lu bytes\n", size);
+        exit(1);
+    }
+    return p;
+}
+
+static void irp_free(void *p, unsigned long size, int use_mmap)
+{
+    if (use_mmap)
+        munmap(p, size);
+    else
+        free(p);
+}
+
+void touch_n();
+int n;
+bool n_provided = false;
+double sum;
+bool sum_provided = false;
+int total;
+bool total_provided = false;
+double *values;
+bool values_provided = false;
+void provide_n()
+{
+  n = 4;
+}
+
+void provide_total()
+{
+  total = 0;
+  if (!n_provided)
+  {
+    provide_n();
+    n_provided = true;
+  }
+
+  for (int i = 0; i < n; i++)
+  {
+    total += i;
+  }
+
+}
+
+static void irp_alloc_values(void)
+{
+  if (!values)
+    values = irp_alloc(8 * (sizeof(*values)), 0);
+
+}
+
+void provide_values()
+{
+  irp_alloc_values();
+  if (!n_provided)
+  {
+    provide_n();
+    n_provided = true;
+  }
+
+  for (int i = 0; i < n; i++)
+  {
+    values[i] = 0.5 * i;
+  }
+
+}
+
+void provide_sum()
+{
+  sum = 0.;
+  if (!n_provided)
+  {
+    provide_n();
+    n_provided = true;
+  }
+
+  for (int i = 0; i < n; i++)
+  {
+    if (!values_provided)
+    {
+      provide_values();
+      values_provided = true;
+    }
+
+    sum += values[i];
+  }
+
+}
+
+void touch_n()
+{
+  sum_provided = false;
+  total_provided = false;
+  values_provided = false;
+}
+
+static void irp_free_values(void)
+{
+  if (values)
+  {
+    irp_free(values, 8 * (sizeof(*values)), 0);
+    values = 0;
+  }
+
+  values_provided = false;
+}
+
+int main()
+{
+  if (!sum_provided)
+  {
+    provide_sum();
+    sum_provided = true;
+  }
+
+  irp_free_values();
+  printf("sum = %g\n", sum);
+  if (!total_provided)
+  {
+    provide_total();
+    total_provided = true;
+  }
+
+  printf("total = %d\n", total);
+  if (!n_provided)
+  {
+    provide_n();
+    n_provided = true;
+  }
+
+  n = 6;
+  touch_n();
+  if (!total_provided)
+  {
+    provide_total();
+    total_provided = true;
+  }
+
+  printf("total = %d\n", total);
+  return 0;
+}
+
+
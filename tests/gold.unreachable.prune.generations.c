@@ -0,0 +1,135 @@
+#include <stdbool.h>
+#include <stdio.h>
+
+#include <stdio.h>
+#include <stdlib.h>
+#include <sys/mman.h>
+
+static void *irp_alloc(unsigned long size, int use_mmap)
+{
+    void *p = use_mmap ? mmap(NULL, size, PROT_READ | PROT_WRITE,
+                              MAP_PRIVATE | MAP_ANONYMOUS | MAP_NORESERVE, -1, 0)
+                       : calloc(1, size);
+    if (!p || p == MAP_FAILED) {
+        fprintf(stderr, "irp: cannot allocate %lu bytes\n", size);
+        exit(1);
+    }
+    return p;
+}
+
+void touch_n();
+unsigned long n_generation = 0;
+int n;
+bool n_provided = false;
+double sum;
+unsigned long sum_provided = -1;
+int total;
+unsigned long total_provided = -1;
+double *values;
+unsigned long values_provided = -1;
+void provide_n()
+{
+  n = 4;
+}
+
+void provide_total()
+{
+  total = 0;
+  if (!n_provided)
+  {
+    provide_n();
+    n_provided = true;
+  }
+
+  for (int i = 0; i < n; i++)
+  {
+    total += i;
+  }
+
+}
+
+static void irp_alloc_values(void)
+{
+  if (!values)
+    values = irp_alloc(8 * (sizeof(*values)), 0);
+
+}
+
+void provide_values()
+{
+  irp_alloc_values();
+  if (!n_provided)
+  {
+    provide_n();
+    n_provided = true;
+  }
+
+  for (int i = 0; i < n; i++)
+  {
+    values[i] = 0.5 * i;
+  }
+
+}
+
+void provide_sum()
+{
+  sum = 0.;
+  if (!n_provided)
+  {
+    provide_n();
+    n_provided = true;
+  }
+
+  for (int i = 0; i < n; i++)
+  {
+    if (values_provided != n_generation)
+    {
+      provide_values();
+      values_provided = n_generation;
+    }
+
+    sum += values[i];
+  }
+
+}
+
+void touch_n()
+{
+  n_generation++;
+}
+
+int main()
+{
+  if (sum_provided != n_generation)
+  {
+    provide_sum();
+    sum_provided = n_generation;
+  }
+
+  printf("sum = %g\n", sum);
+  if (total_provided != n_generation)
+  {
+    provide_total();
+    total_provided = n_generation;
+  }
+
+  printf("total = %d\n", total);
+  if (!n_provided)
+  {
+    provide_n();
+    n_provided = true;
+  }
+
+  n = 6;
+  touch_n();
+  if (total_provided != n_generation)
+  {
+    provide_total();
+    total_provided = n_generation;
+  }
+
+  printf("total = %d\n", total);
+  return 0;
+}
+
+
@@ -0,0 +1,27 @@
+from irpc.arrays import array_entities
+
+import unittest
+
+class TestArrayEntities(unittest.TestCase):
+    from pycparser import c_parser
+    parser = c_parser.CParser()
+
+    def entities(self, pragma):
+        src = f'void provide_v(){{\n#pragma irp {pragma}\ndouble v[64];\n}}\n'
+        return array_entities(self.parser.parse(src).ext[0], {'v'})
+
+    def test_annotation(self):
+        array = self.entities('storage(heap) chunk(16)')['v']
+        assert (array.storage == 'heap' and array.chunk == 16)
+
+    def test_invalid_chunk(self):
+        for chunk in ['abc', '0', '-4', '1.5']:
+            with self.assertRaisesRegex(ValueError, 'v: invalid chunk'):
+                self.entities(f'chunk({chunk})')
+
+    def test_invalid_storage(self):
+        with self.assertRaisesRegex(ValueError, 'v: unknown storage'):
+            self.entities('storage(stack)')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,327 @@
+from irpc.bindingEntity import entity2Compound, entity2CompoundSimple, entity_index, normalize
+from pycparser.c_ast import Compound, ID, If, For, DoWhile, Switch, BinaryOp, Assignment, FuncCall, ExprList
+
+import sys
+import unittest
+
+class TestBinding(unittest.TestCase):
+    from pycparser import c_parser
+    parser = c_parser.CParser()
+
+    def src2d(self, src, argv):
+        ast = self.parser.parse(src)
+        return entity2Compound(ast.ext[0].body, set(argv))
+
+#  __
+# (_  o ._ _  ._  |  _
+# __) | | | | |_) | (/_
+#             |
+
+    def test_simple(self):
+        src = 'void foo(){ _ = a;}' ''
+        d = self.src2d(src, ['a'])
+        assert (d['a'].pop().block_items[0].lvalue.name == '_')
+
+    def test_multiple_entity(self):
+        src = 'void foo(){ _ = a + a ;}' ''
+        d = self.src2d(src, ['a'])
+        assert (len(d['a']) == 1)
+        assert (d['a'].pop().block_items[0].lvalue.name == '_')
+
+    def test_simple_function(self):
+        src = 'void foo(){ _ = f(a);}'
+        d = self.src2d(src, ['a'])
+        assert (d['a'].pop().block_items[0].lvalue.name == '_')
+
+    def test_simple_expresion(self):
+        src = 'void foo(){ _ = a+1 ;}'
+        d = self.src2d(src, ['a'])
+        assert (d['a'].pop().block_items[0].lvalue.name == '_')
+
+    def test_function_expresion(self):
+        src = 'void foo(){ _ = foo(a+1) ;}'
+        d = self.src2d(src, ['a'])
+        assert (d['a'].pop().block_items[0].lvalue.name == '_')
+
+#  _
+# /   _  ._   _| o _|_ o  _  ._   _. |
+# \_ (_) | | (_| |  |_ | (_) | | (_| |
+#
+
+    def test_conditional_host_condition(self):
+        src = 'void foo() { if (a) { _; } }'
+        d = self.src2d(src, ['a'])
+        assert (type(d['a'].pop().block_items[0]) == If)
+
+    def test_conditional_one_branch(self):
+        src = 'void foo() { if (_) { x = a; } }'
+        d = self.src2d(src, ['a'])
+        assert (d['a'].pop().block_items[0].lvalue.name == 'x')
+
+    def test_conditional(self):
+        src = 'void foo() { if (_) { x = a; } else { y = b ; } }'
+        d = self.src2d(src, ['a', 'b'])
+        assert (d['a'].pop().block_items[0].lvalue.name == 'x')
+        assert (d['b'].pop().block_items[0].lvalue.name == 'y')
+
+    def test_conditional_hosting(self):
+        src = 'void foo() { if (_) { x = a; } else { y = a ; } }'
+        d = self.src2d(src, ['a'])
+        assert (len(d['a']) == 1)
+        assert (type(d['a'].pop().block_items[0]) == If)
+
+    def test_conditional_one_branch_hosting_before(self):
+        src = '''
+void foo() {
+   x = a;
+   if (_) { y = a; }
+}'''
+        d = self.src2d(src, ['a'])
+        assert (len(d['a']) == 1)
+        assert (d['a'].pop().block_items[0].lvalue.name == 'x')
+
+    def test_conditional_one_branch_hosting_after(self):
+        src = '''
+void foo() {
+   if (_) { y = a; }
+   x = a;
+}'''
+        d = self.src2d(src, ['a'])
+        assert (len(d['a']) == 1)
+        assert (type(d['a'].pop().block_items[0]) == If)
+
+    def test_conditional_two_branch_hosting_before(self):
+        src = '''
+void foo() {
+   x = a ;
+   if (_) { y = a; } else { z = b; }
+}'''
+        d = self.src2d(src, ['a', 'b'])
+        assert (len(d['a']) == 1)
+        assert (d['a'].pop().block_items[0].lvalue.name == 'x')
+        assert (d['b'].pop().block_items[0].lvalue.name == 'z')
+
+#  _
+# |_ _  ._
+# | (_) |
+#
+
+    def test_for(self):
+        src = ' void foo() { for  (_; _; _ ) { a; } }'
+        d = self.src2d(src, ['a'])
+        assert (type(d['a'].pop().block_items[0]) == For)
+
+    def test_for_host1(self):
+        src = ' void foo() { for  (a; _; _ ) { _; } }'
+        d = self.src2d(src, ['a'])
+        assert (type(d['a'].pop().block_items[0]) == For)
+
+    def test_for_host2(self):
+        src = ' void foo() { for  (_; a; _ ) { _; } }'
+        d = self.src2d(src, ['a'])
+        assert (type(d['a'].pop().block_items[0]) == For)
+
+    def test_for_host3(self):
+        src = ' void foo() { for  (_; _; a ) { _; } }'
+        d = self.src2d(src, ['a'])
+        assert (type(d['a'].pop().block_items[0]) == For)
+
+    def test_do_while(self):
+        src = ' void foo() { do { x = a; } while (b); }'
+        d = self.src2d(src, ['a', 'b'])
+        assert (type(d['a'].pop().block_items[0]) == DoWhile)
+        assert (type(d['b'].pop().block_items[0]) == DoWhile)
+
+#  __
+# (_      o _|_  _ |_
+# __) \/\/ |  |_ (_ | |
+#
+# The cases are made compounds by `normalize`
+
+    def test_switch_hosting(self):
+        src = 'void foo() { switch (c) { case 1: x = a; break; default: y = a; } }'
+        funcdef = self.parser.parse(src).ext[0]
+        d = entity2Compound(normalize(funcdef).body, {'a'})
+        assert (len(d['a']) == 1)
+        assert (type(d['a'].pop().block_items[0]) == Switch)
+
+    def test_switch_no_default(self):
+        src = 'void foo() { switch (c) { case 1: x = a; break; case 2: y = a; } }'
+        funcdef = self.parser.parse(src).ext[0]
+        d = entity2Compound(normalize(funcdef).body, {'a'})
+        assert ({c.block_items[0].lvalue.name for c in d['a']} == {'x', 'y'})
+
+#
+# |\ |  _   _ _|_  _   _|
+# | \| (/_ _>  |_ (/_ (_|
+#
+
+    def test_nested_compound(self):
+        src = '''
+void foo() {
+   x = a;
+   { y = b; }
+}'''
+        d = self.src2d(src, ['a', 'b'])
+        assert (d['a'].pop().block_items[0].lvalue.name == 'x')
+        assert (d['b'].pop().block_items[0].lvalue.name == 'x')
+
+    def test_nested_if(self):
+        src = '''
+void foo() {
+    if (_) {
+        x = a;
+        if (_) { y = b; }
+   }
+}'''
+        d = self.src2d(src, ['a', 'b'])
+        assert (d['a'].pop().block_items[0].lvalue.name == 'x')
+        assert (d['b'].pop().block_items[0].lvalue.name == 'y')
+
+    def test_nested_if_hosting(self):
+        src = '''
+void foo() {
+    if (_) {
+        x = a;
+        if (_) { y = a; }
+   }
+}'''
+        d = self.src2d(src, ['a'])
+        assert (len(d['a']) == 1)
+        assert (d['a'].pop().block_items[0].lvalue.name == 'x')
+
+    def test_nested_if_double(self):
+        src = '''
+void foo() {
+    if (_) {
+        if (_) { x = a; }
+   } else { y = a ; }
+}'''
+        d = self.src2d(src, ['a'])
+        assert (len(d['a']) == 2)
+        assert ( {c.block_items[0].lvalue.name for c in d['a']} == {'x','y'} )
+
+    def test_nested_if_super_hosting_before(self):
+        src = '''
+void foo() {
+    x = a;
+    if (_) {
+        if (_) { y = a; }
+   }
+}'''
+        d = self.src2d(src, ['a'])
+        assert (len(d['a']) == 1)
+        assert (d['a'].pop().block_items[0].lvalue.name == 'x')
+
+    def test_nested_if_super_hosting_after(self):
+        src = '''
+void foo() {
+    if (c1) {
+        if (c2) { y = a; }
+   }
+   x = a;
+}'''
+        d = self.src2d(src, {'a'})
+        assert (len(d['a']) == 1)
+        assert (d['a'].pop().block_items[0].cond.name == 'c1')
+
+    def test_nested_if_for(self):
+        src = '''
+void foo() {
+    if (_) {
+        x = a;
+        for( _ ; _; _) { y = b;}
+   }
+}'''
+        d = self.src2d(src, ['a', 'b'])
+        assert (d['a'].pop().block_items[0].lvalue.name == 'x')
+        assert (d['b'].pop().block_items[0].lvalue.name == 'x')
+
+
+#          _
+# |\ | __ /   _  ._ _  ._   _      ._   _|
+# | \|    \_ (_) | | | |_) (_) |_| | | (_|
+#                      |
+
+    def test_simple_compound(self):
+        src = '''
+void foo() {
+    { x = a; }
+    { y = a; }
+}'''
+        d = self.src2d(src, ['a'])
+        assert (len(d['a']) == 1)
+        assert (d['a'].pop().block_items[0].block_items[0].lvalue.name == 'x')
+
+    def test_nested_if_else_2(self):
+        src = '''
+void foo() {
+    if (_) {
+        if (_) { x = a; }
+   } else { y = a; }
+}'''
+        d = self.src2d(src, ['a'])
+        assert (len(d['a']) == 2)
+        assert ( {c.block_items[0].lvalue.name for c in d['a']} == {'x','y'} )
+
+    def test_nested_if_else_3(self):
+        src = '''
+void foo() {
+    if (c1) {
+        if (c2) { x = a; }
+        else { y = a; }
+   } else { z = a; }
+
+}'''
+        d = self.src2d(src, ['a'])
+        assert (len(d['a']) == 1)
+        assert (d['a'].pop().block_items[0].cond.name == 'c1')
+
+    def test_nested_if_else_4(self):
+        src = '''
+void foo() {
+    if (c1) {
+        if (c2) { x = a; }
+        else { y = a; }
+   }
+
+}'''
+        d = self.src2d(src, ['a'])
+        assert (len(d['a']) == 1)
+        assert (d['a'].pop().block_items[0].cond.name == 'c2')
+
+    def test_many_entities(self):
+        # More entities than the bits of a machine word
+        src = '''
+void foo() {
+    if (c1) { x = e70; }
+    else { y = e70 + e3; }
+    if (c2) { z = e99 + e3; }
+    w = e0;
+}'''
+        d = self.src2d(src, [f'e{i}' for i in range(100)])
+        assert (set(d) == {'e0', 'e3', 'e70', 'e99'})
+        assert (len(d['e70']) == 1)
+        assert (type(d['e70'].pop().block_items[0]) == If)
+        assert ({c.block_items[0].lvalue.name for c in d['e3']} == {'y', 'z'})
+        assert (d['e99'].pop().block_items[0].lvalue.name == 'z')
+        assert (d['e0'].pop().block_items[2].lvalue.name == 'w')
+
+    def test_deep(self):
+        # Deeper than the recursion limit, in statements and in expressions
+        n = 3 * sys.getrecursionlimit()
+        src = 'void foo() { ' + 'if (c) { ' * n + 'x = ' + 'b + (' * n + 'a' + ')' * n + ';' + '}' * n + ' }'
+        funcdef = self.parser.parse(src).ext[0]
+        d = entity2Compound(funcdef.body, {'a', 'b'})
+        assert (d['a'].pop().block_items[0].lvalue.name == 'x')
+        assert (d['b'].pop().block_items[0].lvalue.name == 'x')
+        index = entity_index(funcdef, {'a', 'b'})
+        ((compound, i),) = index.uses['a']
+        assert (compound.block_items[i].lvalue.name == 'x')
+        assert (index.uses['b'] == index.uses['a'])
+        assert (entity2CompoundSimple(funcdef, {'a', 'b'}, ID) == index.uses)
+
+
+
+if __name__ == "__main__":
+    unittest.main()
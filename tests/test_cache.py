@@ -0,0 +1,76 @@
+from irpc.cache import IndexCache, compound_paths, identifiers
+from pycparser.c_ast import FuncDef
+
+import os
+import tempfile
+import unittest
+
+class TestIndexCache(unittest.TestCase):
+    from pycparser import c_parser
+    parser = c_parser.CParser()
+
+    def index(self, cache, src, s_entity):
+        f = next(node for node in cache.parse(self.parser, src, 'foo.irp.c').ext if isinstance(node, FuncDef))
+        return f, cache.entity_index(f, s_entity)
+
+    def check_cached(self, src, s_entity):
+        with tempfile.TemporaryDirectory() as directory:
+            # Cold, then warm in a new run: the index read back must be the one computed
+            cold = IndexCache(directory)
+            f, index = self.index(cold, src, s_entity)
+            cold.save()
+            assert (cold.misses == 1 and cold.n_parsed == 1)
+
+            warm = IndexCache(directory)
+            g, cached = self.index(warm, src, s_entity)
+            assert (warm.hits == 1 and warm.n_parsed == 0)
+
+            d_f, d_g = compound_paths(f), compound_paths(g)
+            assert ({e: {d_f[c] for c in l_c} for e, l_c in index.hoisting.items()} ==
+                    {e: {d_g[c] for c in l_c} for e, l_c in cached.hoisting.items()})
+            assert ({e: {(d_f[c], i) for c, i in l_use} for e, l_use in index.uses.items()} ==
+                    {e: {(d_g[c], i) for c, i in l_use} for e, l_use in cached.uses.items()})
+            return index, f
+
+    def test_simple(self):
+        index, f = self.check_cached('void foo(){ _ = a; if (b) _ = a; }', {'a', 'b'})
+        assert (index.hoisting.keys() == {'a', 'b'})
+
+    def test_else_if(self):
+        # The compound made for the `else if` is not in the function: its entities are bound to the enclosing one
+        src = 'void foo(){ if (x) _ = 0; else if (a) _ = b; }'
+        index, f = self.check_cached(src, {'a', 'b'})
+        d_path = compound_paths(f)
+        assert (all(c in d_path for l_c in index.hoisting.values() for c in l_c))
+        assert ([d_path[c] for c in index.hoisting['a']] == ['body'])
+
+    def test_entity_appeared(self):
+        # `b` is provided now: the index of the unchanged function is computed again
+        src = 'void foo(){ _ = a + b; }'
+        cache = IndexCache()
+        _, index = self.index(cache, src, {'a'})
+        _, index = self.index(cache, src, {'a', 'b'})
+        assert (cache.misses == 2 and cache.n_reused == 1)
+        assert (index.uses.keys() == {'a', 'b'})
+
+    def test_only_changed_parsed(self):
+        cache = IndexCache()
+        cache.parse(self.parser, 'typedef int T;\nvoid f(){ T x = a; }\nvoid g(){ _ = b; }\n', 'foo.irp.c')
+        ast = cache.parse(self.parser, 'typedef int T;\nvoid f(){ T x = a; }\nvoid g(){ _ = c; }\n', 'foo.irp.c')
+        assert (cache.n_parsed == 4 and cache.n_reused == 2)
+        assert ([getattr(node, 'decl', node).name for node in ast.ext] == ['T', 'f', 'g'])
+        assert ('c' in identifiers(ast.ext[2]))
+
+    def test_deep(self):
+        # No recursion: deeper than the interpreter stack
+        src = 'void foo(){ _ = ' + '(' * 2000 + 'a' + ')' * 2000 + '; ' + '{' * 2000 + '_ = b;' + '}' * 2000 + ' }'
+        with tempfile.TemporaryDirectory() as directory:
+            cache = IndexCache(directory)
+            f, index = self.index(cache, src, {'a', 'b'})
+            cache.save()
+            assert (len(os.listdir(directory)) == 1)
+        assert (identifiers(f) >= {'a', 'b'})
+        assert (len(compound_paths(f)) == 2001)
+
+if __name__ == '__main__':
+    unittest.main()
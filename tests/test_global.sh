@@ -0,0 +1,48 @@
+#!/bin/bash -ex
+# Also when run as `bash tests/test_global.sh`
+set -ex
+
+runing_test () {
+        pathTest=./examples/$1.irp.c
+        pathC=tests/$1.c
+        pathG=./tests/gold.$1.c
+        pathE=tests/$1.exe
+        pathO=tests/$1.out
+
+        ./irpc.py $pathTest > $pathC
+        diff -wbB $pathG $pathC
+        gcc $pathC -o $pathE -lm
+        ./$pathE > $pathO
+        if [ -f tests/gold.$1.out ]; then
+                diff tests/gold.$1.out $pathO
+        fi
+  }
+
+# tests/gold.<example>.<option>...c: the code generated for examples/<example>.irp.c with --<option>...
+# The program prints tests/gold.<example>.out, whatever the options
+runing_test_options () {
+        name=$(basename $1 .c)
+        name=${name#gold.}
+        example=${name%%.*}
+        options=$(echo ${name#$example} | sed 's/\./ --/g')
+        pathC=tests/$name.c
+        pathE=tests/$name.exe
+
+        ./irpc.py ./examples/$example.irp.c $options > $pathC
+        diff -wbB $1 $pathC
+        gcc $pathC -o $pathE -lm
+        if [ -f tests/gold.$example.out ]; then
+                IRP_PROFILE=tests/$name.json ./$pathE | diff tests/gold.$example.out -
+        fi
+  }
+
+
+runing_test "simple"
+runing_test "newton"
+runing_test "loop_touch"
+runing_test "chunks"
+runing_test "constructs"
+runing_test "multi"
+for gold in tests/gold.*.*.c; do
+        runing_test_options $gold
+done
@@ -0,0 +1,84 @@
+from irpc import graph
+
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+
+CYCLE = '''\
+void provide_a(){
+    int a;
+    a = b + 1;
+}
+
+void provide_b(){
+    int b;
+    b = a + 1;
+}
+
+void provide_c(){
+    int c;
+    c = b;
+}
+
+int main(){
+    return c;
+}
+'''
+
+class TestGraph(unittest.TestCase):
+
+    # d -> b -> a, d -> c -> a
+    d_parent = {'a': set(), 'b': {'a'}, 'c': {'a'}, 'd': {'b', 'c'}}
+
+    def irpc(self, *args):
+        return subprocess.run([sys.executable, 'irpc.py', 'graph', *args], capture_output=True, text=True)
+
+    def test_statistics(self):
+        d = graph.statistics(self.d_parent)
+        assert (d['depth'] == 3 and d['width'] == 2)
+        assert (d['roots'] == 1 and d['leaves'] == 1 and d['edges'] == 4)
+        assert (d['max_fan_in'] == (2, 'd') and d['max_fan_out'] == (2, 'a'))
+        assert (d['cycles'] == [])
+
+    def test_critical_path(self):
+        d = graph.statistics(self.d_parent, {'a': 1., 'b': 5., 'c': 2., 'd': 1.})
+        assert (d['critical_path'] == ['a', 'b', 'd'])
+        assert (d['span'] == 7. and d['work'] == 9.)
+
+    def test_cycle(self):
+        # The cycle is one node for the depth
+        d_parent = dict(self.d_parent, a={'d'}, e={'a'})
+        d = graph.statistics(d_parent)
+        assert (d['cycles'] == [['a', 'b', 'c', 'd']])
+        assert (d['depth'] == 2)
+
+    def test_export(self):
+        with tempfile.TemporaryDirectory() as directory:
+            dot, path_json = os.path.join(directory, 'g.dot'), os.path.join(directory, 'g.json')
+            process = self.irpc('examples/unreachable.irp.c', '--dot', dot, '--json', path_json)
+            assert (process.returncode == 0), process.stderr
+            with open(dot) as f:
+                text = f.read()
+            with open(path_json) as f:
+                d = json.load(f)
+        assert ('"unused" [label="unused", style=dashed];' in text)
+        assert ('"n" -> "total";' in text and '"values" -> "sum";' in text)
+        d_node = {node['id']: node for node in d['nodes']}
+        assert (d_node['sum']['parents'] == ['n', 'values'])
+        assert (not d_node['unused']['reachable'] and d_node['total']['reachable'])
+        assert (d['statistics']['depth'] == 3 and d['statistics']['providers'] == 5)
+
+    def test_export_cycle(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'cycle.irp.c')
+            with open(path, 'w') as f:
+                f.write(CYCLE)
+            process = self.irpc(path)
+        assert (process.returncode == 1)
+        assert ('    a, b\n' in process.stdout)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,120 @@
+from irpc.instrument import read_profile
+from irpc.pipeline import generate_file
+from pycparser import c_parser
+
+import json
+import os
+import shutil
+import subprocess
+import tempfile
+import unittest
+
+HEADERS = '#include <stdbool.h>\n#include <stdio.h>\n'
+
+# `a` and `b` read at each iteration: hot guards
+HOT = '''
+void provide_a(){
+    int a;
+    a = 3;
+}
+
+void provide_b(){
+    int b;
+    b = a + 1;
+}
+
+int main(){
+    long total = 0;
+    for (int i = 0; i < 5000; i++)
+        total += a * i + b;
+    printf("total = %ld\\n", total);
+    return 0;
+}
+'''
+
+# `sq` computed again at each iteration: small and hot
+SMALL = '''
+void provide_n(){
+    int n;
+    n = 0;
+}
+
+void provide_sq(){
+    long sq;
+    sq = (long) n * n;
+}
+
+int main(){
+    long total = 0;
+    for (int i = 0; i < 5000; i++) {
+        n = i;
+        touch_n();
+        total += sq;
+    }
+    printf("total = %ld\\n", total);
+    return 0;
+}
+'''
+
+def stat(invocations, hits, exclusive_ns):
+    return {'invocations': invocations, 'misses': invocations, 'hits': hits, 'recomputes': invocations - 1,
+            'touches': 0, 'recomputes_caused': 0, 'inclusive_ns': exclusive_ns, 'exclusive_ns': exclusive_ns}
+
+class TestInline(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+
+    def generate(self, source, d_profile=None, **options):
+        # Through the JSON file, like `irpc.py --profile`
+        if d_profile is not None:
+            path = os.path.join(self.directory.name, 'irp_profile.json')
+            with open(path, 'w') as f:
+                json.dump(d_profile, f)
+            options['profile'] = read_profile(path)
+        text, _ = generate_file(HEADERS, c_parser.CParser().parse(source), **options)
+        return text
+
+    def run_c(self, text, **env):
+        path = os.path.join(self.directory.name, 'a.c')
+        exe = os.path.join(self.directory.name, 'a.out')
+        with open(path, 'w') as f:
+            f.write(text)
+        subprocess.run(['gcc', path, '-o', exe], check=True)
+        return subprocess.run([exe], check=True, capture_output=True, text=True, env=dict(os.environ, **env)).stdout
+
+    def test_hot_guards(self):
+        # The guards are inserted once, before the loop
+        text = self.generate(HOT, {'a': stat(1, 5000, 50.), 'b': stat(1, 4999, 2000.)})
+        main = text[text.index('int main()'):]
+        assert (main.count('if (!a_provided)') == 1 and main.count('if (!b_provided)') == 1)
+        assert (main.index('if (!a_provided)') < main.index('for (') and
+                main.index('if (!b_provided)') < main.index('for ('))
+        # Without the profile, at each use
+        text = self.generate(HOT)
+        assert ('if (!a_provided)' in text[text.index('for ('):])
+
+    def test_inline(self):
+        text = self.generate(SMALL, {'n': stat(1, 9999, 1500.), 'sq': stat(5000, 0, 220000.)})
+        assert ('provide_sq' not in text)
+        assert ('void provide_n()' in text)
+        guard = text[text.index('if (!sq_provided)'):text.index('total += sq;')]
+        assert ('sq = ((long) n) * n;' in guard)
+
+    def test_not_small(self):
+        # 100 us each time
+        text = self.generate(SMALL, {'n': stat(1, 9999, 1500.), 'sq': stat(5000, 0, 5000 * 1e5)})
+        assert ('provide_sq();' in text)
+
+    @unittest.skipUnless(shutil.which('gcc'), 'needs gcc')
+    def test_instrument(self):
+        # The profile of an --instrument run, then the same output with it
+        path = os.path.join(self.directory.name, 'irp_profile.json')
+        for source in (HOT, SMALL):
+            output = self.run_c(self.generate(source, instrument=True), IRP_PROFILE=path)
+            d_profile = read_profile(path)
+            assert (self.run_c(self.generate(source, d_profile)) == output)
+
+if __name__ == '__main__':
+    unittest.main()
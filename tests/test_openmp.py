@@ -0,0 +1,51 @@
+from irpc.frontend import Preprocessor, remove_headers
+from irpc.pipeline import generate_file
+from pycparser import c_parser, plyparser
+
+import glob
+import re
+import unittest
+
+_re_task = re.compile(r'#pragma omp task (?:depend\(in: ([\w, ]+)\) )?depend\(out: ([\w, ]+)\)')
+
+class TestOpenMP(unittest.TestCase):
+
+    def tasks(self, path):
+        # The groups of tasks of the generated code, [[(in, out)]]
+        headers, text = remove_headers(path)
+        try:
+            ast = c_parser.CParser().parse(text)
+        except plyparser.ParseError:
+            # Macros, see `irpc.py --cpp`
+            headers, ast = Preprocessor().parse(path)
+        text, _ = generate_file(headers, ast, openmp=True)
+        l_group = [[]]
+        for line in text.splitlines():
+            match = _re_task.search(line)
+            if match:
+                l_in, l_out = (set(group.split(', ')) if group else set() for group in match.groups())
+                l_group[-1].append((l_in, l_out))
+            elif '#pragma omp taskwait' in line:
+                l_group.append([])
+        return [group for group in l_group if group]
+
+    def test_newton(self):
+        l_group = self.tasks('examples/newton.irp.c')
+        assert (l_group[1] == [(set(), {'x'}), ({'x'}, {'x_next'})])
+
+    def test_in_after_out(self):
+        # In each group, the task producing an entity is created before the ones reading it
+        for path in glob.glob('examples/*.irp.c'):
+            try:
+                l_group = self.tasks(path)
+            except ValueError:
+                # Not thread safe (the chunks)
+                continue
+            for group in l_group:
+                s_out = set()
+                for s_in, s_task_out in group:
+                    assert (s_in <= s_out), f'{path}: {s_in - s_out} read before written'
+                    s_out |= s_task_out
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,83 @@
+from irpc.frontend import remove_headers
+from irpc.pipeline import generate_file
+from pycparser import c_parser
+
+import os
+import shutil
+import subprocess
+import tempfile
+import unittest
+
+SOURCE = '''\
+#include <stdio.h>
+
+void provide_n(){
+    int n;
+    n = 5;
+}
+
+void provide_square(){
+    #pragma irp persistent("input.txt")
+    int square;
+    printf("computing\\n");
+    square = n * n;
+}
+
+int main(){
+    printf("square = %d\\n", square);
+    return 0;
+}
+'''
+
+@unittest.skipUnless(shutil.which('gcc'), 'needs gcc')
+class TestPersistent(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.cache = os.path.join(self.directory.name, 'cache')
+        path = os.path.join(self.directory.name, 'square.irp.c')
+        with open(path, 'w') as f:
+            f.write(SOURCE)
+        headers, text = remove_headers(path)
+        text, _ = generate_file(headers, c_parser.CParser().parse(text))
+        with open(os.path.join(self.directory.name, 'square.c'), 'w') as f:
+            f.write(text)
+        self.exe = os.path.join(self.directory.name, 'a.out')
+        subprocess.run(['gcc', os.path.join(self.directory.name, 'square.c'), '-o', self.exe], check=True)
+        self.write_input('1')
+
+    def write_input(self, text):
+        with open(os.path.join(self.directory.name, 'input.txt'), 'w') as f:
+            f.write(text)
+
+    def run_exe(self, **env):
+        env = dict(os.environ, IRP_CACHE_DIR=self.cache, **env)
+        return subprocess.run([self.exe], cwd=self.directory.name, env=env, check=True,
+                              capture_output=True, text=True).stdout
+
+    def results(self):
+        return [name for name in os.listdir(self.cache) if name.endswith('.irp')]
+
+    def test_reused(self):
+        assert (self.run_exe() == 'computing\nsquare = 25\n')
+        assert (len(self.results()) == 1)
+        assert (self.run_exe() == 'square = 25\n')
+
+    def test_input_changed(self):
+        self.run_exe()
+        self.write_input('22')
+        assert (self.run_exe() == 'computing\nsquare = 25\n')
+        assert (len(self.results()) == 2)
+
+    def test_evict(self):
+        # Only the results are removed
+        os.makedirs(self.cache)
+        with open(os.path.join(self.cache, 'other'), 'w') as f:
+            f.write('kept')
+        assert (self.run_exe(IRP_CACHE_SIZE='0') == 'computing\nsquare = 25\n')
+        assert (os.listdir(self.cache) == ['other'])
+        assert (self.run_exe() == 'computing\nsquare = 25\n')
+
+if __name__ == '__main__':
+    unittest.main()
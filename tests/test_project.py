@@ -0,0 +1,74 @@
+from irpc.project import generate_project, HEADER
+
+import os
+import shutil
+import subprocess
+import tempfile
+import unittest
+
+PROVIDERS = '''\
+void provide_n(){
+    int n;
+    n = 4;
+}
+
+void provide_total(){
+    int total;
+    total = 0;
+    for (int i = 0; i < n; i++)
+        total += i;
+}
+'''
+
+MAIN = '''\
+#include <stdio.h>
+
+int main(){
+    printf("total = %d\\n", total);
+    n = 6;
+    touch_n();
+    printf("total = %d\\n", total);
+    return 0;
+}
+'''
+
+class TestProject(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.src = os.path.join(self.directory.name, 'src')
+        self.out = os.path.join(self.directory.name, 'out')
+        os.makedirs(self.src)
+        for name, text in [('providers.irp.c', PROVIDERS), ('main.irp.c', MAIN)]:
+            with open(os.path.join(self.src, name), 'w') as f:
+                f.write(text)
+        self.l_path, _ = generate_project([self.src], self.out, max_workers=2)
+
+    def read(self, name):
+        with open(os.path.join(self.out, name)) as f:
+            return f.read()
+
+    def test_files(self):
+        assert (sorted(os.path.basename(path) for path in self.l_path) == ['main.c', 'providers.c'])
+        header = self.read(HEADER)
+        for line in ['extern int n;', 'extern bool n_provided;', 'extern int total;', 'void touch_n();']:
+            assert (line in header), line
+
+    def test_definitions(self):
+        # An entity, its flag and its touch are defined in the file of its provider only
+        providers, main = self.read('providers.c'), self.read('main.c')
+        assert (f'#include "{HEADER}"' in providers and f'#include "{HEADER}"' in main)
+        assert ('\nint n;' in providers and 'bool n_provided' in providers and 'void touch_n()' in providers)
+        assert ('\nint n;' not in main and 'void touch_n()\n' not in main)
+        assert ('provide_total();' in main)
+
+    @unittest.skipUnless(shutil.which('gcc'), 'needs gcc')
+    def test_run(self):
+        exe = os.path.join(self.directory.name, 'a.out')
+        subprocess.run(['gcc', *self.l_path, '-I', self.out, '-o', exe], check=True)
+        output = subprocess.run([exe], check=True, capture_output=True, text=True).stdout
+        assert (output == 'total = 6\ntotal = 15\n')
+
+if __name__ == '__main__':
+    unittest.main()
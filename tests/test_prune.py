@@ -0,0 +1,33 @@
+from irpc.pipeline import generate_file
+from irpc.project import generate_project
+
+import os
+import tempfile
+import unittest
+
+class TestPrune(unittest.TestCase):
+    from pycparser import c_parser
+    parser = c_parser.CParser()
+
+    src = ('void provide_a(){ int a; a = 42; }\n'
+           'void provide_b(){ int b; b = a; }\n'
+           'void provide_unused(){ int unused; unused = 1; }\n'
+           'void show(){ printf("%d", b); }\n')
+
+    def test_function_use(self):
+        # `b` is only used by a function called by main: it and its parents are needed
+        text, world = generate_file('', self.parser.parse(self.src + 'int main(){ show(); return 0; }'), prune=True)
+        assert ({p.ast.decl.name for p in world.s_provider} == {'provide_a', 'provide_b'})
+        assert ('int b;' in text and 'int a;' in text and 'unused' not in text)
+
+    def test_project_function_use(self):
+        with tempfile.TemporaryDirectory() as directory:
+            with open(os.path.join(directory, 'show.irp.c'), 'w') as f:
+                f.write(self.src)
+            with open(os.path.join(directory, 'main.irp.c'), 'w') as f:
+                f.write('void show();\nint main(){ show(); return 0; }\n')
+            _, n_pruned = generate_project([directory], os.path.join(directory, 'out'), max_workers=1, prune=True)
+            assert (n_pruned == 1)
+
+if __name__ == '__main__':
+    unittest.main()
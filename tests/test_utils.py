@@ -0,0 +1,88 @@
+from irpc.frontend import remove_headers
+from irpc.pipeline import generate_file
+from irpc.utils import insert_batch, write_ast
+from pycparser import c_generator, c_parser, plyparser
+from pycparser.c_ast import ID, If, FuncDef
+
+import glob
+import io
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+
+SOURCE = '''
+void provide_a(){ int a; a = 1; }
+void provide_b(){ int b; b = 2; }
+int main(){ int x = 0; f(b, a); x = b; return x; }
+'''
+
+class TestInsertBatch(unittest.TestCase):
+
+    def test_order(self):
+        a, b, c, x, y, z, w, front = (ID(name) for name in 'abcxyzwf')
+        l_node = [a, b, c]
+        l = l_node
+        insert_batch(l_node, d_before={b: [x, y]}, d_after={b: [z], c: [w]}, l_front=[front])
+        assert (l is l_node)
+        assert ([node.name for node in l_node] == ['f', 'a', 'x', 'y', 'b', 'z', 'c', 'w'])
+
+    def test_identity(self):
+        # The nodes are keyed by identity: equal nodes get their own insertions
+        a1, a2, x = ID('a'), ID('a'), ID('x')
+        l_node = [a1, a2]
+        insert_batch(l_node, d_after={a2: [x]})
+        assert (l_node == [a1, a2, x])
+
+    def test_empty(self):
+        l_node = [ID('a')]
+        insert_batch(l_node)
+        assert ([node.name for node in l_node] == ['a'])
+
+    def test_guards(self):
+        # Each statement gets the guards of its entities just before it
+        text, _ = generate_file('', c_parser.CParser().parse(SOURCE))
+        text = 'typedef _Bool bool;\n' + ''.join(line for line in text.splitlines(True) if not line.startswith('#'))
+        main = [node for node in c_parser.CParser().parse(text).ext
+                if isinstance(node, FuncDef) and node.decl.name == 'main'][0]
+        l_item = main.body.block_items
+        l_guard = [item.cond.expr.name for item in l_item if isinstance(item, If)]
+        assert (sorted(l_guard[:2]) == ['a_provided', 'b_provided'] and l_guard[2:] == ['b_provided'])
+        assert ([type(item).__name__ for item in l_item] ==
+                ['Decl', 'If', 'If', 'FuncCall', 'If', 'Assignment', 'Return'])
+
+class TestWriteAst(unittest.TestCase):
+
+    def test_same_as_visit(self):
+        for path in glob.glob('examples/*.irp.c'):
+            _, text = remove_headers(path)
+            try:
+                ast = c_parser.CParser().parse(text)
+            except plyparser.ParseError:
+                # Macros, see `irpc.py --cpp`
+                continue
+            f = io.StringIO()
+            write_ast(f, ast)
+            assert (f.getvalue() == c_generator.CGenerator().visit(ast)), path
+
+    def test_output(self):
+        # Same code as on the standard output, and the file is only replaced once complete
+        with tempfile.TemporaryDirectory() as directory:
+            output = os.path.join(directory, 'newton.c')
+            irpc = [sys.executable, 'irpc.py']
+            stdout = subprocess.run(irpc + ['examples/newton.irp.c'], check=True, capture_output=True, text=True).stdout
+            subprocess.run(irpc + ['examples/newton.irp.c', '-o', output], check=True)
+            with open(output) as f:
+                assert (f.read() == stdout)
+
+            path = os.path.join(directory, 'bad.irp.c')
+            with open(path, 'w') as f:
+                f.write('void provide_a(){ int a; a = ; }\n')
+            assert (subprocess.run(irpc + [path, '-o', output], capture_output=True).returncode != 0)
+            with open(output) as f:
+                assert (f.read() == stdout)
+            assert (sorted(os.listdir(directory)) == ['bad.irp.c', 'newton.c'])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,78 @@
+from irpc.frontend import remove_headers
+from irpc.pipeline import generate_file
+from irpc.watch import Watcher
+from pycparser import c_parser
+
+import os
+import socket
+import tempfile
+import unittest
+
+class TestWatch(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.path = os.path.join(self.directory.name, 'unreachable.irp.c')
+        self.out = os.path.join(self.directory.name, 'out')
+        os.makedirs(self.out)
+        with open('examples/unreachable.irp.c') as f:
+            self.write(f.read())
+        self.watcher = Watcher([self.path], output_dir=self.out)
+
+    def write(self, text):
+        with open(self.path, 'w') as f:
+            f.write(text)
+        # Seen as modified, whatever the resolution of the clock
+        st = os.stat(self.path)
+        os.utime(self.path, ns=(st.st_atime_ns, st.st_mtime_ns + 10 ** 9))
+
+    def expected(self):
+        headers, text = remove_headers(self.path)
+        text, _ = generate_file(headers, c_parser.CParser().parse(text))
+        return text
+
+    def written(self):
+        with open(os.path.join(self.out, 'unreachable.c')) as f:
+            return f.read()
+
+    def ask(self, path):
+        # The answer of the watcher to a client asking for `path`
+        client, server = socket.socketpair()
+        with client:
+            client.sendall(f'{path}\n'.encode())
+            with server:
+                self.watcher.answer(server)
+            return b''.join(iter(lambda: client.recv(4096), b'')).decode()
+
+    def test_poll(self):
+        assert (self.watcher.poll() == [self.path])
+        assert (self.watcher.d_output[self.path] == self.expected() == self.written())
+        assert (self.watcher.poll() == [])
+
+    def test_edit(self):
+        # Only the declaration edited is parsed again
+        self.watcher.poll()
+        with open(self.path) as f:
+            text = f.read()
+        n_parsed = self.watcher.cache.n_parsed
+        self.write(text.replace('n = 4;', 'n = 5;'))
+        assert (self.watcher.poll() == [self.path])
+        assert (self.watcher.cache.n_parsed == n_parsed + 1)
+        assert ('n = 5;' in self.written())
+        assert (self.watcher.d_output[self.path] == self.expected())
+
+    def test_error(self):
+        self.write('void provide_a(){ int a; a = ; }\n')
+        self.watcher.poll()
+        assert (self.written().startswith('#error "'))
+
+    def test_answer(self):
+        assert (self.ask(self.path) == self.expected())
+
+    def test_not_watched(self):
+        path = os.path.join(self.directory.name, 'other.irp.c')
+        assert (self.ask(path) == f'#error "{path}: not watched"\n')
+
+if __name__ == '__main__':
+    unittest.main()